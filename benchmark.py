@@ -0,0 +1,429 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark for download-manager.py.
+
+Builds a synthetic archive (catalog, Builds and Cache trees) in a temporary folder,
+serves manifests from a local stand-in for <project>.secure.dyn.riotcdn.net, replaces
+rman-dl with a scripted stub of controllable latency, and then times each stage:
+startup and catalog load, index build and search filtering, show_stats walks,
+manifest prefetch, catalog updates, manifest parsing and planning, the file index, and the download loop.
+
+    python benchmark.py
+    python benchmark.py --entries 50000 --builds 200 --files 2000 --json results.json
+    python benchmark.py --baseline results.json
+
+With --baseline, any stage whose median is more than --tolerance slower than in the
+baseline file is reported and the exit code is 1.
+"""
+import argparse, contextlib, hashlib, http.server, importlib.util, io, json, os, random, shutil, statistics, struct, sys, tempfile, threading, time
+from pathlib import Path
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+HERE = Path(__file__).resolve().parent
+PROJECTS = ["lol", "valorant", "bacon", "lion"]
+PLATFORMS = ["windows", "macos", "neutral", "android", "ios"]
+REALMS = ["NA1", "EUW1", "EUN1", "KR", "PBE1", "BR1", "JP1", "LA1", "LA2", "OC1", "RU", "TR1"]
+LANGUAGES = ["en_US", "fr_FR", "de_DE", "es_ES", "ja_JP", "ko_KR", "pl_PL", "pt_BR", "ru_RU", "zh_CN"]
+
+# ---------- Synthetic Data ----------
+def make_entry(i, entries, rng):
+    major, minor = 10 + i * 6 // max(entries, 1), i % 24 + 1
+    return {
+        "version": f"{major}.{minor}.{rng.randint(100, 999)}.{rng.randint(1000, 9999)}",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(1500000000 + i * 3600)),
+        "size": rng.randint(10, 60000) * 1024 * 1024,
+        "platform": rng.choice(PLATFORMS),
+        "realms": rng.sample(REALMS, rng.randint(0, 4)),
+    }
+
+def make_catalog(entries, rng):
+    catalog = {}
+    for project in PROJECTS:
+        catalog[project] = {f"{rng.getrandbits(64):016X}": make_entry(i, entries, rng) for i in range(entries)}
+    return catalog
+
+_SCALARS = {"u8": "<B", "u16": "<H", "u32": "<I", "u64": "<Q"}
+
+def build_flatbuffer(root):
+    """
+    Serialize nested tables into a flatbuffer. A table is a list of (kind, value) fields,
+    None for absent fields. Kinds are the scalar names above, "str", "u64vec" and "tables".
+    """
+    buf = bytearray(4)
+
+    def table(fields):
+        layout, size = [], 4
+        for f in fields:
+            if f is None:
+                layout.append(0)
+                continue
+            layout.append(size)
+            size += struct.calcsize(_SCALARS[f[0]]) if f[0] in _SCALARS else 4
+        vtable_pos = len(buf)
+        buf.extend(struct.pack("<HH", 4 + 2 * len(fields), size))
+        buf.extend(b"".join(struct.pack("<H", o) for o in layout))
+        pos = len(buf)
+        buf.extend(struct.pack("<i", pos - vtable_pos) + bytes(size - 4))
+        refs = []
+        for f, off in zip(fields, layout):
+            if f is None:
+                continue
+            kind, value = f
+            if kind in _SCALARS:
+                struct.pack_into(_SCALARS[kind], buf, pos + off, value)
+            else:
+                refs.append((pos + off, kind, value))
+        for at, kind, value in refs:
+            struct.pack_into("<I", buf, at, len(buf) - at)
+            if kind == "str":
+                raw = value.encode("utf-8")
+                buf.extend(struct.pack("<I", len(raw)) + raw + b"\0")
+            elif kind == "u64vec":
+                buf.extend(struct.pack(f"<I{len(value)}Q", len(value), *value))
+            else:
+                vector = len(buf)
+                buf.extend(struct.pack("<I", len(value)) + bytes(4 * len(value)))
+                for k, sub in enumerate(value):
+                    slot = vector + 4 + 4 * k
+                    struct.pack_into("<I", buf, slot, table(sub) - slot)
+        return pos
+
+    struct.pack_into("<I", buf, 0, table(root))
+    return bytes(buf)
+
+def chunk_id(data):
+    # HASH_SHA256 chunk IDs: the first 8 bytes of the sha256 of the uncompressed data
+    return struct.unpack("<Q", hashlib.sha256(data).digest()[:8])[0]
+
+def make_manifest(manifest_id, generation, files, rng):
+    """
+    A synthetic RMAN manifest. One file in ten changes between consecutive generations,
+    like consecutive patches of the same build.
+    """
+    chunks, file_tables = {}, []
+    for j in range(files):
+        gen = generation if j % 10 == 0 else 0
+        data = f"{j}:{gen}".encode() * 64
+        cid = chunk_id(data)
+        chunks[cid] = (rng.randint(200, 4000), len(data))
+        mask = 1 << (j % len(LANGUAGES)) if j % 3 == 0 else 0
+        file_tables.append([
+            ("u64", j + 1), ("u64", 1 + j % 8), ("u32", len(data)), ("str", f"file{j:06d}.bin"), ("u64", mask),
+            None, None, ("u64vec", [cid]), None, ("str", ""), None, ("u8", 0), ("u8", 0),
+        ])
+    ids = list(chunks)
+    bundles = []
+    for b in range(0, len(ids), 64):
+        bundles.append([("u64", rng.getrandbits(63)), ("tables", [
+            [("u64", cid), ("u32", chunks[cid][0]), ("u32", chunks[cid][1])] for cid in ids[b:b + 64]
+        ])])
+    dirs = [[("u64", 0), ("u64", 0), ("str", "")]]
+    dirs += [[("u64", d), ("u64", 0), ("str", f"DATA{d}")] for d in range(1, 9)]
+    body = build_flatbuffer([
+        ("tables", bundles),
+        ("tables", [[("u8", i + 1), ("str", name)] for i, name in enumerate(LANGUAGES)]),
+        ("tables", file_tables),
+        ("tables", dirs),
+        None,
+        ("tables", [[("u16", 0), ("u8", 2), ("u32", 0), ("u32", 0), ("u32", 0)]]),
+    ])
+    payload = zstandard.ZstdCompressor().compress(body) if zstandard else body
+    return struct.pack("<4sBBHIIQI", b"RMAN", 2, 0, 0, 28, len(payload), int(manifest_id, 16), len(body)) + payload
+
+def make_builds_tree(root, builds, files, rng):
+    proj_dir = root / "Builds" / "lol"
+    for b in range(builds):
+        build = proj_dir / f"lol-bench.{b}-windows-{b:016X}"
+        for j in range(files):
+            path = build / f"DATA{j % 8}" / f"file{j:06d}.bin"
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(b"\0" * rng.randint(0, 4096))
+
+def make_cache_tree(root, manifests):
+    for project in PROJECTS:
+        bundles = root / "Cache" / project / "bundles"
+        bundles.mkdir(parents=True, exist_ok=True)
+        (bundles / f"{project}-cache.bundle").write_bytes(b"\0" * 1024 * 1024)
+    releases = root / "Cache" / "lol" / "releases"
+    releases.mkdir(parents=True, exist_ok=True)
+    for mid, data in manifests.items():
+        (releases / f"{mid}.manifest").write_bytes(data)
+
+# ---------- Stand-ins ----------
+class FakeCDN:
+    """
+    Local HTTP server answering /<project>/channels/public/releases/<id>.manifest,
+    with a fixed latency per request and Range support. Paths in `files` (such as
+    /catalog.json) are served whole, with an ETag and 304 answers to If-None-Match.
+    """
+    def __init__(self, manifests, latency, files=None):
+        self.manifests = manifests
+        self.files = files if files is not None else {}
+        self.latency = latency
+        self.requests = 0
+        cdn = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                cdn.requests += 1
+                time.sleep(cdn.latency)
+                if self.path in cdn.files:
+                    data = cdn.files[self.path]
+                    etag = '"' + hashlib.sha1(data).hexdigest() + '"'
+                    if self.headers.get("If-None-Match") == etag:
+                        self.send_response(304)
+                        self.send_header("ETag", etag)
+                        self.end_headers()
+                        return
+                    self.send_response(200)
+                    self.send_header("ETag", etag)
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                    return
+                data = cdn.manifests.get(self.path.rsplit("/", 1)[-1].replace(".manifest", ""))
+                if data is None:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                start = 0
+                if self.headers.get("Range"):
+                    start = int(self.headers["Range"].split("=")[1].split("-")[0])
+                    self.send_response(206)
+                    self.send_header("Content-Range", f"bytes {start}-{len(data) - 1}/{len(data)}")
+                else:
+                    self.send_response(200)
+                self.send_header("Content-Length", str(len(data) - start))
+                self.end_headers()
+                self.wfile.write(data[start:])
+
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.root = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.url = self.root + "/{project}/channels/public"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+
+RMAN_STUB = r'''
+import os, sys, time
+args = sys.argv[1:]
+time.sleep(float(os.environ.get("BENCH_RMAN_LATENCY", "0")))
+outdir = args[-1]
+os.makedirs(outdir, exist_ok=True)
+for j in range(int(os.environ.get("BENCH_RMAN_FILES", "20"))):
+    with open(os.path.join(outdir, f"file{j:06d}.bin"), "wb") as f:
+        f.write(b"\0" * 1024)
+if "--cache" in args:
+    with open(args[args.index("--cache") + 1], "ab") as f:
+        f.write(b"\0" * 256 * 1024)
+print("done")
+'''
+
+def make_rman_stub(root):
+    script = root / "Tools" / "rman-dl-stub.py"
+    script.parent.mkdir(parents=True, exist_ok=True)
+    script.write_text(RMAN_STUB, encoding="utf-8")
+    if os.name == "nt":
+        wrapper = root / "Tools" / "rman-dl-stub.cmd"
+        wrapper.write_text(f'@"{sys.executable}" "{script}" %*\r\n', encoding="utf-8")
+    else:
+        wrapper = root / "Tools" / "rman-dl-stub"
+        wrapper.write_text(f"#!{sys.executable}\n" + RMAN_STUB, encoding="utf-8")
+        wrapper.chmod(0o755)
+    return wrapper
+
+def load_download_manager():
+    spec = importlib.util.spec_from_file_location("download_manager", HERE / "download-manager.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+# ---------- Timing ----------
+@contextlib.contextmanager
+def quiet():
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+def timed(results, name, fn, repeat=1, setup=None):
+    runs = []
+    for _ in range(repeat):
+        if setup:
+            with quiet():
+                setup()
+        with quiet():
+            start = time.perf_counter()
+            fn()
+            runs.append(time.perf_counter() - start)
+    results[name] = {"runs": len(runs), "min_ms": min(runs) * 1000, "median_ms": statistics.median(runs) * 1000}
+    print(f"  {name:<40} {results[name]['median_ms']:>11.2f} ms   (min {results[name]['min_ms']:.2f} ms, {len(runs)} runs)")
+
+def run(args):
+    rng = random.Random(args.seed)
+    tmp = Path(tempfile.mkdtemp(prefix="dm-bench-"))
+    results = {}
+    cdn = None
+    try:
+        print(f"[Bench] Generating synthetic archive in {tmp}")
+        catalog = make_catalog(args.entries, rng)
+        (tmp / "catalog.json").write_text(json.dumps(catalog), encoding="utf-8")
+        lol_ids = list(catalog["lol"])
+        served = {mid: make_manifest(mid, g, args.manifest_files, rng) for g, mid in enumerate(lol_ids[:args.manifests])}
+        cached = {mid: make_manifest(mid, g, args.manifest_files, rng)
+                  for g, mid in enumerate(lol_ids[args.manifests:args.manifests + args.jobs * 2])}
+        make_builds_tree(tmp, args.builds, args.files, rng)
+        make_cache_tree(tmp, cached)
+        cdn = FakeCDN(served, args.latency_ms / 1000)
+        os.environ.update({
+            "DM_ROOT": str(tmp),
+            "DM_CDN_URL": cdn.url,
+            "DM_RMAN_DL": str(make_rman_stub(tmp)),
+            "BENCH_RMAN_LATENCY": str(args.rman_latency_ms / 1000),
+            "BENCH_RMAN_FILES": str(args.rman_files),
+        })
+        print(f"[Bench] {args.entries} entries x {len(PROJECTS)} projects, {args.builds} builds x {args.files} files, "
+              f"{args.manifests} manifests on the CDN, zstandard {'available' if zstandard else 'missing'}\n")
+
+        dm = {}
+        timed(results, "startup (split catalog.json)", lambda: dm.setdefault("m", load_download_manager()))
+        timed(results, "startup (shards ready)", load_download_manager, args.repeat)
+        dm = dm["m"]
+
+        timed(results, "catalog shard load (lol)", lambda: dm.LazyCatalog()["lol"], args.repeat)
+        entries = dm.CATALOG["lol"]
+        timed(results, "index build (lol)", lambda: dm.CatalogIndex(entries), args.repeat)
+        index = dm.get_catalog_index("lol")
+        version = entries[lol_ids[0]]["version"].split(".")[0]
+        timed(results, "search: no filter", lambda: index.query(), args.repeat)
+        timed(results, "search: version regex", lambda: index.query(rf"^{version}\.1"), args.repeat)
+        timed(results, "search: realm + platform", lambda: index.query("", "NA1", "windows"), args.repeat)
+        timed(results, "search: regex + realm + platform", lambda: index.query(r"\.1\d\.", "NA1", "windows"), args.repeat)
+        timed(results, "trigram index build (lol)", lambda: dm.TrigramIndex(entries), args.repeat)
+        typed = entries[lol_ids[0]]["version"]
+
+        def type_search():
+            # One query per keystroke, the way the text search narrows while typing
+            index._last_text = None
+            for n in range(1, len(typed) + 1):
+                index.query(text=typed[:n])
+        timed(results, f"search: as-you-type ({len(typed)} keys)", type_search, args.repeat)
+
+        def reset_stats():
+            dm._STATS_INDEX = None
+            dm.STATS_INDEX_PATH.unlink(missing_ok=True)
+        timed(results, "show_stats (cold)", dm.show_stats, args.repeat, setup=reset_stats)
+        timed(results, "show_stats (warm)", dm.show_stats, args.repeat)
+
+        releases = tmp / "Cache" / "lol" / "releases"
+
+        def clear_served():
+            # Manifests fetched by the last run are still being indexed in the background
+            dm.FILE_INDEXER.wait()
+            for mid in served:
+                (releases / f"{mid}.manifest").unlink(missing_ok=True)
+        timed(results, f"prefetch {len(served)} manifests", lambda: dm.prefetch_manifests("lol", list(served)),
+              args.repeat, setup=clear_served)
+        dm.FILE_INDEXER.wait()
+        timed(results, "cache browser query", lambda: index.query("", None, None, dm.cached_manifest_ids("lol")), args.repeat)
+
+        cdn.files["/catalog.json"] = json.dumps(catalog).encode()
+        dm.CATALOG_URL = cdn.root + "/catalog.json"
+        with quiet():
+            dm.update_catalog()
+        timed(results, "catalog update (not modified)", dm.update_catalog, args.repeat)
+        published = [args.entries]
+
+        def publish_entries():
+            # Each run publishes a fresh delta of new lol entries
+            for _ in range(args.catalog_delta):
+                catalog["lol"][f"{rng.getrandbits(64):016X}"] = make_entry(published[0], args.entries, rng)
+                published[0] += 1
+            cdn.files["/catalog.json"] = json.dumps(catalog).encode()
+        timed(results, f"catalog update ({args.catalog_delta} new entries)", dm.update_catalog, args.repeat,
+              setup=publish_entries)
+
+        if zstandard:
+            paths = [releases / f"{mid}.manifest" for mid in cached]
+            timed(results, "parse manifest", lambda: dm.parse_manifest(paths[0].read_bytes()), args.repeat)
+            jobs = [{"label": p.stem, "manifest_path": p, "langs": "none|en_US", "file_filter": None} for p in paths]
+            timed(results, f"plan {len(jobs)} jobs", lambda: dm.plan_jobs("lol", jobs), args.repeat)
+
+            def drop_file_index():
+                db, _ = dm._FILE_INDEXES.pop("lol", (None, None))
+                if db:
+                    db.close()
+                (tmp / "Cache" / "lol" / dm.FILE_INDEX_NAME).unlink(missing_ok=True)
+            indexed = len(dm.cached_manifest_ids("lol"))
+            timed(results, f"file index sync ({indexed} manifests)", lambda: dm.sync_file_index("lol"), args.repeat,
+                  setup=drop_file_index)
+            timed(results, "file history query", lambda: dm.file_history(
+                dm.find_indexed_files("lol", r"file000010\.bin$")[0]["DATA3/file000010.bin"]), args.repeat)
+        else:
+            print("  (manifest parsing and planning skipped, zstandard is not installed)")
+
+        batch = [(mid, entries[mid]) for mid in cached]
+        timed(results, f"download loop ({len(batch)} builds, {args.jobs} jobs)",
+              lambda: dm.run_downloads("lol", batch, "d", ["none"], None, args.jobs), args.repeat,
+              setup=lambda: dm.queue_execute("DELETE FROM downloads"))
+        print(f"\n[Bench] Fake CDN served {cdn.requests} requests")
+    finally:
+        if cdn:
+            cdn.close()
+        if args.keep:
+            print(f"[Bench] Kept {tmp}")
+        else:
+            shutil.rmtree(tmp, ignore_errors=True)
+    return results
+
+def compare(results, baseline_path, tolerance):
+    baseline = json.loads(Path(baseline_path).read_text(encoding="utf-8"))
+    regressions = []
+    for name, r in results.items():
+        old = baseline.get(name)
+        if old and r["median_ms"] > old["median_ms"] * (1 + tolerance) and r["median_ms"] - old["median_ms"] > 1:
+            regressions.append(name)
+            print(f"[Regression] {name}: {old['median_ms']:.2f} ms -> {r['median_ms']:.2f} ms")
+    if not regressions:
+        print(f"[Bench] No stage is more than {tolerance:.0%} slower than {baseline_path}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--entries", type=int, default=20000, help="catalog entries per project")
+    parser.add_argument("--builds", type=int, default=50, help="extracted lol builds to generate")
+    parser.add_argument("--files", type=int, default=200, help="files per generated build")
+    parser.add_argument("--manifests", type=int, default=40, help="manifests served by the fake CDN")
+    parser.add_argument("--manifest-files", type=int, default=2000, help="files per synthetic manifest")
+    parser.add_argument("--catalog-delta", type=int, default=100, help="new entries published per catalog update run")
+    parser.add_argument("--latency-ms", type=float, default=20, help="fake CDN latency per request")
+    parser.add_argument("--rman-latency-ms", type=float, default=100, help="fake rman-dl run time")
+    parser.add_argument("--rman-files", type=int, default=20, help="files the fake rman-dl writes per build")
+    parser.add_argument("--jobs", type=int, default=4, help="parallel rman-dl jobs")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per stage")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="compare against results written earlier with --json")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown against the baseline")
+    parser.add_argument("--keep", action="store_true", help="keep the synthetic archive")
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=1), encoding="utf-8")
+    if args.baseline:
+        return 1 if compare(results, args.baseline, args.tolerance) else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
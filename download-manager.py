@@ -1,16 +1,84 @@
 #!/usr/bin/env python3
-import json, re, subprocess, requests, os, shutil, ctypes
+import json, re, subprocess, requests, os, sqlite3, mmap, shutil, ctypes, threading, time, queue, functools, argparse, sys, struct, hashlib, errno, random, contextlib, atexit, cProfile, pstats, io, zlib, heapq, array
+from collections import namedtuple, deque
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import urllib.parse
 import plistlib
 
-ROOT = Path(__file__).resolve().parent
-CATALOG = json.loads((ROOT / "catalog.json").read_text(encoding="utf-8"))
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    # Python 3.10
+    import sre_parse
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# DM_ROOT, DM_RMAN_DL and DM_CDN_URL point the script at another tree, rman-dl and CDN (used by benchmark.py)
+ROOT = Path(os.environ.get("DM_ROOT") or Path(__file__).resolve().parent)
+CATALOG_PATH = ROOT / "catalog.json"
+CATALOG_DIR = ROOT / "catalog"
+
+# Where "Update catalog" fetches from: the URL of a catalog.json, or of a folder (ending in /)
+# laid out like the local catalog folder, with index.json and one <project>.json per project.
+CATALOG_URL = os.environ.get("DM_CATALOG_URL") or ""
 
 TOOLS_DIR = ROOT / "Tools"
-RMAN_DL = TOOLS_DIR / "rman-dl.exe"
+RMAN_DL = Path(os.environ.get("DM_RMAN_DL") or TOOLS_DIR / "rman-dl.exe")
+CDN_URL = os.environ.get("DM_CDN_URL") or "https://{project}.secure.dyn.riotcdn.net/channels/public"
 
 CACHE_DIR = ROOT / "Cache"
 BUILDS_DIR = ROOT / "Builds"
+LOGS_DIR = ROOT / "Logs"
+JOB_METRICS_PATH = LOGS_DIR / "rman-dl-jobs.jsonl"
+STATS_INDEX_PATH = CACHE_DIR / "stats-index.json"
+CACHE_USAGE_PATH = CACHE_DIR / "cache-usage.json"
+QUEUE_PATH = ROOT / "download-queue.db"
+
+# Byte budget for everything under Cache/ (bundles and manifests of all projects).
+# Once it is exceeded, least recently used files are removed until the cache is back under the low-water mark.
+CACHE_BUDGET_MB = 25600
+CACHE_LOW_WATER_MB = 20480
+
+# Number of manifests fetched at once, and the size of the keep-alive connection pool
+MANIFEST_WORKERS = 8
+
+# Manifest transfers are retried with jittered exponential backoff: about 1s, 2s, 4s... capped at 30s
+MANIFEST_RETRIES = 5
+MANIFEST_BACKOFF = 1.0
+MANIFEST_BACKOFF_MAX = 30.0
+
+# Default and maximum number of rman-dl processes run at once.
+# Every worker gets its own cache bundle shard, so writers never share a bundle file.
+RMAN_WORKERS = 1
+MAX_RMAN_WORKERS = 16
+
+# Governor for all CDN traffic (manifest fetches and rman-dl). 0 means unlimited.
+# BANDWIDTH_LIMIT_MB is a token-bucket rate in MB/s, MAX_CONNECTIONS the number of connections open at once.
+# BANDWIDTH_SCHEDULE overrides both during the given local times, e.g. ("08:00", "19:00", 2.0, 4);
+# a window may wrap past midnight, and the first matching window wins.
+BANDWIDTH_LIMIT_MB = 0
+MAX_CONNECTIONS = 0
+BANDWIDTH_SCHEDULE = []
+
+# Connections one rman-dl process may open while a connection limit is active (passed as --cdn-workers)
+RMAN_CONNECTIONS = 4
+
+# Store identical build files once in Builds/<project>/.store and hardlink them into each build.
+# DEDUP_INLINE runs this on every build right after rman-dl finishes.
+DEDUP_INLINE = False
+DEDUP_WORKERS = 4
+
+# Opt-in profiling (DM_PROFILE or --profile): "spans" times the named stages below,
+# "cprofile" adds a cProfile of the main thread, "sample" adds a sampled stack profile of all threads.
+# The report is written to Logs/ when the script exits.
+PROFILE_MODE = os.environ.get("DM_PROFILE", "").lower()
+PROFILE_SAMPLE_INTERVAL = 0.005
 
 LANG_GROUPS = {
     "ares": [["none"], ["mature"], ["ar_AE","de_DE","en_US","es_ES","es_MX","fr_FR","id_ID","it_IT","ja_JP","ko_KR","pl_PL","pt_BR","ru_RU","th_TH","tr_TR","vi_VN","zh_CN","zh_TW"]],
@@ -21,6 +89,269 @@ LANG_GROUPS = {
     "valorant": [["none"], ["mature"], ["all_loc","ar_AE","de_DE","en_US","es_ES","es_MX","fr_FR","id_ID","it_IT","ja_JP","ko_KR","pl_PL","pt_BR","ru_RU","th_TH","tr_TR","vi_VN","zh_CN","zh_TW"], ["krrating","twmlogo","vnglogo"]],
 }
 
+# ---------- Profiling ----------
+# Spans are named timers around the stages that usually make a session slow (catalog loading,
+# statistics walks, searches, manifest transfers, rman-dl runs...). They cost nothing unless
+# profiling is on, and are summed per name into the report written at exit.
+
+_SPANS = {}
+_SPANS_LOCK = threading.Lock()
+_PROFILE = {"started": None, "cprofile": None, "sampler": None}
+
+class StackSampler:
+    """
+    Records the stack of every thread at a fixed interval, so time spent waiting on the
+    network or on child processes shows up too. Stacks are kept in flamegraph "folded" form.
+    """
+    def __init__(self, interval=PROFILE_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.counts = {}
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _loop(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self.samples += 1
+            for tid, frame in sys._current_frames().items():
+                if tid == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                key = ";".join(reversed(stack))
+                self.counts[key] = self.counts.get(key, 0) + 1
+
+def start_profiling(mode):
+    """
+    Turn profiling on for the rest of the run. mode is "spans", "cprofile" or "sample" ("1" means spans).
+    """
+    global PROFILE_MODE
+    PROFILE_MODE = mode if mode in ("cprofile", "sample") else "spans"
+    if _PROFILE["started"] is None:
+        _PROFILE["started"] = time.perf_counter()
+        atexit.register(write_profile_report)
+    if mode == "cprofile" and _PROFILE["cprofile"] is None:
+        _PROFILE["cprofile"] = cProfile.Profile()
+        _PROFILE["cprofile"].enable()
+    if mode == "sample" and _PROFILE["sampler"] is None:
+        _PROFILE["sampler"] = StackSampler()
+        _PROFILE["sampler"].start()
+
+def record_span(name, seconds):
+    with _SPANS_LOCK:
+        stat = _SPANS.setdefault(name, [0, 0.0, 0.0])
+        stat[0] += 1
+        stat[1] += seconds
+        stat[2] = max(stat[2], seconds)
+
+@contextlib.contextmanager
+def span(name):
+    if not PROFILE_MODE:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - start)
+
+def profiled(name):
+    """
+    Decorator form of span().
+    """
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            if not PROFILE_MODE:
+                return fn(*args, **kwargs)
+            with span(name):
+                return fn(*args, **kwargs)
+        return inner
+    return wrap
+
+def write_profile_report():
+    """
+    Write Logs/profile-<time>.txt with the span table and any cProfile or sampler output.
+    """
+    if _PROFILE["started"] is None:
+        return None
+    wall = time.perf_counter() - _PROFILE["started"]
+    stamp = time.strftime("%Y%m%d-%H%M%S") + f"-{os.getpid()}"
+    lines = [f"Profile of {' '.join(sys.argv) or 'download-manager'} ({PROFILE_MODE}), {wall:.2f}s wall time", ""]
+    lines.append(f"{'span':<28} {'calls':>7} {'total s':>10} {'mean ms':>10} {'max ms':>10} {'% wall':>7}")
+    with _SPANS_LOCK:
+        spans = sorted(_SPANS.items(), key=lambda kv: kv[1][1], reverse=True)
+    for name, (calls, total, longest) in spans:
+        lines.append(f"{name:<28} {calls:>7} {total:>10.3f} {total / calls * 1000:>10.2f} {longest * 1000:>10.2f} "
+                     f"{total / max(wall, 1e-9):>7.1%}")
+    if not spans:
+        lines.append("(no spans recorded)")
+    lines.append("Spans nest (rman.batch includes its rman.run spans) and parallel spans overlap, so totals can exceed wall time.")
+
+    LOGS_DIR.mkdir(parents=True, exist_ok=True)
+    prof = _PROFILE["cprofile"]
+    if prof is not None:
+        prof.disable()
+        prof.dump_stats(str(LOGS_DIR / f"profile-{stamp}.prof"))
+        out = io.StringIO()
+        pstats.Stats(prof, stream=out).sort_stats("cumulative").print_stats(40)
+        lines += ["", "cProfile of the main thread, top 40 by cumulative time "
+                  f"(full data in profile-{stamp}.prof):", out.getvalue()]
+    sampler = _PROFILE["sampler"]
+    if sampler is not None:
+        sampler.stop()
+        folded = LOGS_DIR / f"profile-{stamp}.folded"
+        folded.write_text("".join(f"{k} {v}\n" for k, v in sampler.counts.items()), encoding="utf-8")
+        leaves = {}
+        for stack, n in sampler.counts.items():
+            leaf = stack.rsplit(";", 1)[-1]
+            leaves[leaf] = leaves.get(leaf, 0) + n
+        lines += ["", f"Sampled stacks: {sampler.samples} samples every {sampler.interval * 1000:g} ms "
+                  f"(all threads, folded stacks in {folded.name} for flamegraph tools)",
+                  "Top 30 functions by samples on top of the stack:"]
+        for leaf, n in sorted(leaves.items(), key=lambda kv: kv[1], reverse=True)[:30]:
+            lines.append(f"  {n:>7}  {leaf}")
+
+    report = LOGS_DIR / f"profile-{stamp}.txt"
+    report.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    print(f"[Profile] Report written to {report}")
+    return report
+
+# Process pool workers import this file again (as __mp_main__ on Windows), and must not profile or report
+if __name__ == "__main__" and PROFILE_MODE not in ("", "0", "off"):
+    start_profiling(PROFILE_MODE)
+else:
+    PROFILE_MODE = ""
+
+# ---------- Catalog Storage ----------
+# catalog.json is split into one shard per project under catalog/, plus catalog/index.json.
+# Shards are parsed the first time a project is opened, so startup only reads the small index.
+# Dropping a new catalog.json in place is picked up on the next start and re-split,
+# and only the shards whose content changed are rewritten.
+
+def write_file_atomic(path, text):
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(text, encoding="utf-8")
+    os.replace(tmp, path)
+
+def read_catalog_index():
+    try:
+        return json.loads((CATALOG_DIR / "index.json").read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {"projects": []}
+
+def write_catalog_index(index):
+    CATALOG_DIR.mkdir(parents=True, exist_ok=True)
+    write_file_atomic(CATALOG_DIR / "index.json", json.dumps(index, indent=1))
+
+def save_catalog_project(project, entries, index=None):
+    """
+    Write one project's shard. Other shards are left untouched.
+    """
+    index = index or read_catalog_index()
+    CATALOG_DIR.mkdir(parents=True, exist_ok=True)
+    write_file_atomic(CATALOG_DIR / f"{project}.json", json.dumps(entries, separators=(",", ":")))
+    if project not in index["projects"]:
+        index["projects"].append(project)
+        write_catalog_index(index)
+
+@profiled("catalog.split")
+def sync_catalog_shards():
+    """
+    Re-split catalog.json if it is newer than the shards we made from it.
+    """
+    if not CATALOG_PATH.exists():
+        return
+    st = CATALOG_PATH.stat()
+    index = read_catalog_index()
+    if index.get("source_mtime") == st.st_mtime_ns and index.get("source_size") == st.st_size:
+        return
+    print("[Info] Catalog changed, splitting catalog.json into per-project shards...")
+    full = json.loads(CATALOG_PATH.read_text(encoding="utf-8"))
+    for project, entries in full.items():
+        shard = CATALOG_DIR / f"{project}.json"
+        text = json.dumps(entries, separators=(",", ":"))
+        try:
+            if shard.read_text(encoding="utf-8") == text:
+                continue
+        except OSError:
+            pass
+        save_catalog_project(project, entries, index)
+    index["projects"] = list(full.keys()) + [p for p in index["projects"] if p not in full]
+    index["source_mtime"] = st.st_mtime_ns
+    index["source_size"] = st.st_size
+    write_catalog_index(index)
+
+class LazyCatalog(Mapping):
+    """
+    Read-only {project: {manifest_id: entry}} mapping that loads each shard on first access.
+    """
+    def __init__(self):
+        self._projects = read_catalog_index()["projects"]
+        self._loaded = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, project):
+        if project not in self._projects:
+            raise KeyError(project)
+        entries = self._loaded.get(project)
+        if entries is None:
+            with self._lock:
+                entries = self._loaded.get(project)
+                if entries is None:
+                    try:
+                        with span("catalog.load_shard"):
+                            text = (CATALOG_DIR / f"{project}.json").read_text(encoding="utf-8")
+                            entries = json.loads(text)
+                    except (OSError, ValueError) as ex:
+                        print(f"[Warn] Could not load catalog shard for {project}: {ex}")
+                        entries = {}
+                    self._loaded[project] = entries
+        return entries
+
+    def __iter__(self):
+        return iter(self._projects)
+
+    def __len__(self):
+        return len(self._projects)
+
+    def merge(self, project, added, removed):
+        """
+        Apply a delta to one project in memory. Returns the project's updated entries.
+        """
+        if project in self._projects:
+            entries = self[project]
+        else:
+            entries = {}
+        with self._lock:
+            entries.update(added)
+            for mid in removed:
+                entries.pop(mid, None)
+            self._loaded[project] = entries
+            if project not in self._projects:
+                self._projects.append(project)
+        return entries
+
+def load_catalog():
+    try:
+        sync_catalog_shards()
+    except (OSError, ValueError) as ex:
+        print(f"[Error] Could not read catalog.json: {ex}")
+    return LazyCatalog()
+
+CATALOG = load_catalog()
+
 # ---------- Help System ----------
 
 HELP_KEY = "h"
@@ -38,11 +369,14 @@ HELP_TEXT = """
 [Cache Statistics / Builds Statistics]
   - Cache shows how many manifests and bundle files are stored locally.
   - Builds shows how many extracted builds you have and their disk usage.
+  - The cache is kept under a size budget (CACHE_BUDGET_MB at the top of the script).
+    When it is exceeded, the least recently used bundles and manifests are removed automatically.
 
 [Main Menu Selections]
   1) Search catalog  – browse all known manifests from catalog.json
   2) View cache      – browse only manifests you have cached locally
   3) Exit            – quit the program
+  4) Update catalog  – fetch new entries from CATALOG_URL (only what changed is downloaded and rewritten)
 
 [Project Selection]
   - Choose which project (lol, valorant, etc.) you want to browse.
@@ -52,6 +386,10 @@ HELP_TEXT = """
   - You can enter a regex to match versions.
       Example: ^13\.  → matches all versions starting with 13.
       Example: 3744   → matches any version containing 3744.
+  - [s] searches plain text in the version or the manifest ID, e.g. part of an ID you were given.
+    Searching again with more characters only rechecks the previous matches.
+  - Both use an index of 3-character pieces built the first time you search a project,
+    so the first search takes a moment and the rest are near instant.
 
 [Realm Filtering]
   - Realms are environment tags (e.g. NA1, PBE1).
@@ -64,6 +402,42 @@ HELP_TEXT = """
   - "none" is always included automatically.
   - Some tags are not languages but are content tags, such as "mature" or "video_hq".
 
+[Parallel Downloads]
+  - When downloading several entries you can run multiple rman-dl jobs at once.
+  - Each job uses its own cache bundle (<project>-cache-<n>.bundle), so jobs never write the same file.
+  - A batch is reordered so builds that share chunks (same platform, adjacent versions, similar
+    language filters) run one after another on the same cache bundle and reuse each other's chunks.
+  - There is no limit on the number of entries. Selections bigger than BATCH_CONFIRM_GB (by catalog
+    size) or than the free disk space ask for confirmation first.
+  - Failed jobs are listed with their exit code once the batch is done.
+
+[Download Queue]
+  - Every download is tracked in download-queue.db: queued, manifest-cached, extracting, done or failed.
+  - If the script is closed, crashes or the PC restarts, you are offered to resume the unfinished ones
+    on the next start. Builds already done with the same filters are skipped.
+
+[Download Logs]
+  - rman-dl output is written to Logs/rman-dl/<build>.log while a progress line shows the whole batch.
+  - Every job adds one line to Logs/rman-dl-jobs.jsonl with its bytes downloaded, bytes served from
+    the cache, wall time, MB/s and exit code, for charting over time.
+
+[Pre-flight Plan]
+  - Before rman-dl starts, the cached manifests are read to show how much will be downloaded,
+    how much is already in the cache bundle, and how much disk space the builds need.
+  - This needs the optional zstandard package (pip install zstandard).
+
+[Bandwidth Limits]
+  - BANDWIDTH_LIMIT_MB, MAX_CONNECTIONS and BANDWIDTH_SCHEDULE at the top of the script cap all CDN traffic.
+  - Manifest downloads are throttled exactly. rman-dl runs with fewer connections, and extra
+    rman-dl jobs wait while the running ones already use the whole rate.
+  - The allowed throughput is shown after each batch.
+
+[Upgrading Builds]
+  - Mode (u) builds each selected patch from the closest existing build of the same platform.
+  - Files that did not change between the two manifests are hardlinked from the old build;
+    only changed and new files are downloaded. Patches are processed oldest first.
+  - The old build's manifest must be in the cache. Without a usable build it downloads everything.
+
 [File Filtering]
   - Optional regex to restrict which files are downloaded.
       Example: \.exe$   → only download .exe files.
@@ -83,10 +457,12 @@ PROJECT_HELP_TEXT = """
   - This project has two halves. To have a completed build you must have both halves.
       Client - Contains the main exe. Very small manifest. Usually less than 1 megabyte.
       Data - Contians all the card data, assets, sounds, video files, etc. Very large manifest. Usually over 10 megabytes
-  - Later revisions of this script will attempt to automate this structure. For now it must be made manually
+  - When you download (d) both entries of the same version, the script pairs them and downloads both at once,
+    each straight into its place in one build named <version>-<platform>-<client id>+<data id>.
+    Selecting only one half still downloads it as a normal build.
   - The full build structure is as follows (using a default, live realm install as reference)
-      C:\Riot Games\LoR\live\Game
-      C:\Riot Games\LoR\live\PatcherData\PatchableFiles
+      C:\Riot Games\LoR\live\Game                          <- Client
+      C:\Riot Games\LoR\live\PatcherData\PatchableFiles    <- Data
 
 [ks-foundation] - Riot Client
   - No additional notes for this project
@@ -178,10 +554,11 @@ def set_console_size(width=180, height=48):
         except Exception:
             pass
 
-def ask_number(prompt, min_val, max_val, redraw=None):
+def ask_number(prompt, min_val, max_val, redraw=None, default=None):
     """
     Ask for a number within [min_val, max_val].
     If help is invoked, calls redraw() (if provided) and re-prompts.
+    A blank answer returns default, when one is given.
     """
     while True:
         val = input_with_help(prompt)
@@ -190,6 +567,8 @@ def ask_number(prompt, min_val, max_val, redraw=None):
                 redraw()
             continue
         val = val.strip()
+        if not val and default is not None:
+            return default
         if val.isdigit():
             num = int(val)
             if min_val <= num <= max_val:
@@ -238,16 +617,307 @@ def sanitize_version(ver):
     safe = re.sub(r'[:*?"<>|]', "", ver)
     return safe
 
-def download_manifest(project, manifest_id):
-    url = f"https://{project}.secure.dyn.riotcdn.net/channels/public/releases/{manifest_id}.manifest"
+# ---------- Bandwidth Governor ----------
+# One governor is shared by every transfer the script makes. In-process HTTP is throttled byte
+# by byte through a token bucket. rman-dl cannot be throttled from outside, so each process
+# takes RMAN_CONNECTIONS connection slots and is told to use that many, and a new process is
+# only started while the running ones measure below the byte rate.
+
+MB = 1024 * 1024
+
+def _clock_minutes(text):
+    h, m = text.split(":")
+    return int(h) * 60 + int(m)
+
+class Governor:
+    def __init__(self, rate_mb=0, connections=0, schedule=()):
+        self.rate_mb = rate_mb
+        self.connections = connections
+        self.schedule = list(schedule)
+        self._cond = threading.Condition()
+        self._in_use = 0
+        self._bucket_lock = threading.Lock()
+        self._tokens = 0.0
+        self._stamp = time.monotonic()
+        self.reset_stats()
+
+    def limits(self):
+        """
+        (MB/s, connections) in effect right now, 0 meaning unlimited.
+        """
+        now = time.localtime()
+        minute = now.tm_hour * 60 + now.tm_min
+        for start, end, rate_mb, connections in self.schedule:
+            start, end = _clock_minutes(start), _clock_minutes(end)
+            inside = start <= minute < end if start <= end else (minute >= start or minute < end)
+            if inside:
+                return rate_mb, connections
+        return self.rate_mb, self.connections
+
+    def active(self):
+        return bool(self.rate_mb or self.connections or self.schedule)
+
+    def describe(self):
+        rate_mb, connections = self.limits()
+        rate = f"{rate_mb:g} MB/s" if rate_mb else "unlimited rate"
+        conns = f"{connections} connections" if connections else "unlimited connections"
+        return f"{rate}, {conns}" + (" (scheduled)" if (rate_mb, connections) != (self.rate_mb, self.connections) else "")
+
+    def consume(self, nbytes):
+        """
+        Account for nbytes received, sleeping as long as the token bucket is in debt.
+        The bucket holds at most one second worth of bytes, so bursts stay short.
+        """
+        self.account(nbytes)
+        rate_mb, _ = self.limits()
+        if not rate_mb:
+            return
+        rate = rate_mb * MB
+        with self._bucket_lock:
+            now = time.monotonic()
+            self._tokens = min(rate, self._tokens + (now - self._stamp) * rate) - nbytes
+            self._stamp = now
+            wait = -self._tokens / rate if self._tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+    @contextlib.contextmanager
+    def connection(self, slots=1):
+        """
+        Hold `slots` connections for the duration of the block.
+        A request bigger than the whole limit still runs, alone.
+        """
+        with self._cond:
+            while True:
+                _, limit = self.limits()
+                if not limit or not self._in_use or self._in_use + slots <= limit:
+                    break
+                # Wake up now and then so a schedule change is noticed
+                self._cond.wait(5)
+            self._in_use += slots
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._in_use -= slots
+                self._cond.notify_all()
+
+    def rman_connections(self):
+        _, limit = self.limits()
+        return min(RMAN_CONNECTIONS, limit) if limit else None
+
+    def wait_for_headroom(self, running, current_rate):
+        """
+        Hold a new rman-dl process back while the running ones already use the byte rate.
+        current_rate() returns bytes/s, or None while there is not enough data to tell.
+        """
+        while running():
+            rate_mb, _ = self.limits()
+            if not rate_mb:
+                return
+            rate = current_rate()
+            if rate is not None and rate < rate_mb * MB * 0.9:
+                return
+            time.sleep(1)
+
+    def account(self, nbytes):
+        with self._bucket_lock:
+            self.bytes += nbytes
+
+    def reset_stats(self):
+        self.bytes = 0
+        self.since = time.monotonic()
+
+    def report(self):
+        """
+        One line with the limits and the throughput allowed since reset_stats().
+        """
+        elapsed = time.monotonic() - self.since
+        allowed = self.bytes / max(elapsed, 1e-6)
+        return (f"[Governor] {self.describe()}; allowed {format_mb(self.bytes)} "
+                f"in {elapsed:.1f}s ({format_mb(allowed)}/s)")
+
+GOVERNOR = Governor(BANDWIDTH_LIMIT_MB, MAX_CONNECTIONS, BANDWIDTH_SCHEDULE)
+
+_SESSION = None
+_SESSION_LOCK = threading.Lock()
+
+def get_session():
+    """
+    Shared requests session so manifest fetches reuse keep-alive connections.
+    The pool is sized to MANIFEST_WORKERS so parallel fetches never wait on a socket.
+    """
+    global _SESSION
+    with _SESSION_LOCK:
+        if _SESSION is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=MANIFEST_WORKERS)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _SESSION = session
+    return _SESSION
+
+class ManifestVerifyError(Exception):
+    pass
+
+_DIGEST_LOCK = threading.Lock()
+
+def manifest_digests(project):
+    try:
+        return json.loads((CACHE_DIR / project / "releases" / "digests.json").read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+def record_manifest_digest(project, manifest_id, digest):
+    with _DIGEST_LOCK:
+        digests = manifest_digests(project)
+        digests[manifest_id] = digest
+        write_file_atomic(CACHE_DIR / project / "releases" / "digests.json", json.dumps(digests, indent=1))
+
+def verify_manifest_file(path, project, manifest_id, expected_size=None):
+    """
+    Check a finished transfer before it is trusted: size, RMAN header and ID, and digest.
+    The digest is compared to the catalog's sha256 when it has one, otherwise to the digest
+    recorded the last time this manifest was downloaded. Returns the sha256 hex digest.
+    """
+    data = Path(path).read_bytes()
+    if expected_size is not None and len(data) != expected_size:
+        raise ManifestVerifyError(f"got {len(data)} bytes, expected {expected_size}")
+    try:
+        header_id = read_manifest_header(data)[0]
+    except ValueError as ex:
+        raise ManifestVerifyError(str(ex))
+    try:
+        if header_id != int(manifest_id, 16):
+            raise ManifestVerifyError(f"manifest header has ID {header_id:016X}")
+    except ValueError:
+        pass
+    digest = hashlib.sha256(data).hexdigest()
+    expected = CATALOG.get(project, {}).get(manifest_id, {}).get("sha256") or manifest_digests(project).get(manifest_id)
+    if expected and expected.lower() != digest:
+        raise ManifestVerifyError(f"sha256 {digest} does not match {expected}")
+    return digest
+
+def _retryable(ex):
+    if isinstance(ex, requests.HTTPError) and ex.response is not None:
+        code = ex.response.status_code
+        return code >= 500 or code in (408, 429)
+    return True
+
+@profiled("manifest.fetch")
+def fetch_manifest(project, manifest_id):
+    """
+    Download one manifest into the cache, resuming a leftover .part file with a Range request
+    and retrying transient failures. Returns {"path", "cached", "retries", "resumes", "bytes"}.
+    """
+    url = CDN_URL.format(project=project) + f"/releases/{manifest_id}.manifest"
     dest = CACHE_DIR / project / "releases" / f"{manifest_id}.manifest"
     dest.parent.mkdir(parents=True, exist_ok=True)
-    if not dest.exists():
-        r = requests.get(url, timeout=30)
-        r.raise_for_status()
-        dest.write_bytes(r.content)
-        print(f"[OK] Downloaded manifest to {dest}")
-    return dest
+    result = {"path": dest, "cached": True, "retries": 0, "resumes": 0, "bytes": 0}
+    if dest.exists():
+        touch_cache(dest)
+        return result
+
+    result["cached"] = False
+    # Bytes are streamed into a .part file and only renamed into place once verified,
+    # so an interrupted run never leaves a truncated manifest behind.
+    tmp = dest.with_name(dest.name + ".part")
+    attempt = 0
+    while True:
+        try:
+            offset = tmp.stat().st_size if tmp.exists() else 0
+            headers = {"Range": f"bytes={offset}-"} if offset else {}
+            with GOVERNOR.connection(), get_session().get(url, timeout=30, stream=True, headers=headers) as r:
+                if r.status_code == 416:
+                    # The .part file is already complete (or bogus), let verification decide
+                    total = offset
+                else:
+                    r.raise_for_status()
+                    length = r.headers.get("Content-Length")
+                    if r.headers.get("Content-Encoding"):
+                        # requests decodes the body, so the header length is not the file length
+                        length = None
+                    if offset and r.status_code == 206:
+                        result["resumes"] += 1
+                        mode = "ab"
+                    else:
+                        offset, mode = 0, "wb"
+                    total = offset + int(length) if length is not None else None
+                    # Smaller reads keep a throttled transfer smooth
+                    block_size = 64 * 1024 if GOVERNOR.limits()[0] else 1024 * 1024
+                    with open(tmp, mode) as f:
+                        for block in r.iter_content(chunk_size=block_size):
+                            f.write(block)
+                            result["bytes"] += len(block)
+                            GOVERNOR.consume(len(block))
+            digest = verify_manifest_file(tmp, project, manifest_id, total)
+        except ManifestVerifyError as ex:
+            # Resuming a corrupt file cannot fix it, start over
+            tmp.unlink(missing_ok=True)
+            error = ex
+        except (requests.RequestException, OSError) as ex:
+            if not _retryable(ex):
+                raise
+            error = ex
+        else:
+            break
+        if attempt >= MANIFEST_RETRIES:
+            raise error
+        attempt += 1
+        result["retries"] += 1
+        delay = min(MANIFEST_BACKOFF_MAX, MANIFEST_BACKOFF * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+        print(f"[Retry] Manifest {manifest_id}: {error}. Retrying in {delay:.1f}s ({attempt}/{MANIFEST_RETRIES})")
+        time.sleep(delay)
+
+    os.replace(tmp, dest)
+    record_manifest_digest(project, manifest_id, digest)
+    add_to_inventory(project, manifest_id)
+    touch_cache(dest)
+    if zstandard is not None:
+        FILE_INDEXER.add(project, manifest_id, dest)
+    return result
+
+def download_manifest(project, manifest_id):
+    result = fetch_manifest(project, manifest_id)
+    if not result["cached"]:
+        print(f"[OK] Downloaded manifest to {result['path']}")
+    return result["path"]
+
+@profiled("manifest.prefetch")
+def prefetch_manifests(project, manifest_ids, workers=MANIFEST_WORKERS):
+    """
+    Fetch several manifests concurrently over the shared session.
+    Returns {manifest_id: path} for every manifest that is now cached.
+    Failures are reported and left out of the result instead of aborting the batch.
+    """
+    paths = {}
+    pending = list(dict.fromkeys(manifest_ids))
+    if not pending:
+        return paths
+    retries = resumes = 0
+    GOVERNOR.reset_stats()
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(pending)))) as pool:
+        futures = {pool.submit(fetch_manifest, project, mid): mid for mid in pending}
+        for fut in as_completed(futures):
+            mid = futures[fut]
+            try:
+                result = fut.result()
+            except Exception as ex:
+                print(f"[Error] Could not download manifest {mid}: {ex}")
+                continue
+            paths[mid] = result["path"]
+            retries += result["retries"]
+            resumes += result["resumes"]
+            if not result["cached"]:
+                extra = ""
+                if result["retries"] or result["resumes"]:
+                    extra = f" ({result['retries']} retries, {result['resumes']} resumed)"
+                print(f"[OK] Downloaded manifest {mid}, {format_mb(result['bytes'])}{extra}")
+    if retries or resumes:
+        print(f"[Info] Manifest transfers needed {retries} retries and {resumes} resumes")
+    if GOVERNOR.active() and GOVERNOR.bytes:
+        print(GOVERNOR.report())
+    return paths
 
 def prompt_languages(project, manifest_id):
     groups = LANG_GROUPS.get(project, [["none"]])
@@ -282,39 +952,364 @@ def prompt_languages(project, manifest_id):
             # loop will redraw and re‑ask
             continue
 
-        choice = choice.strip()
-        if not choice:
-            return None
+        return normalize_langs(choice)
+
+def normalize_langs(choice):
+    """
+    Turn a "a|b" language string (or list) into the filter rman-dl gets, with "none" always first.
+    Blank means no filter at all.
+    """
+    if isinstance(choice, (list, tuple)):
+        langs = [l.strip() for l in choice if l.strip()]
+    else:
+        langs = [l.strip() for l in (choice or "").strip().split("|") if l.strip()]
+    if not langs:
+        return None
+    if "none" not in langs:
+        langs.insert(0, "none")
+    return "|".join(langs)
+
+def entry_langs(project, entry, base_langs_list):
+    """
+    Apply the project-specific language rules for one entry and return the final filter string.
+    """
+    langs_list = list(base_langs_list)
 
-        langs = choice.split("|")
-        if "none" not in langs:
-            langs.insert(0, "none")
-        return "|".join(langs)
+    if project == "lol" and langs_list:
+        p = entry.get("platform", "").lower()
+        if "windows" in p and "windows" not in langs_list:
+            langs_list.append("windows")
+        elif "mac" in p and "macos" not in langs_list:
+            langs_list.append("macos")
 
-def build_output_dir(project, manifest_id, entry, langs=None):
+    if project == "valorant" and "all_loc" in langs_list:
+        langs_list = ["none", "all_loc"]
+
+    return "|".join(langs_list) if langs_list else None
+
+def build_output_path(project, manifest_id, entry):
     version = sanitize_version(entry.get("version","unknown"))
     platform = entry.get("platform","unknown")
     base = f"{project}-{version}-{platform}-{manifest_id}"
-    outdir = BUILDS_DIR / project / base
+    return BUILDS_DIR / project / base
+
+def build_output_dir(project, manifest_id, entry, langs=None):
+    outdir = build_output_path(project, manifest_id, entry)
+    base = outdir.name
     outdir.mkdir(parents=True, exist_ok=True)
     if langs:
         (outdir.parent / f"{base}_filter.txt").write_text(langs, encoding="utf-8")
     return outdir
 
-def run_rman_dl(project, manifest_path, outdir, langs=None, file_filter=None, use_cache=True):
-    cache_path = CACHE_DIR / project / "bundles" / f"{project}-cache.bundle"
+def cache_bundle_path(project, shard=0):
+    """
+    Shard 0 is the classic <project>-cache.bundle, extra workers get <project>-cache-<n>.bundle.
+    """
+    name = f"{project}-cache.bundle" if shard == 0 else f"{project}-cache-{shard}.bundle"
+    return CACHE_DIR / project / "bundles" / name
+
+@profiled("rman.run")
+def run_rman_dl(project, manifest_path, outdir, langs=None, file_filter=None, use_cache=True, cache_path=None,
+                log_path=None, append_log=False):
+    """
+    Run rman-dl for one manifest. Returns (return code, elapsed seconds).
+    With log_path, the child's output goes to that file instead of the terminal.
+    """
+    cache_path = cache_path or cache_bundle_path(project)
     cache_path.parent.mkdir(parents=True, exist_ok=True)
     cmd = [str(RMAN_DL)]
     if langs:
         cmd += ["-l", langs]
     if file_filter:
         cmd += ["-p", file_filter]
-    cmd += ["--cdn", f"https://{project}.secure.dyn.riotcdn.net/channels/public"]
+    cmd += ["--cdn", CDN_URL.format(project=project)]
+    connections = GOVERNOR.rman_connections()
+    if connections:
+        cmd += ["--cdn-workers", str(connections)]
     if use_cache:
         cmd += ["--cache", str(cache_path)]
     cmd += [str(manifest_path), str(outdir)]
-    print("[CMD]", " ".join(cmd))
-    subprocess.run(cmd, cwd=ROOT)
+    start = time.monotonic()
+    try:
+        if log_path:
+            log_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(log_path, "ab" if append_log else "wb") as log:
+                log.write(("[CMD] " + " ".join(cmd) + "\n").encode("utf-8"))
+                log.flush()
+                code = subprocess.run(cmd, cwd=ROOT, stdout=log, stderr=subprocess.STDOUT).returncode
+        else:
+            print("[CMD]", " ".join(cmd))
+            code = subprocess.run(cmd, cwd=ROOT).returncode
+    except OSError as ex:
+        print(f"[Error] Could not start rman-dl: {ex}")
+        code = -1
+    return code, time.monotonic() - start
+
+def file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+def parse_rman_log(log_path, max_lines=200):
+    """
+    Pull what we can use out of an rman-dl log: the last output line and any error lines.
+    Progress output uses carriage returns, so those count as line breaks too.
+    """
+    try:
+        with open(log_path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - 64 * 1024))
+            text = f.read().decode("utf-8", "replace")
+    except OSError:
+        return {"last_line": "", "errors": []}
+    lines = [l.strip() for l in re.split(r"[\r\n]+", text) if l.strip()][-max_lines:]
+    errors = [l for l in lines if not l.startswith("[CMD]") and re.search(r"error|fail|exception", l, re.IGNORECASE)]
+    return {"last_line": lines[-1] if lines else "", "errors": errors[-5:]}
+
+class JobMonitor:
+    """
+    Live aggregate progress line for a batch of rman-dl jobs.
+    Bytes fetched are measured as the growth of each running job's cache bundle,
+    since rman-dl appends every chunk it downloads there.
+    """
+    def __init__(self, total_jobs, interval=1.0):
+        self.total = total_jobs
+        self.done = 0
+        self.failed = 0
+        self.active = {}
+        self.finished_bytes = 0
+        self.started = time.monotonic()
+        self.interval = interval
+        self.live = sys.stdout.isatty()
+        self.lock = threading.Lock()
+        self._stop = threading.Event()
+        self._width = 0
+        self._samples = []
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+
+    def __enter__(self):
+        if self.live:
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self._clear()
+
+    def start_job(self, label, bundle):
+        with self.lock:
+            self.active[label] = (bundle, file_size(bundle))
+
+    def finish_job(self, label, ok):
+        """
+        Returns the bytes the job fetched.
+        """
+        with self.lock:
+            bundle, start_size = self.active.pop(label)
+            fetched = max(0, file_size(bundle) - start_size)
+            self.finished_bytes += fetched
+            self.done += 1
+            self.failed += 0 if ok else 1
+        return fetched
+
+    def fetched(self):
+        with self.lock:
+            running = sum(max(0, file_size(b) - s) for b, s in self.active.values())
+            return self.finished_bytes + running
+
+    def running(self):
+        with self.lock:
+            return len(self.active)
+
+    def recent_rate(self, window=5.0):
+        """
+        Bytes/s over the last few seconds, or None until two seconds have been seen.
+        """
+        fetched = self.fetched()
+        now = time.monotonic()
+        with self.lock:
+            self._samples.append((now, fetched))
+            while now - self._samples[0][0] > window:
+                self._samples.pop(0)
+            then, before = self._samples[0]
+        return (fetched - before) / (now - then) if now - then >= 2 else None
+
+    def message(self, text):
+        with self.lock:
+            self._clear()
+            print(text)
+
+    def _clear(self):
+        if self.live and self._width:
+            print("\r" + " " * self._width + "\r", end="", flush=True)
+            self._width = 0
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            fetched = self.fetched()
+            rate = fetched / max(time.monotonic() - self.started, 1e-6)
+            with self.lock:
+                line = (f"[Progress] {self.done}/{self.total} done, {len(self.active)} running, {self.failed} failed, "
+                        f"{format_mb(fetched)} fetched, {format_mb(rate)}/s")
+                self._clear()
+                print(line, end="", flush=True)
+                self._width = len(line)
+
+_METRICS_LOCK = threading.Lock()
+
+def append_job_metrics(record):
+    with _METRICS_LOCK:
+        try:
+            LOGS_DIR.mkdir(parents=True, exist_ok=True)
+            with open(JOB_METRICS_PATH, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+        except OSError as ex:
+            print(f"[Warn] Could not write job metrics: {ex}")
+
+@profiled("rman.batch")
+def run_rman_jobs(project, jobs, workers=RMAN_WORKERS):
+    """
+    Run a list of rman-dl jobs with up to `workers` processes at once.
+    Each job is a dict with manifest_path, outdir, langs, file_filter and label.
+    Each job runs on its cache shard (see assign_shards, called here for jobs without one):
+    one worker per shard runs that shard's jobs in order, so no two rman-dl processes ever
+    write the same bundle, and the jobs of one chain find each other's chunks.
+    Child output goes to Logs/rman-dl/<label>.log, and one metrics record per job
+    is appended to Logs/rman-dl-jobs.jsonl.
+    Returns the jobs with "returncode", "elapsed" and "metrics" filled in.
+    """
+    if not jobs:
+        return []
+    if any("shard" not in job for job in jobs):
+        assign_shards(jobs, workers)
+    shard_jobs = {}
+    for job in jobs:
+        shard_jobs.setdefault(job["shard"], []).append(job)
+    workers = len(shard_jobs)
+    monitor = JobMonitor(len(jobs))
+
+    def run_job(job, shard):
+        bundle = cache_bundle_path(project, shard)
+        log_path = LOGS_DIR / "rman-dl" / f"{job['label']}.log"
+        start = time.monotonic()
+        code = -1
+        error = None
+        try:
+            pin_cache(bundle)
+            # Make room before the job grows the cache, without touching anything in use
+            enforce_cache_budget()
+            GOVERNOR.wait_for_headroom(monitor.running, monitor.recent_rate)
+            if job.get("mode"):
+                queue_set_state(project, job["manifest_id"], job["mode"], "extracting", outdir=job["outdir"],
+                                langs=job.get("langs"), file_filter=job.get("file_filter"))
+            monitor.start_job(job["label"], bundle)
+            monitor.message(f"[Start] {job['label']} (log: {log_path})")
+            start = time.monotonic()
+            code = 0
+            # A job may prepare its output first (e.g. link files from an older build)
+            # and then need several rman-dl runs, one per path filter
+            if job.get("prepare"):
+                job["prepare"](job, monitor.message)
+            with GOVERNOR.connection(GOVERNOR.rman_connections() or 1):
+                for n, path_filter in enumerate(job.get("file_filters", [job.get("file_filter")])):
+                    code, _ = run_rman_dl(
+                        project, job["manifest_path"], job["outdir"], job.get("langs"), path_filter,
+                        cache_path=bundle, log_path=log_path, append_log=n > 0,
+                    )
+                    if code != 0:
+                        break
+        except Exception as ex:
+            # Whatever goes wrong fails this job only, the rest of the batch carries on
+            monitor.message(f"[Error] {job['label']}: {ex}")
+            code = -1
+            error = str(ex)
+        finally:
+            unpin_cache(bundle)
+            elapsed = time.monotonic() - start
+            if job["label"] not in monitor.active:
+                # Failed before it started, count it all the same
+                monitor.start_job(job["label"], bundle)
+            fetched = monitor.finish_job(job["label"], code == 0)
+            GOVERNOR.account(fetched)
+            job["returncode"] = code
+            job["elapsed"] = elapsed
+            if job.get("mode"):
+                queue_set_state(project, job["manifest_id"], job["mode"], "done" if code == 0 else "failed",
+                                returncode=code, error=None if code == 0 else error or f"rman-dl exited with code {code}")
+        # Two-part builds write each half into a subfolder of one build
+        build_dir = job.get("build_dir", job["outdir"])
+        log = parse_rman_log(log_path)
+        try:
+            if code == 0 and job.get("dedup", DEDUP_INLINE):
+                linked, saved = dedup_build(job["outdir"], build_dir=build_dir)
+                monitor.message(f"[Dedup] {job['label']}: {linked} files linked, {format_mb(saved)} saved")
+            else:
+                refresh_build_stats(build_dir)
+
+            # The plan covers the whole build, an upgrade only asks rman-dl for what it did not link
+            upgrade = job.get("upgrade")
+            plan = job.get("plan")
+            needed = upgrade["chunk_bytes"] if upgrade else plan["total_bytes"] if plan else None
+            from_cache = max(0, needed - fetched) if needed is not None else None
+            rec = load_stats_index()["builds"].get(project, {}).get(Path(build_dir).name, {})
+            job["metrics"] = metrics = {
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "project": project,
+                "label": job["label"],
+                "manifest": Path(job["manifest_path"]).stem,
+                "langs": job.get("langs"),
+                "file_filter": job.get("file_filter"),
+                "returncode": code,
+                "wall_seconds": round(elapsed, 3),
+                "bytes_downloaded": fetched,
+                "bytes_from_cache": from_cache,
+                "bytes_linked": upgrade["linked_bytes"] if upgrade else 0,
+                "bytes_written": rec.get("size"),
+                "mb_per_second": round(fetched / 1024 / 1024 / max(elapsed, 1e-6), 3),
+                "cache_hit_ratio": round(from_cache / needed, 4) if needed else None,
+                "errors": log["errors"],
+                "log": str(log_path),
+            }
+            append_job_metrics(metrics)
+        except Exception as ex:
+            monitor.message(f"[Warn] {job['label']}: could not record build stats: {ex}")
+
+        if code == 0:
+            monitor.message(f"[OK] {job['label']} finished in {elapsed:.1f}s, "
+                            f"fetched {format_mb(fetched)} at {format_mb(fetched / max(elapsed, 1e-6))}/s")
+        else:
+            monitor.message(f"[Error] {job['label']} failed: {error or f'rman-dl exited with code {code}'} after {elapsed:.1f}s"
+                            + (f": {log['last_line']}" if log["last_line"] else ""))
+        return job
+
+    def run_shard(shard):
+        return [run_job(job, shard) for job in shard_jobs[shard]]
+
+    manifests = [j["manifest_path"] for j in jobs]
+    GOVERNOR.reset_stats()
+    pin_cache(*manifests)
+    try:
+        with monitor, ThreadPoolExecutor(max_workers=workers) as pool:
+            done = [job for shard in pool.map(run_shard, shard_jobs) for job in shard]
+    finally:
+        unpin_cache(*manifests)
+        save_cache_usage()
+
+    failed = [j for j in done if j["returncode"] != 0]
+    total = sum(j["elapsed"] for j in done)
+    fetched = sum(j["metrics"]["bytes_downloaded"] for j in done)
+    wall = time.monotonic() - monitor.started
+    print(f"\n[Info] rman-dl jobs: {len(done) - len(failed)}/{len(done)} succeeded, {total:.1f}s of job time with {workers} worker(s)")
+    print(f"[Info] Fetched {format_mb(fetched)} in {wall:.1f}s ({format_mb(fetched / max(wall, 1e-6))}/s), metrics in {JOB_METRICS_PATH}")
+    if GOVERNOR.active():
+        print(GOVERNOR.report())
+    for j in failed:
+        print(f"  [Failed] {j['label']} (exit code {j['returncode']}, log: {j['metrics']['log']})")
+    save_stats_index()
+    return done
 
 def format_mb(bytes_val):
     try:
@@ -326,46 +1321,191 @@ def format_mb(bytes_val):
 def human_mb(size_val):
     return format_mb(size_val)
 
+# ---------- Stats Index ----------
+# Sizes of extracted builds and manifest counts are kept in Cache/stats-index.json.
+# A build is only walked again when its directory mtime changes, or when we write to it ourselves.
+_STATS_INDEX = None
+_STATS_LOCK = threading.Lock()
+_STATS_DIRTY = False
+
+def load_stats_index():
+    global _STATS_INDEX
+    if _STATS_INDEX is None:
+        try:
+            _STATS_INDEX = json.loads(STATS_INDEX_PATH.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            _STATS_INDEX = {}
+        _STATS_INDEX.setdefault("builds", {})
+    return _STATS_INDEX
+
+def save_stats_index():
+    global _STATS_DIRTY
+    with _STATS_LOCK:
+        if not _STATS_DIRTY:
+            return
+        try:
+            STATS_INDEX_PATH.parent.mkdir(parents=True, exist_ok=True)
+            tmp = STATS_INDEX_PATH.with_name(STATS_INDEX_PATH.name + ".tmp")
+            tmp.write_text(json.dumps(load_stats_index()), encoding="utf-8")
+            os.replace(tmp, STATS_INDEX_PATH)
+            _STATS_DIRTY = False
+        except OSError as ex:
+            print(f"[Warn] Could not save stats index: {ex}")
+
+def _entry_stat(e):
+    # DirEntry.stat() leaves st_nlink at zero on Windows, so hardlink counts need a real stat there
+    return os.stat(e.path, follow_symlinks=False) if os.name == "nt" else e.stat(follow_symlinks=False)
+
+def scan_tree(path):
+    """
+    Total size and file count of a directory tree, using scandir so each file costs one stat.
+    Also returns the bytes in files that are not hardlinked anywhere else.
+    """
+    size = count = private = 0
+    stack = [path]
+    while stack:
+        try:
+            it = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with it:
+            for e in it:
+                try:
+                    if e.is_dir(follow_symlinks=False):
+                        stack.append(e.path)
+                    elif e.is_file(follow_symlinks=False):
+                        st = _entry_stat(e)
+                        size += st.st_size
+                        count += 1
+                        if st.st_nlink <= 1:
+                            private += st.st_size
+                except OSError:
+                    pass
+    return size, count, private
+
+@profiled("stats.refresh_build")
+def refresh_build_stats(outdir):
+    """
+    Re-walk one build directory and store its totals. Called whenever we write a build.
+    """
+    global _STATS_DIRTY
+    outdir = Path(outdir)
+    try:
+        mtime = outdir.stat().st_mtime_ns
+    except OSError:
+        forget_build_stats(outdir)
+        return
+    size, count, private = scan_tree(outdir)
+    with _STATS_LOCK:
+        builds = load_stats_index()["builds"].setdefault(outdir.parent.name, {})
+        builds[outdir.name] = {"mtime": mtime, "size": size, "files": count, "private": private}
+        _STATS_DIRTY = True
+
+def refresh_store_stats(proj):
+    """
+    Re-walk the dedup store of a project. Called after every dedup pass.
+    """
+    global _STATS_DIRTY
+    store = BUILDS_DIR / proj / ".store"
+    size, count, _ = scan_tree(store) if store.exists() else (0, 0, 0)
+    with _STATS_LOCK:
+        load_stats_index().setdefault("stores", {})[proj] = {"size": size, "files": count}
+        _STATS_DIRTY = True
+
+def forget_build_stats(outdir):
+    global _STATS_DIRTY
+    outdir = Path(outdir)
+    with _STATS_LOCK:
+        builds = load_stats_index()["builds"].get(outdir.parent.name, {})
+        if builds.pop(outdir.name, None) is not None:
+            _STATS_DIRTY = True
+
+def project_build_stats(proj):
+    """
+    (size, count, physical size) of the extracted builds of a project, revalidated from directory mtimes.
+    Size is what the builds add up to, physical size is what they take on disk after dedup.
+    """
+    proj_dir = BUILDS_DIR / proj
+    if not proj_dir.exists():
+        return 0, 0, 0
+    known = load_stats_index()["builds"].get(proj, {})
+    seen = set()
+    size = count = private = 0
+    with os.scandir(proj_dir) as it:
+        for e in it:
+            if not e.is_dir() or e.name.startswith("."):
+                continue
+            seen.add(e.name)
+            rec = known.get(e.name)
+            if rec is None or rec["mtime"] != e.stat().st_mtime_ns:
+                refresh_build_stats(e.path)
+                rec = load_stats_index()["builds"].get(proj, {}).get(e.name)
+            if rec:
+                size += rec["size"]
+                private += rec.get("private", rec["size"])
+                count += 1
+    for name in set(known) - seen:
+        forget_build_stats(proj_dir / name)
+    store = load_stats_index().get("stores", {}).get(proj, {}).get("size", 0)
+    return size, count, private + store
+
+def project_cache_stats(proj):
+    """
+    (bundle size, manifest count) for a project. Bundles are few and stat'd directly,
+    the manifest count comes from the cache inventory.
+    """
+    bundle_dir = CACHE_DIR / proj / "bundles"
+    size = sum(f.stat().st_size for f in bundle_dir.glob("*.bundle")) if bundle_dir.exists() else 0
+    return size, len(cached_manifest_ids(proj))
+
+@profiled("stats.show")
 def show_stats():
     term_width = shutil.get_terminal_size((120, 20)).columns
     gap = 4
 
-    cache_data = {}
-    for proj in CATALOG.keys():
-        bundle_dir = CACHE_DIR / proj / "bundles"
-        releases_dir = CACHE_DIR / proj / "releases"
-        size = sum(f.stat().st_size for f in bundle_dir.glob("*.bundle")) if bundle_dir.exists() else 0
-        count = sum(1 for _ in releases_dir.glob("*.manifest")) if releases_dir.exists() else 0
-        cache_data[proj] = (size, count)
+    cache_data = {proj: project_cache_stats(proj) for proj in CATALOG.keys()}
 
     cache_total_size = sum(s for s, _ in cache_data.values())
     cache_total_count = sum(c for _, c in cache_data.values())
 
     builds_data = {}
+    builds_physical = {}
+    builds_packed = {}
     for proj in CATALOG.keys():
-        proj_dir = BUILDS_DIR / proj
-        if proj_dir.exists():
-            build_dirs = [d for d in proj_dir.iterdir() if d.is_dir()]
-            count = len(build_dirs)
-            size = sum(f.stat().st_size for d in build_dirs for f in d.rglob("*") if f.is_file())
-        else:
-            size, count = 0, 0
-        builds_data[proj] = (size, count)
+        size, count, physical = project_build_stats(proj)
+        p_size, p_count, p_disk = project_pack_stats(proj)
+        builds_data[proj] = (size + p_size, count + p_count)
+        builds_physical[proj] = physical + p_disk
+        builds_packed[proj] = p_count
+    save_stats_index()
 
     builds_total_size = sum(s for s, _ in builds_data.values())
     builds_total_count = sum(c for _, c in builds_data.values())
+    builds_total_physical = sum(builds_physical.values())
+    builds_total_packed = sum(builds_packed.values())
+
+    def size_label(size, physical):
+        # Only mention the on-disk size once dedup or packing has actually saved something
+        if physical < size:
+            return f"{format_mb(size)} ({format_mb(physical)} on disk)"
+        return format_mb(size)
+
+    def count_label(count, packed):
+        return f"{count} ({packed} packed)" if packed else str(count)
 
     left_title = "[Cache Statistics]"
     right_title = "[Builds Statistics]"
     left_totals = f"Total cache size: {format_mb(cache_total_size)}   Total cached count: {cache_total_count}"
-    right_totals = f"Total size: {format_mb(builds_total_size)}   Total count: {builds_total_count}"
+    right_totals = (f"Total size: {size_label(builds_total_size, builds_total_physical)}   "
+                    f"Total count: {count_label(builds_total_count, builds_total_packed)}")
 
     left_proj_max = max(
         (len(f"  {p}: Size {format_mb(s)}, Count {c}") for p, (s, c) in cache_data.items()),
         default=0
     )
     right_proj_max = max(
-        (len(f"  {p}: Size {format_mb(s)}, Count {c}") for p, (s, c) in builds_data.items()),
+        (len(f"  {p}: Size {size_label(s, builds_physical[p])}, Count {count_label(c, builds_packed[p])}")
+         for p, (s, c) in builds_data.items()),
         default=0
     )
     left_width = max(len(left_title), len(left_totals), left_proj_max)
@@ -384,87 +1524,1904 @@ def show_stats():
         c_size, c_count = cache_data[proj]
         b_size, b_count = builds_data[proj]
         left = f"  {proj}: Size {format_mb(c_size)}, Count {c_count}"
-        right = f"  {proj}: Size {format_mb(b_size)}, Count {b_count}"
+        right = f"  {proj}: Size {size_label(b_size, builds_physical[proj])}, Count {count_label(b_count, builds_packed[proj])}"
         print_row(left, right)
 
-def check_cache_size(project, threshold_mb=25600):
-    bundle_dir = CACHE_DIR / project / "bundles"
-    size = sum(f.stat().st_size for f in bundle_dir.glob("*.bundle")) if bundle_dir.exists() else 0
-    mb = size / 1024 / 1024
+# ---------- Cache Inventory ----------
+# The manifest IDs in Cache/<project>/releases/ are kept in Cache/<project>/inventory.json
+# together with the directory mtime they were read at. fetch_manifest adds to it as it writes,
+# anything else that touches the directory changes its mtime and triggers one rescan.
+_INVENTORY = {}
+_INVENTORY_LOCK = threading.Lock()
 
-    if mb > threshold_mb:
-        while True:
-            ans = input_with_help(
-                f"[Cache] {project} cache is {format_mb(size)}, exceeds {threshold_mb} MB. Clean? (y/N): "
-            ).strip().lower()
-            if ans == "__REDRAW__":
-                clear_screen()
-                print(f"[Cache] {project} cache is {format_mb(size)}, exceeds {threshold_mb} MB. Clean? (y/N): ")
-                continue
-            break
-        if ans == "y":
-            for f in bundle_dir.glob("*.bundle"):
-                try:
-                    f.unlink()
-                except Exception as ex:
-                    print(f"[Warn] Could not delete {f}: {ex}")
-            print("[Cache] Cleaned.")
+def _releases_mtime(project):
+    try:
+        return (CACHE_DIR / project / "releases").stat().st_mtime_ns
+    except OSError:
+        return None
 
-# ---------- Unified Search (catalog or cache) ----------
-def draw_project_selection(projects):
-    clear_screen()
-    show_stats()
-    print("\n[Project Selection]   [Type 'h' for Help | 'k' for Project Help | 'c' for Credits]")
-    for i, p in enumerate(projects, 1):
-        print(f"  {i}) {p}")
+def _save_inventory(project, mtime, ids):
+    _INVENTORY[project] = (mtime, ids)
+    try:
+        write_file_atomic(CACHE_DIR / project / "inventory.json", json.dumps({"mtime": mtime, "manifests": sorted(ids)}))
+    except OSError as ex:
+        print(f"[Warn] Could not save cache inventory for {project}: {ex}")
 
-def search_data(source="catalog", page_size=20):
-    if source == "catalog":
-        projects = list(CATALOG.keys())
-    else:
-        projects = [p for p in CATALOG.keys() if (CACHE_DIR / p).exists()]
-    if not projects:
-        print("[Info] No projects available.")
-        input_with_help("Press Enter to return...")
-        return None, [], None, None
+def cached_manifest_ids(project):
+    """
+    frozenset of the manifest IDs cached for a project. Costs one stat while nothing changed.
+    """
+    mtime = _releases_mtime(project)
+    if mtime is None:
+        return frozenset()
+    with _INVENTORY_LOCK:
+        known = _INVENTORY.get(project)
+        if known and known[0] == mtime:
+            return known[1]
+        try:
+            saved = json.loads((CACHE_DIR / project / "inventory.json").read_text(encoding="utf-8"))
+            if saved.get("mtime") == mtime:
+                ids = frozenset(saved["manifests"])
+                _INVENTORY[project] = (mtime, ids)
+                return ids
+        except (OSError, ValueError, KeyError):
+            pass
+        with os.scandir(CACHE_DIR / project / "releases") as it:
+            ids = frozenset(e.name[:-len(".manifest")] for e in it if e.name.endswith(".manifest"))
+        # inventory.json lives next to releases/, so saving it does not change the mtime we record
+        _save_inventory(project, mtime, ids)
+        return ids
 
-    regex = ""
-    realm = None
-    plat = None
-    page = 0
+def add_to_inventory(project, manifest_id):
+    """
+    Record a manifest we just wrote without rescanning the directory.
+    """
+    with _INVENTORY_LOCK:
+        known = _INVENTORY.get(project)
+        if known is None:
+            return
+        mtime = _releases_mtime(project)
+        _save_inventory(project, mtime, known[1] | {manifest_id})
 
-    draw_project_selection(projects)
-    choice = ask_number("Select project: ", 1, len(projects), redraw=lambda: draw_project_selection(projects))
-    project = projects[choice - 1]
+def remove_from_inventory(project, manifest_id):
+    with _INVENTORY_LOCK:
+        known = _INVENTORY.get(project)
+        if known is None:
+            return
+        mtime = _releases_mtime(project)
+        _save_inventory(project, mtime, known[1] - {manifest_id})
 
-    while True:
-        clear_screen()
-        results = []
-        if source == "catalog":
-            items = CATALOG[project].items()
-        else:
-            items = []
-            for m in (CACHE_DIR / project).rglob("*.manifest"):
-                mid = m.stem
-                entry = CATALOG[project].get(mid)
-                if entry:
-                    items.append((mid, entry))
-
-        for mid, entry in items:
-            if regex and not re.search(regex, entry.get("version", "")):
-                continue
-            if realm and realm not in entry.get("realms", []):
-                continue
-            if plat and entry.get("platform") != plat:
-                continue
-            results.append((mid, entry))
-        results.sort(key=lambda x: x[1].get("timestamp", ""), reverse=True)
+# ---------- Cache Budget ----------
+# Last use of every bundle and manifest is kept in Cache/cache-usage.json.
+# Files in use by a running batch are pinned and never evicted.
+_CACHE_USAGE = None
+_CACHE_LOCK = threading.RLock()
+_CACHE_PINNED = {}
 
-        show_stats()
-        print(f"\n[Current Filter] project={project}, version_regex='{regex or 'ALL'}', platform={plat or 'ANY'}, realm={realm or 'ANY'}")
-        print(f"[Info] Results after filters: {len(results)}\n")
+def _cache_key(path):
+    path = Path(path).resolve()
+    try:
+        return path.relative_to(CACHE_DIR.resolve()).as_posix()
+    except ValueError:
+        return path.as_posix()
 
-        start = page * page_size
+def load_cache_usage():
+    global _CACHE_USAGE
+    if _CACHE_USAGE is None:
+        try:
+            _CACHE_USAGE = json.loads(CACHE_USAGE_PATH.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            _CACHE_USAGE = {}
+    return _CACHE_USAGE
+
+def save_cache_usage():
+    with _CACHE_LOCK:
+        try:
+            CACHE_USAGE_PATH.parent.mkdir(parents=True, exist_ok=True)
+            write_file_atomic(CACHE_USAGE_PATH, json.dumps(load_cache_usage()))
+        except OSError as ex:
+            print(f"[Warn] Could not save cache usage: {ex}")
+
+def touch_cache(path):
+    with _CACHE_LOCK:
+        load_cache_usage()[_cache_key(path)] = time.time()
+
+def pin_cache(*paths):
+    with _CACHE_LOCK:
+        for p in paths:
+            key = _cache_key(p)
+            _CACHE_PINNED[key] = _CACHE_PINNED.get(key, 0) + 1
+            load_cache_usage()[key] = time.time()
+
+def unpin_cache(*paths):
+    with _CACHE_LOCK:
+        for p in paths:
+            key = _cache_key(p)
+            load_cache_usage()[key] = time.time()
+            if _CACHE_PINNED.get(key, 0) <= 1:
+                _CACHE_PINNED.pop(key, None)
+            else:
+                _CACHE_PINNED[key] -= 1
+
+def cache_files():
+    """
+    Every evictable file under Cache/: [(last use, size, path)].
+    Files we have no record of count as last used when they were last modified.
+    """
+    usage = load_cache_usage()
+    out = []
+    if not CACHE_DIR.exists():
+        return out
+    for proj_dir in CACHE_DIR.iterdir():
+        if not proj_dir.is_dir():
+            continue
+        for pattern in ("bundles/*.bundle", "releases/*.manifest"):
+            for f in proj_dir.glob(pattern):
+                try:
+                    st = f.stat()
+                except OSError:
+                    continue
+                out.append((usage.get(_cache_key(f), st.st_mtime), st.st_size, f))
+    return out
+
+@profiled("cache.budget")
+def enforce_cache_budget(budget_mb=CACHE_BUDGET_MB, low_water_mb=CACHE_LOW_WATER_MB):
+    """
+    If the cache is over budget, delete least recently used bundles and manifests
+    until it is under the low-water mark. Returns the bytes freed.
+    """
+    with _CACHE_LOCK:
+        try:
+            files = cache_files()
+            total = sum(size for _, size, _ in files)
+            if total <= budget_mb * 1024 * 1024:
+                return 0
+            target = low_water_mb * 1024 * 1024
+            usage = load_cache_usage()
+            freed = 0
+            for last_use, size, f in sorted(files, key=lambda x: x[0]):
+                if total - freed <= target:
+                    break
+                key = _cache_key(f)
+                if key in _CACHE_PINNED:
+                    continue
+                try:
+                    f.unlink()
+                except OSError as ex:
+                    print(f"[Warn] Could not delete {f}: {ex}")
+                    continue
+                usage.pop(key, None)
+                if f.suffix == ".manifest":
+                    remove_from_inventory(f.parent.parent.name, f.stem)
+                freed += size
+                print(f"[Cache] Evicted {key} ({format_mb(size)}, last used {time.strftime('%Y-%m-%d %H:%M', time.localtime(last_use))})")
+            if total - freed > target:
+                print(f"[Warn] Cache is {format_mb(total - freed)}, but everything left is in use.")
+            return freed
+        finally:
+            # Also keeps what touch_cache recorded when nothing had to be evicted
+            save_cache_usage()
+
+# ---------- Manifest Reader ----------
+# Minimal reader for the RMAN .manifest files cached in Cache/<project>/releases/.
+# A manifest is a 28 byte header followed by a zstd compressed flatbuffer body holding
+# bundles (with their chunks), languages, files and directories.
+# Only reading is supported, and it needs the optional zstandard package.
+
+RMAN_HEADER = struct.Struct("<4sBBHIIQI")
+_U8 = struct.Struct("<B")
+_U16 = struct.Struct("<H")
+_U32 = struct.Struct("<I")
+_I32 = struct.Struct("<i")
+_U64 = struct.Struct("<Q")
+
+# Hash used for chunk IDs, by the hash_type of a file's params entry
+HASH_NONE, HASH_SHA512, HASH_SHA256, HASH_RITO_HKDF = 0, 1, 2, 3
+
+ManifestFile = namedtuple("ManifestFile", "path size langs chunk_ids link hash_type")
+ManifestChunk = namedtuple("ManifestChunk", "id bundle_id offset compressed_size uncompressed_size")
+
+class _FlatTable:
+    """
+    One flatbuffer table: a position in the buffer plus its vtable.
+    """
+    __slots__ = ("buf", "pos", "vt", "vt_size")
+
+    def __init__(self, buf, pos):
+        self.buf = buf
+        self.pos = pos
+        self.vt = pos - _I32.unpack_from(buf, pos)[0]
+        self.vt_size = _U16.unpack_from(buf, self.vt)[0]
+
+    def _offset(self, field):
+        o = 4 + 2 * field
+        if o >= self.vt_size:
+            return 0
+        return _U16.unpack_from(self.buf, self.vt + o)[0]
+
+    def scalar(self, field, fmt, default=0):
+        off = self._offset(field)
+        return fmt.unpack_from(self.buf, self.pos + off)[0] if off else default
+
+    def _ref(self, field):
+        off = self._offset(field)
+        if not off:
+            return None
+        p = self.pos + off
+        return p + _U32.unpack_from(self.buf, p)[0]
+
+    def string(self, field):
+        p = self._ref(field)
+        if p is None:
+            return ""
+        n = _U32.unpack_from(self.buf, p)[0]
+        return bytes(self.buf[p + 4:p + 4 + n]).decode("utf-8", "replace")
+
+    def tables(self, field):
+        p = self._ref(field)
+        if p is None:
+            return []
+        n = _U32.unpack_from(self.buf, p)[0]
+        out = []
+        for k in range(n):
+            e = p + 4 + 4 * k
+            out.append(_FlatTable(self.buf, e + _U32.unpack_from(self.buf, e)[0]))
+        return out
+
+    def u64_vector(self, field):
+        p = self._ref(field)
+        if p is None:
+            return ()
+        n = _U32.unpack_from(self.buf, p)[0]
+        return struct.unpack_from(f"<{n}Q", self.buf, p + 4)
+
+class Manifest:
+    """
+    Parsed RMAN manifest.
+      files:     list of ManifestFile, paths use "/" separators
+      chunks:    {chunk_id: ManifestChunk}
+      bundles:   {bundle_id: [chunk_id, ...]} in bundle order
+      languages: {language_id: name}
+    """
+    def __init__(self, manifest_id, files, chunks, bundles, languages):
+        self.manifest_id = manifest_id
+        self.files = files
+        self.chunks = chunks
+        self.bundles = bundles
+        self.languages = languages
+
+    def language_tags(self):
+        return sorted(set(self.languages.values()))
+
+def read_manifest_header(data):
+    """
+    Returns (manifest_id, body offset, body length, decompressed length) or raises ValueError.
+    """
+    if len(data) < RMAN_HEADER.size:
+        raise ValueError("manifest is truncated")
+    magic, major, minor, flags, offset, length, manifest_id, body_size = RMAN_HEADER.unpack_from(data)
+    if magic != b"RMAN":
+        raise ValueError("not an RMAN manifest")
+    if offset + length > len(data):
+        raise ValueError("manifest body is truncated")
+    return manifest_id, offset, length, body_size
+
+@profiled("manifest.parse")
+def parse_manifest(data):
+    if zstandard is None:
+        raise RuntimeError("reading manifests needs the zstandard package (pip install zstandard)")
+    manifest_id, offset, length, body_size = read_manifest_header(data)
+    body = zstandard.ZstdDecompressor().decompress(bytes(data[offset:offset + length]), max_output_size=body_size)
+    root = _FlatTable(body, _U32.unpack_from(body, 0)[0])
+
+    chunks = {}
+    bundles = {}
+    for bundle in root.tables(0):
+        bundle_id = bundle.scalar(0, _U64)
+        ids = []
+        pos = 0
+        for c in bundle.tables(1):
+            cid = c.scalar(0, _U64)
+            comp = c.scalar(1, _U32)
+            chunks[cid] = ManifestChunk(cid, bundle_id, pos, comp, c.scalar(2, _U32))
+            ids.append(cid)
+            pos += comp
+        bundles[bundle_id] = ids
+
+    languages = {lang.scalar(0, _U8): lang.string(1) for lang in root.tables(1)}
+    hash_types = [p.scalar(1, _U8) for p in root.tables(5)]
+
+    dirs = {}
+    for d in root.tables(3):
+        dirs[d.scalar(0, _U64)] = (d.scalar(1, _U64), d.string(2))
+
+    @functools.lru_cache(maxsize=None)
+    def dir_path(dir_id):
+        if dir_id not in dirs:
+            return ""
+        parent, name = dirs[dir_id]
+        if parent == dir_id or not name:
+            return dir_path(parent) if parent != dir_id else ""
+        head = dir_path(parent)
+        return f"{head}/{name}" if head else name
+
+    files = []
+    for f in root.tables(2):
+        mask = f.scalar(4, _U64)
+        langs = tuple(name for lid, name in languages.items() if lid and mask & (1 << (lid - 1)))
+        head = dir_path(f.scalar(1, _U64))
+        name = f.string(3)
+        params_index = f.scalar(11, _U8)
+        hash_type = hash_types[params_index] if params_index < len(hash_types) else HASH_NONE
+        files.append(ManifestFile(
+            f"{head}/{name}" if head else name,
+            f.scalar(2, _U32), langs, f.u64_vector(7), f.string(9), hash_type,
+        ))
+    return Manifest(manifest_id, files, chunks, bundles, languages)
+
+@functools.lru_cache(maxsize=8)
+def _load_manifest_cached(path, mtime_ns):
+    return parse_manifest(Path(path).read_bytes())
+
+def load_manifest(path):
+    """
+    Parse a cached manifest file. Parsed manifests are kept until the file changes.
+    """
+    path = Path(path)
+    return _load_manifest_cached(str(path), path.stat().st_mtime_ns)
+
+def select_files(manifest, langs=None, file_filter=None):
+    """
+    The files rman-dl would write for a given -l language filter and -p path regex.
+    Files without languages count as "none". Both filters are case-insensitive.
+    """
+    wanted = {l.lower() for l in langs.split("|")} if langs else None
+    pattern = re.compile(file_filter, re.IGNORECASE) if file_filter else None
+    out = []
+    for f in manifest.files:
+        if wanted is not None:
+            tags = {l.lower() for l in f.langs} or {"none"}
+            if not tags & wanted:
+                continue
+        if pattern and not pattern.search(f.path):
+            continue
+        out.append(f)
+    return out
+
+def read_bundle_chunk_ids(path):
+    """
+    Chunk IDs stored in a bundle file, read from its RBUN table of contents.
+    The footer is [checksum u64][entry count u32][version u32]["RBUN"], preceded by
+    one 16 byte entry per chunk that starts with the chunk ID.
+    Returns None if the file does not end in a readable table of contents.
+    """
+    try:
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            end = f.tell()
+            if end < 20:
+                return None
+            f.seek(end - 20)
+            footer = f.read(20)
+            if footer[16:] != b"RBUN":
+                return None
+            count = _U32.unpack_from(footer, 8)[0]
+            toc_size = count * 16
+            if toc_size > end - 20:
+                return None
+            f.seek(end - 20 - toc_size)
+            toc = f.read(toc_size)
+    except OSError:
+        return None
+    return {_U64.unpack_from(toc, k * 16)[0] for k in range(count)}
+
+def shard_cached_chunk_ids(project, shard=0):
+    """
+    The chunk IDs in one cache bundle shard of a project (empty if its table of contents is unreadable).
+    rman-dl only reuses chunks from the bundle it is given, so this is all a job on that shard finds cached.
+    """
+    return read_bundle_chunk_ids(cache_bundle_path(project, shard)) or set()
+
+def plan_manifest(manifest, langs=None, file_filter=None, cached_ids=frozenset()):
+    """
+    Pre-flight numbers for one download: what rman-dl will fetch, reuse from the cache and write.
+    """
+    files = select_files(manifest, langs, file_filter)
+    needed = {cid for f in files for cid in f.chunk_ids}
+    chunks = manifest.chunks
+    total = sum(chunks[cid].compressed_size for cid in needed if cid in chunks)
+    cached = sum(chunks[cid].compressed_size for cid in needed & cached_ids if cid in chunks)
+    return {
+        "files": len(files),
+        "disk_bytes": sum(f.size for f in files),
+        "chunk_ids": needed,
+        "total_bytes": total,
+        "cached_bytes": cached,
+        "download_bytes": total - cached,
+    }
+
+def read_job_chunks(job, sketch=True):
+    """
+    Read what a job selects from its manifest, once for both ordering and planning:
+    job["selection"] = (files, disk bytes, chunk IDs, their compressed sizes) and job["sketch"]
+    (None unless asked for).
+    The chunks are kept as two arrays, a large batch holds one pair per job until it is planned.
+    A manifest that cannot be read leaves both None.
+    """
+    try:
+        manifest = load_manifest(job["manifest_path"])
+    except (OSError, ValueError, RuntimeError, struct.error) as ex:
+        job["selection"] = job["sketch"] = None
+        print(f"[Warn] No pre-flight plan for {job['label']}: {ex}")
+        return
+    files = select_files(manifest, job.get("langs"), job.get("file_filter"))
+    chunks = manifest.chunks
+    needed = {cid for f in files for cid in f.chunk_ids if cid in chunks}
+    ids = array.array("Q", needed)
+    sizes = array.array("Q", (chunks[cid].compressed_size for cid in ids))
+    job["selection"] = (len(files), sum(f.size for f in files), ids, sizes)
+    job["sketch"] = chunk_sketch(needed) if sketch else None
+
+@profiled("plan.jobs")
+def plan_jobs(project, jobs):
+    """
+    Plan a list of rman-dl jobs the way run_rman_jobs runs them: each job on its cache shard
+    (job["shard"], see assign_shards), where only that shard's bundle and the chunks of the
+    jobs before it on the same shard are cached.
+    Each job gets a "plan" key (None if its manifest could not be read).
+    Returns the batch totals, or None if no manifest could be read at all.
+    """
+    shard_ids = {}
+    totals = {"files": 0, "disk_bytes": 0, "total_bytes": 0, "cached_bytes": 0, "download_bytes": 0}
+    planned = 0
+    for job in jobs:
+        if "selection" not in job:
+            read_job_chunks(job, sketch=False)
+        job.pop("sketch", None)
+        selection = job.pop("selection")
+        if selection is None:
+            job["plan"] = None
+            continue
+        files, disk_bytes, ids, sizes = selection
+        shard = job.get("shard", 0)
+        if shard not in shard_ids:
+            shard_ids[shard] = shard_cached_chunk_ids(project, shard)
+        cached_ids = shard_ids[shard]
+        total = sum(sizes)
+        cached = 0
+        if not cached_ids.isdisjoint(ids):
+            cached = sum(size for cid, size in zip(ids, sizes) if cid in cached_ids)
+        cached_ids.update(ids)
+        job["plan"] = plan = {"files": files, "disk_bytes": disk_bytes, "total_bytes": total,
+                              "cached_bytes": cached, "download_bytes": total - cached}
+        planned += 1
+        for k in totals:
+            totals[k] += plan[k]
+    return totals if planned else None
+
+# rman-dl only reuses chunks from the cache bundle of its own worker, so a batch is cheapest
+# when builds that share chunks run back to back on one shard. The chunks each job selects are
+# summarized by a bottom-k sketch (chunk IDs are hashes, so the k smallest are a fair sample)
+# and jobs are chained by estimated overlap.
+SKETCH_SIZE = 256
+CHAIN_MIN_SIMILARITY = 0.1
+
+def chunk_sketch(chunk_ids, k=SKETCH_SIZE):
+    return frozenset(heapq.nsmallest(k, chunk_ids))
+
+def chain_order(job):
+    """
+    Sort key order_jobs builds chains in.
+    """
+    return job["entry"].get("platform") or "", job["entry"].get("timestamp") or ""
+
+def sketch_similarity(a, b, k=SKETCH_SIZE):
+    """
+    Estimated Jaccard similarity of the chunk sets behind two sketches.
+    """
+    union = heapq.nsmallest(k, a | b)
+    if not union:
+        return 0.0
+    both = a & b
+    return sum(1 for cid in union if cid in both) / len(union)
+
+@profiled("plan.order")
+def order_jobs(jobs):
+    """
+    Reorder jobs for chunk reuse: by platform, then into chains of builds that share chunks
+    (adjacent versions, overlapping language filters), each chain oldest to newest.
+    The chunks of each job come from the "sketch" read_job_chunks left on it, so plan_jobs
+    does not read the manifests again. Sets job["chain"] and returns the jobs in chain order.
+    """
+    # [platform, sketch of the last job, jobs]
+    chains = []
+    for job in sorted(jobs, key=chain_order):
+        sketch = job.pop("sketch", None)
+        platform = job["entry"].get("platform")
+        best, best_sim = None, CHAIN_MIN_SIMILARITY
+        if sketch is not None:
+            for chain in chains:
+                if chain[0] != platform or chain[1] is None:
+                    continue
+                sim = sketch_similarity(chain[1], sketch)
+                if sim >= best_sim:
+                    best, best_sim = chain, sim
+        if best is None:
+            best = [platform, sketch, []]
+            chains.append(best)
+        best[1] = sketch
+        best[2].append(job)
+
+    ordered = []
+    for n, (_, _, chain_jobs) in enumerate(chains):
+        for job in chain_jobs:
+            job["chain"] = n
+            ordered.append(job)
+    return ordered
+
+def job_lanes(jobs, workers):
+    """
+    Group jobs into lanes that each run in order on one cache shard: one lane per chain,
+    or per job for jobs without one. While there are fewer lanes than workers, the longest
+    lane is split in two, so a batch of one long chain still uses every worker.
+    """
+    lanes = {}
+    for job in jobs:
+        lanes.setdefault(job.get("chain", id(job)), []).append(job)
+    lanes = list(lanes.values())
+    while len(lanes) < workers:
+        longest = max(lanes, key=len)
+        if len(longest) < 2:
+            break
+        i = lanes.index(longest)
+        half = len(longest) // 2
+        lanes[i:i + 1] = [longest[:half], longest[half:]]
+    return lanes
+
+def assign_shards(jobs, workers):
+    """
+    Give every job the cache shard it runs on, before planning, so the plan knows which
+    chunks each job finds cached. Lanes (see job_lanes) go longest first to the shard with
+    the fewest jobs so far. Sets job["shard"] and returns the number of shards used.
+    """
+    workers = max(1, min(workers, len(jobs), MAX_RMAN_WORKERS))
+    lanes = job_lanes(jobs, workers)
+    load = [0] * min(workers, len(lanes))
+    for lane in sorted(lanes, key=len, reverse=True):
+        shard = load.index(min(load))
+        load[shard] += len(lane)
+        for job in lane:
+            job["shard"] = shard
+    return len(load)
+
+def print_plan(jobs, totals):
+    for job in jobs:
+        plan = job.get("plan")
+        if plan:
+            print(f"[Plan] {job['label']}: {plan['files']} files, {format_mb(plan['disk_bytes'])} on disk, "
+                  f"fetch {format_mb(plan['download_bytes'])} ({format_mb(plan['cached_bytes'])} from cache)")
+    free = shutil.disk_usage(BUILDS_DIR if BUILDS_DIR.exists() else ROOT).free
+    print(f"[Plan] Total: fetch {format_mb(totals['download_bytes'])}, {format_mb(totals['cached_bytes'])} from cache, "
+          f"{format_mb(totals['disk_bytes'])} on disk, {format_mb(free)} free")
+    if totals["disk_bytes"] > free:
+        print("[Warn] Not enough free disk space for this batch.")
+    return totals["disk_bytes"] <= free
+
+# ---------- File Index ----------
+# Cache/<project>/file-index.db (SQLite) lists every file of every manifest that was cached:
+# path, size, languages and a content hash (of the file's chunk IDs, which rman derives from
+# the data). "Which builds contain X" or "when did X change" is then one query instead of a
+# pass over every manifest. Manifests are indexed on a background thread as they are fetched,
+# and sync_file_index catches up on the rest (cached before the index existed, or still queued
+# when the script exited). Rows stay when the cache evicts a manifest, so a file's history is kept.
+
+FILE_INDEX_NAME = "file-index.db"
+
+_FILE_INDEXES = {}
+_FILE_INDEX_LOCK = threading.Lock()
+
+def file_index_db(project):
+    """
+    (connection, {path: path id}) of a project's file index, opened once.
+    """
+    with _FILE_INDEX_LOCK:
+        known = _FILE_INDEXES.get(project)
+        if known is None:
+            path = CACHE_DIR / project / FILE_INDEX_NAME
+            path.parent.mkdir(parents=True, exist_ok=True)
+            db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+            db.executescript("""
+                CREATE TABLE IF NOT EXISTS manifests (
+                    id INTEGER PRIMARY KEY,
+                    manifest_id TEXT NOT NULL UNIQUE,
+                    version TEXT,
+                    timestamp TEXT,
+                    platform TEXT,
+                    files INTEGER
+                );
+                CREATE TABLE IF NOT EXISTS paths (
+                    id INTEGER PRIMARY KEY,
+                    path TEXT NOT NULL UNIQUE
+                );
+                CREATE TABLE IF NOT EXISTS files (
+                    path_id INTEGER NOT NULL,
+                    manifest INTEGER NOT NULL,
+                    size INTEGER NOT NULL,
+                    hash INTEGER NOT NULL,
+                    langs TEXT,
+                    PRIMARY KEY (path_id, manifest)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS files_by_manifest ON files (manifest);
+            """)
+            # Paths repeat across hundreds of manifests, so they are stored once and kept in memory
+            ids = {p: i for i, p in db.execute("SELECT id, path FROM paths")}
+            known = _FILE_INDEXES[project] = (db, ids)
+    return known
+
+def content_hash(chunk_ids):
+    # Signed, so it fits an SQLite INTEGER
+    digest = hashlib.blake2b(struct.pack(f"<{len(chunk_ids)}Q", *chunk_ids), digest_size=8).digest()
+    return int.from_bytes(digest, "little", signed=True)
+
+def indexed_manifest_ids(project):
+    db, _ = file_index_db(project)
+    with _FILE_INDEX_LOCK:
+        return {r[0] for r in db.execute("SELECT manifest_id FROM manifests")}
+
+@profiled("files.index_manifest")
+def index_manifest(project, manifest_id, path):
+    """
+    Add one cached manifest to the project's file index, unless it is already there.
+    """
+    db, ids = file_index_db(project)
+    with _FILE_INDEX_LOCK:
+        if db.execute("SELECT 1 FROM manifests WHERE manifest_id = ?", (manifest_id,)).fetchone():
+            return False
+    manifest = load_manifest(path)
+    entry = (CATALOG[project].get(manifest_id) if project in CATALOG else None) or {}
+    rows = [(f.path, f.size, content_hash(f.chunk_ids), "|".join(f.langs) or None) for f in manifest.files]
+    with _FILE_INDEX_LOCK, db:
+        cur = db.execute("INSERT OR IGNORE INTO manifests (manifest_id, version, timestamp, platform, files) VALUES (?, ?, ?, ?, ?)",
+                         (manifest_id, entry.get("version"), entry.get("timestamp"), entry.get("platform"), len(rows)))
+        if not cur.rowcount:
+            return False
+        mid = cur.lastrowid
+        for p, _, _, _ in rows:
+            if p not in ids:
+                ids[p] = db.execute("INSERT INTO paths (path) VALUES (?)", (p,)).lastrowid
+        db.executemany("INSERT OR REPLACE INTO files (path_id, manifest, size, hash, langs) VALUES (?, ?, ?, ?, ?)",
+                       [(ids[p], mid, size, h, langs) for p, size, h, langs in rows])
+    return True
+
+def try_index_manifest(project, manifest_id, path):
+    # The index is a convenience, a manifest that cannot be read must not fail its download
+    try:
+        index_manifest(project, manifest_id, path)
+    except (OSError, ValueError, RuntimeError, struct.error, sqlite3.Error) as ex:
+        if zstandard is not None:
+            print(f"[Warn] Could not index manifest {manifest_id}: {ex}")
+
+class FileIndexer:
+    """
+    Indexes newly fetched manifests on one background thread, so fetching never waits on parsing.
+    """
+    def __init__(self):
+        self._pending = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def add(self, project, manifest_id, path):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="file-index", daemon=True)
+                self._thread.start()
+        self._pending.put((project, manifest_id, path))
+
+    def _run(self):
+        while True:
+            project, manifest_id, path = self._pending.get()
+            try:
+                try_index_manifest(project, manifest_id, path)
+            except Exception as ex:
+                print(f"[Warn] Could not index manifest {manifest_id}: {ex}")
+            finally:
+                self._pending.task_done()
+
+    def wait(self):
+        self._pending.join()
+
+FILE_INDEXER = FileIndexer()
+
+@profiled("files.sync")
+def sync_file_index(project):
+    """
+    Index every cached manifest that is not in the file index yet. Returns how many were added.
+    """
+    FILE_INDEXER.wait()
+    missing = sorted(cached_manifest_ids(project) - indexed_manifest_ids(project))
+    # Manifests indexed before their catalog entry arrived get its version now
+    db, _ = file_index_db(project)
+    with _FILE_INDEX_LOCK, db:
+        unknown = [r[0] for r in db.execute("SELECT manifest_id FROM manifests WHERE version IS NULL")]
+        entries = CATALOG[project] if project in CATALOG else {}
+        db.executemany("UPDATE manifests SET version = ?, timestamp = ?, platform = ? WHERE manifest_id = ?",
+                       [(entries[mid].get("version"), entries[mid].get("timestamp"), entries[mid].get("platform"), mid)
+                        for mid in unknown if mid in entries])
+    for n, mid in enumerate(missing, 1):
+        print(f"\r[Files] Indexing {project} manifests: {n}/{len(missing)}", end="", flush=True)
+        try_index_manifest(project, mid, CACHE_DIR / project / "releases" / f"{mid}.manifest")
+    if missing:
+        print()
+    return len(missing)
+
+def find_indexed_files(project, pattern, limit=None):
+    """
+    ({path: [(manifest id, version, timestamp, platform, size, hash, langs)]}, number of matching paths)
+    for the indexed paths matching the regex `pattern` (case-insensitive), each list oldest first.
+    """
+    rx = re.compile(pattern, re.IGNORECASE)
+    db, ids = file_index_db(project)
+    with _FILE_INDEX_LOCK:
+        matched = {i: p for p, i in ids.items() if rx.search(p)}
+    path_ids = sorted(matched, key=matched.get)[:limit]
+    found = {}
+    with _FILE_INDEX_LOCK:
+        for i in path_ids:
+            found[matched[i]] = db.execute("""
+                SELECT m.manifest_id, m.version, m.timestamp, m.platform, f.size, f.hash, f.langs
+                FROM files f JOIN manifests m ON m.id = f.manifest
+                WHERE f.path_id = ?
+                ORDER BY m.timestamp, m.manifest_id""", (i,)).fetchall()
+    return found, len(matched)
+
+def file_history(rows):
+    """
+    Per platform, the first and last rows containing a file, the rows where its content changed
+    and how many manifests have it: {platform: {"first", "last", "changes": [row], "count"}}.
+    The first appearance counts as a change.
+    """
+    history = {}
+    for row in rows:
+        h = history.setdefault(row[3] or "unknown platform", {"first": row, "last": row, "changes": [row], "count": 0})
+        if h["last"][5] != row[5]:
+            h["changes"].append(row)
+        h["last"] = row
+        h["count"] += 1
+    return history
+
+# ---------- Build Dedup ----------
+# File contents are stored once per project in Builds/<project>/.store/<sha256[:2]>/<sha256>
+# and every build gets a hardlink to them. Hardlinked files share their data, so anything
+# that rewrites a build file in place must unlink it first.
+
+def hash_file(path, block_size=1024 * 1024):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            h.update(block)
+    return h.hexdigest()
+
+def link_into_place(src, dest):
+    """
+    Replace dest with a hardlink to src, without a window where dest is missing.
+    """
+    tmp = dest.with_name(dest.name + ".dedup")
+    if tmp.exists():
+        tmp.unlink()
+    os.link(src, tmp)
+    os.replace(tmp, dest)
+
+def add_to_store(path, target):
+    """
+    Hardlink path into the store as target. Returns False if target is already stored,
+    which another build being deduped at the same time may have done a moment ago.
+    """
+    target.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        os.link(path, target)
+        return True
+    except FileExistsError:
+        return False
+
+def stored_file(path, store):
+    """
+    What to hardlink another copy of `path` to. A file that is not hardlinked yet is put into
+    the store first, so shared files only ever take up space there and the build stats add up.
+    """
+    path = Path(path)
+    if path.stat().st_nlink > 1:
+        return path
+    digest = hash_file(path)
+    target = store / digest[:2] / digest
+    if not add_to_store(path, target):
+        link_into_place(target, path)
+    return target
+
+@profiled("dedup.build")
+def dedup_build(outdir, workers=DEDUP_WORKERS, build_dir=None):
+    """
+    Move the contents of one build into its project's store. Files that are already
+    hardlinked are skipped, so running this again on a build is cheap.
+    build_dir is the build that outdir belongs to, when outdir is only part of one.
+    Returns (files linked to existing store entries, bytes saved).
+    """
+    outdir = Path(outdir)
+    build_dir = Path(build_dir or outdir)
+    store = build_dir.parent / ".store"
+    candidates = []
+    for dirpath, _, filenames in os.walk(outdir):
+        for name in filenames:
+            path = Path(dirpath) / name
+            try:
+                st = path.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            if st.st_nlink == 1 and st.st_size > 0 and not path.is_symlink():
+                candidates.append((path, st.st_size))
+
+    linked = saved = 0
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        digests = pool.map(lambda c: hash_file(c[0]), candidates)
+        for (path, size), digest in zip(candidates, digests):
+            target = store / digest[:2] / digest
+            try:
+                if add_to_store(path, target) or target.stat().st_size != size:
+                    continue
+                link_into_place(target, path)
+                linked += 1
+                saved += size
+            except OSError as ex:
+                print(f"[Warn] Could not dedup {path}: {ex}")
+                if ex.errno in (errno.EXDEV, errno.EPERM):
+                    # This filesystem cannot hardlink here, no point trying the other files
+                    break
+    refresh_build_stats(build_dir)
+    refresh_store_stats(build_dir.parent.name)
+    return linked, saved
+
+def gc_store(proj):
+    """
+    Remove store entries no build links to anymore. Returns the bytes freed.
+    """
+    store = BUILDS_DIR / proj / ".store"
+    freed = 0
+    if store.exists():
+        for f in store.rglob("*"):
+            try:
+                st = f.stat()
+                if f.is_file() and st.st_nlink == 1:
+                    f.unlink()
+                    freed += st.st_size
+            except OSError as ex:
+                print(f"[Warn] Could not remove {f}: {ex}")
+    refresh_store_stats(proj)
+    return freed
+
+def list_builds(proj):
+    proj_dir = BUILDS_DIR / proj
+    if not proj_dir.exists():
+        return []
+    return sorted(d for d in proj_dir.iterdir() if d.is_dir() and not d.name.startswith("."))
+
+# ---------- Build Upgrade ----------
+# Upgrade mode builds a new patch from an existing build of the same project and platform.
+# Files whose chunk list did not change between the two manifests are hardlinked (or copied)
+# from the old build, and only changed and added files are fetched through rman-dl's -p filter.
+
+# rman-dl gets the changed paths as -p regexes. Long lists are split so no command line
+# comes near the Windows limit of 32767 characters.
+MAX_PATH_FILTER_LEN = 16000
+
+def path_filters(paths, max_len=MAX_PATH_FILTER_LEN):
+    """
+    Exact-match regexes covering the given paths, each at most about max_len characters.
+    """
+    filters, group, size = [], [], 0
+    for p in paths:
+        # rman-dl's regex engine does not need spaces escaped
+        esc = re.escape(p).replace("\\ ", " ")
+        if group and size + len(esc) + 1 > max_len:
+            filters.append("^(?:" + "|".join(group) + ")$")
+            group, size = [], 0
+        group.append(esc)
+        size += len(esc) + 1
+    if group:
+        filters.append("^(?:" + "|".join(group) + ")$")
+    return filters
+
+def build_manifest_id(build_dir):
+    # build_output_path names builds <project>-<version>-<platform>-<manifest id>
+    return Path(build_dir).name.rsplit("-", 1)[-1]
+
+def find_base_build(project, entry, manifest_id):
+    """
+    The existing build closest to this entry, on the same platform, whose manifest is cached.
+    Older builds are preferred over newer ones. Returns (build dir, manifest path) or None.
+    """
+    cached = cached_manifest_ids(project)
+    index = get_catalog_index(project)
+    target_rank = index.rank.get(manifest_id, 0)
+    best = None
+    for d in list_builds(project):
+        mid = build_manifest_id(d)
+        base_entry = CATALOG[project].get(mid)
+        if mid == manifest_id or mid not in cached or not base_entry:
+            continue
+        if base_entry.get("platform") != entry.get("platform"):
+            continue
+        # rank 0 is the newest entry, so a larger rank is an older build
+        rank = index.rank.get(mid, 0)
+        key = (rank < target_rank, abs(rank - target_rank))
+        if best is None or key < best[0]:
+            best = (key, d, CACHE_DIR / project / "releases" / f"{mid}.manifest")
+    return best[1:] if best else None
+
+def link_unchanged_files(old, new, base_dir, outdir, langs=None, file_filter=None):
+    """
+    Link the files of `new` that are identical in `old` from base_dir into outdir,
+    through the project's dedup store.
+    Returns (files linked, bytes linked, files rman-dl still has to fetch).
+    """
+    store = Path(outdir).parent / ".store"
+    old_files = {f.path: f for f in old.files}
+    linked = linked_bytes = 0
+    fetch = []
+    for f in select_files(new, langs, file_filter):
+        prev = old_files.get(f.path)
+        src = base_dir / f.path
+        dest = outdir / f.path
+        if f.link or prev is None or prev.chunk_ids != f.chunk_ids or prev.size != f.size:
+            fetch.append(f)
+            continue
+        try:
+            if src.stat().st_size != f.size:
+                fetch.append(f)
+                continue
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            if dest.exists():
+                dest.unlink()
+            try:
+                os.link(stored_file(src, store), dest)
+            except OSError:
+                shutil.copy2(src, dest)
+        except OSError:
+            fetch.append(f)
+            continue
+        linked += 1
+        linked_bytes += f.size
+    return linked, linked_bytes, fetch
+
+def prepare_upgrade(project, job, say=print):
+    """
+    Job hook for upgrade mode: link what is unchanged and narrow rman-dl to the rest.
+    Without a usable base build the job stays a full download.
+    """
+    base = job.get("base") or find_base_build(project, job["entry"], job["manifest_id"])
+    if base is None:
+        say(f"[Upgrade] {job['label']}: no earlier build to upgrade from, downloading everything")
+        return
+    base_dir, base_manifest = base
+    try:
+        old = load_manifest(base_manifest)
+        new = load_manifest(job["manifest_path"])
+    except (OSError, ValueError, RuntimeError, struct.error) as ex:
+        say(f"[Upgrade] {job['label']}: cannot diff manifests ({ex}), downloading everything")
+        return
+    linked, linked_bytes, fetch = link_unchanged_files(old, new, Path(base_dir), Path(job["outdir"]),
+                                                       job.get("langs"), job.get("file_filter"))
+    if linked:
+        # Files of the base build may have just moved into the store
+        refresh_build_stats(base_dir)
+        refresh_store_stats(project)
+    job["file_filters"] = path_filters([f.path for f in fetch])
+    needed = {cid for f in fetch for cid in f.chunk_ids}
+    job["upgrade"] = {"base": Path(base_dir).name, "linked": linked, "fetched": len(fetch), "linked_bytes": linked_bytes,
+                      # The chunks rman-dl is left with, the linked files never touch the cache
+                      "chunk_bytes": sum(new.chunks[cid].compressed_size for cid in needed if cid in new.chunks)}
+    say(f"[Upgrade] {job['label']}: from {Path(base_dir).name}, linked {linked} files ({format_mb(linked_bytes)}), "
+        f"fetching {len(fetch)} changed or added files")
+
+# ---------- Two-part Builds ----------
+# A Legends of Runeterra (bacon) build is made of two manifests with the same version:
+# a small Client manifest and a large Data manifest. They are downloaded side by side,
+# each straight into its place inside one combined build, so nothing is copied afterwards.
+
+TWO_PART_LAYOUTS = {
+    "bacon": {"client": Path("live") / "Game", "data": Path("live") / "PatcherData" / "PatchableFiles"},
+}
+
+def pair_two_part_entries(project, results, manifests):
+    """
+    Pair up Client and Data entries of the same version and platform.
+    The Client manifest is always the much smaller one (under 1 MB against over 10 MB for Data).
+    Returns ([(client, data)], unpaired results), each item a (manifest_id, entry) tuple.
+    """
+    if project not in TWO_PART_LAYOUTS:
+        return [], list(results)
+    groups = {}
+    for mid, entry in results:
+        groups.setdefault((entry.get("version"), entry.get("platform")), []).append((mid, entry))
+    pairs, single = [], []
+    for (version, platform), items in groups.items():
+        if len(items) != 2 or not all(mid in manifests for mid, _ in items):
+            if len(items) > 2:
+                print(f"[Warn] {len(items)} entries share version {version} ({platform}), downloading them separately")
+            single += items
+            continue
+        items.sort(key=lambda item: file_size(manifests[item[0]]))
+        pairs.append((items[0], items[1]))
+    return pairs, single
+
+def two_part_jobs(project, client, data, manifests, base_langs_list, file_filter=None, dedup=DEDUP_INLINE):
+    """
+    The two rman-dl jobs of one combined build. Their outdirs are filled in by run_downloads.
+    """
+    layout = TWO_PART_LAYOUTS[project]
+    (client_mid, client_entry), (data_mid, data_entry) = client, data
+    combined_id = f"{client_mid}+{data_mid}"
+    base = build_output_path(project, combined_id, client_entry).name
+    jobs = []
+    for part, (mid, entry) in (("data", data), ("client", client)):
+        jobs.append({
+            "label": f"{base}-{part}",
+            "manifest_id": mid,
+            "entry": entry,
+            "manifest_path": manifests[mid],
+            "langs": entry_langs(project, entry, base_langs_list),
+            "file_filter": file_filter,
+            "dedup": dedup,
+            "combined_id": combined_id,
+            "subdir": layout[part],
+        })
+    return jobs
+
+# ---------- Build Verify ----------
+# A build is checked against its cached manifest: every expected file must exist with the
+# right size, and every chunk of it must hash to its chunk ID. Hashing runs in a process
+# pool over memory-mapped files, and large files are split into ranges, so one big file
+# does not keep the check on a single core. Damaged files become -p filters for rman-dl.
+
+# Windows cannot run a process pool of more than 61 workers
+VERIFY_MAX_WORKERS = 61
+VERIFY_WORKERS = min(VERIFY_MAX_WORKERS, os.cpu_count() or 4)
+# Bytes of chunks hashed per task
+VERIFY_TASK_BYTES = 64 * MB
+
+def chunk_hash(data, hash_type):
+    """
+    The chunk ID rman computes for uncompressed chunk data, or None for unknown hash types.
+    """
+    if hash_type == HASH_SHA512:
+        digest = hashlib.sha512(data).digest()
+    elif hash_type == HASH_SHA256:
+        digest = hashlib.sha256(data).digest()
+    elif hash_type == HASH_RITO_HKDF:
+        # PBKDF2-HMAC-SHA256 keyed with the chunk's SHA-256, no salt, 32 rounds
+        digest = hashlib.pbkdf2_hmac("sha256", hashlib.sha256(data).digest(), b"", 32, 8)
+    else:
+        return None
+    return _U64.unpack_from(digest)[0]
+
+def _verify_range(task):
+    """
+    Process pool worker: hash a run of consecutive chunks of one file.
+    Returns (manifest path, problem or None).
+    """
+    rel, path, offset, chunks, hash_type = task
+    try:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            for cid, size in chunks:
+                with memoryview(m)[offset:offset + size] as data:
+                    if len(data) != size or chunk_hash(data, hash_type) != cid:
+                        return rel, f"chunk {cid:016X} at offset {offset} does not match"
+                offset += size
+    except (OSError, ValueError) as ex:
+        return rel, str(ex)
+    return rel, None
+
+def verify_tasks(manifest, files, root, damaged):
+    """
+    Check existence and sizes here, and return the hashing tasks for the files that pass.
+    Problems found on the way are added to `damaged`.
+    """
+    tasks = []
+    total = 0
+    for f in files:
+        if f.link:
+            continue
+        full = root / f.path
+        try:
+            size = full.stat().st_size
+        except OSError:
+            damaged[f.path] = "missing"
+            continue
+        if size != f.size:
+            damaged[f.path] = f"size is {size}, expected {f.size}"
+            continue
+        if f.hash_type not in (HASH_SHA512, HASH_SHA256, HASH_RITO_HKDF) or not f.size:
+            continue
+        if any(cid not in manifest.chunks for cid in f.chunk_ids):
+            # Part of the file could not be hashed, so it must not pass as intact
+            damaged[f.path] = "chunk table incomplete"
+            continue
+        run, run_bytes, start = [], 0, 0
+        for cid in f.chunk_ids:
+            chunk = manifest.chunks[cid]
+            run.append((cid, chunk.uncompressed_size))
+            run_bytes += chunk.uncompressed_size
+            if run_bytes >= VERIFY_TASK_BYTES:
+                tasks.append((f.path, str(full), start, run, f.hash_type))
+                start += run_bytes
+                run, run_bytes = [], 0
+        if run:
+            tasks.append((f.path, str(full), start, run, f.hash_type))
+        total += f.size
+    return tasks, total
+
+def build_parts(project, build_dir):
+    """
+    [(manifest ID, folder)] of a build: one part, or the halves of a two-part build.
+    """
+    mid = build_manifest_id(build_dir)
+    if "+" in mid and project in TWO_PART_LAYOUTS:
+        client, data = mid.split("+", 1)
+        layout = TWO_PART_LAYOUTS[project]
+        return [(client, build_dir / layout["client"]), (data, build_dir / layout["data"])]
+    return [(mid, build_dir)]
+
+def build_filters(build_dir):
+    """
+    The language filter (from <build>_filter.txt) and file filter (from the download queue) a build was made with.
+    """
+    build_dir = Path(build_dir)
+    try:
+        langs = (build_dir.parent / f"{build_dir.name}_filter.txt").read_text(encoding="utf-8").strip() or None
+    except OSError:
+        langs = None
+    rows = queue_execute("SELECT file_filter FROM downloads WHERE outdir = ? OR outdir LIKE ?",
+                         (str(build_dir), str(build_dir) + os.sep + "%"))
+    return langs, (rows[0]["file_filter"] if rows else None)
+
+@profiled("verify.build")
+def verify_build(project, build_dir, langs=None, file_filter=None, workers=VERIFY_WORKERS):
+    """
+    Verify one build against its cached manifest(s).
+    Returns {"damaged": {part folder: {path: problem}}, "files", "bytes", "elapsed"}.
+    """
+    build_dir = Path(build_dir)
+    start = time.monotonic()
+    result = {"damaged": {}, "files": 0, "bytes": 0, "manifests": {}}
+    tasks = []
+    for mid, folder in build_parts(project, build_dir):
+        manifest_path = CACHE_DIR / project / "releases" / f"{mid}.manifest"
+        if not manifest_path.exists():
+            manifest_path = download_manifest(project, mid)
+        manifest = load_manifest(manifest_path)
+        files = select_files(manifest, langs, file_filter)
+        damaged = result["damaged"].setdefault(folder, {})
+        part_tasks, total = verify_tasks(manifest, files, folder, damaged)
+        tasks += [(folder,) + t for t in part_tasks]
+        result["files"] += len(files)
+        result["bytes"] += total
+        result["manifests"][folder] = manifest_path
+
+    def check(task):
+        return task[0], _verify_range(task[1:])
+
+    if workers > 1 and len(tasks) > 1:
+        workers = min(workers, VERIFY_MAX_WORKERS)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            chunksize = max(1, len(tasks) // (workers * 16))
+            checked = zip((t[0] for t in tasks), pool.map(_verify_range, [t[1:] for t in tasks], chunksize=chunksize))
+            for folder, (rel, problem) in checked:
+                if problem:
+                    result["damaged"][folder].setdefault(rel, problem)
+    else:
+        for folder, (rel, problem) in map(check, tasks):
+            if problem:
+                result["damaged"][folder].setdefault(rel, problem)
+    result["elapsed"] = time.monotonic() - start
+    return result
+
+def write_repair_list(build_dir, damaged):
+    """
+    Write the rman-dl -p filters covering the damaged files to Logs/verify/<build>-repair.txt, one per line.
+    """
+    path = LOGS_DIR / "verify" / f"{Path(build_dir).name}-repair.txt"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    lines = []
+    for folder, files in damaged.items():
+        lines += path_filters(sorted(files))
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return path
+
+def repair_build(project, build_dir, result, langs=None):
+    """
+    Re-download only the damaged files of a verified build.
+    """
+    jobs = []
+    for folder, files in result["damaged"].items():
+        if not files:
+            continue
+        for rel in files:
+            # The file may be hardlinked into the dedup store or another build, so never write through it
+            try:
+                (folder / rel).unlink()
+            except FileNotFoundError:
+                pass
+        jobs.append({
+            "label": f"{Path(build_dir).name}-repair" + ("" if folder == build_dir else f"-{folder.name}"),
+            "manifest_path": result["manifests"][folder],
+            "outdir": folder,
+            "build_dir": build_dir,
+            "langs": langs,
+            "file_filters": path_filters(sorted(files)),
+        })
+    done = run_rman_jobs(project, jobs, len(jobs))
+    return all(j["returncode"] == 0 for j in done)
+
+# ---------- Build Packing ----------
+# Builds that are no longer used can be packed into one Builds/<project>/<build>.dmpack file.
+# Files are cut into chunks and every distinct chunk (by SHA-256) is compressed once, on a
+# thread pool with only a few chunks in flight, so memory stays flat whatever the build size.
+# The index at the end of the pack holds the catalog metadata, the file list and where each
+# chunk lives, so single files can be read back without unpacking the rest.
+#
+# Layout: "DMPK" and a format byte, the compressed chunks, the zlib-compressed JSON index,
+# then a footer with the index offset and length (little-endian u64) and "DMPK" again.
+
+PACK_EXT = ".dmpack"
+PACK_MAGIC = b"DMPK"
+PACK_FORMAT = 1
+PACK_CHUNK_SIZE = 4 * MB
+# zstd level (zlib level when zstandard is missing, capped at 9)
+PACK_LEVEL = 6
+PACK_WORKERS = os.cpu_count() or 4
+
+_PACK_FOOTER = struct.Struct("<QQ4s")
+_PACK_LOCAL = threading.local()
+
+def _pack_compress(data, codec, level):
+    if codec == "zlib":
+        return zlib.compress(data, min(level, 9))
+    # Compressor objects must not be shared between threads
+    if getattr(_PACK_LOCAL, "compressor", None) is None:
+        _PACK_LOCAL.compressor = zstandard.ZstdCompressor(level=level)
+    return _PACK_LOCAL.compressor.compress(data)
+
+def _pack_decompress(data, codec, size):
+    if codec == "zlib":
+        return zlib.decompress(data)
+    if getattr(_PACK_LOCAL, "decompressor", None) is None:
+        _PACK_LOCAL.decompressor = zstandard.ZstdDecompressor()
+    return _PACK_LOCAL.decompressor.decompress(data, max_output_size=size)
+
+def pack_path(build_dir):
+    build_dir = Path(build_dir)
+    return build_dir.parent / (build_dir.name + PACK_EXT)
+
+def list_packs(proj):
+    proj_dir = BUILDS_DIR / proj
+    if not proj_dir.exists():
+        return []
+    return sorted(proj_dir.glob("*" + PACK_EXT))
+
+def pack_metadata(project, build_dir):
+    """
+    What the pack records about a build: its catalog entry and the filters it was made with.
+    """
+    mid = build_manifest_id(build_dir)
+    # A two-part build is listed in the catalog under its Client manifest
+    entry = (CATALOG[project].get(mid.split("+", 1)[0]) if project in CATALOG else None) or {}
+    langs, file_filter = build_filters(build_dir)
+    return {
+        "project": project,
+        "build": Path(build_dir).name,
+        "manifest_id": mid,
+        "version": entry.get("version"),
+        "platform": entry.get("platform"),
+        "realms": entry.get("realms", []),
+        "timestamp": entry.get("timestamp"),
+        "langs": langs,
+        "file_filter": file_filter,
+    }
+
+@profiled("pack.build")
+def pack_build(project, build_dir, dest=None, workers=PACK_WORKERS, level=PACK_LEVEL):
+    """
+    Pack one extracted build into dest (default: next to the build, as <build>.dmpack).
+    Returns {"path", "files", "bytes", "chunks", "unique", "packed", "elapsed"}.
+    """
+    build_dir = Path(build_dir)
+    dest = Path(dest or pack_path(build_dir))
+    codec = "zstd" if zstandard is not None else "zlib"
+    start = time.monotonic()
+    files = []
+    for dirpath, dirnames, filenames in os.walk(build_dir):
+        dirnames.sort()
+        for name in sorted(filenames):
+            path = Path(dirpath) / name
+            rel = path.relative_to(build_dir).as_posix()
+            if path.is_symlink():
+                files.append({"path": rel, "link": os.readlink(path)})
+                continue
+            st = path.stat()
+            files.append({"path": rel, "size": st.st_size, "mtime": st.st_mtime_ns, "chunks": []})
+
+    # digest -> [offset, compressed size, size], None while a worker is still compressing it
+    chunks = {}
+    lock = threading.Lock()
+
+    def compress(data):
+        digest = hashlib.sha256(data).digest()
+        with lock:
+            if digest in chunks:
+                return digest, None
+            chunks[digest] = None
+        return digest, _pack_compress(data, codec, level)
+
+    workers = max(1, workers)
+    pending = deque()
+    total = count = 0
+    tmp = dest.with_name(dest.name + ".tmp")
+    try:
+        with open(tmp, "wb") as out, ThreadPoolExecutor(max_workers=workers) as pool:
+            out.write(PACK_MAGIC + bytes([PACK_FORMAT]))
+
+            def drain(limit):
+                # Chunks are written as they come back, so at most `limit` of them are held in memory
+                while len(pending) > limit:
+                    f, size, fut = pending.popleft()
+                    digest, data = fut.result()
+                    if data is not None:
+                        with lock:
+                            chunks[digest] = [out.tell(), len(data), size]
+                        out.write(data)
+                    f["chunks"].append(digest)
+
+            for f in files:
+                if "link" in f:
+                    continue
+                with open(build_dir / f["path"], "rb") as src:
+                    while True:
+                        data = src.read(PACK_CHUNK_SIZE)
+                        if not data:
+                            break
+                        pending.append((f, len(data), pool.submit(compress, data)))
+                        total += len(data)
+                        count += 1
+                        drain(workers * 2)
+            drain(0)
+
+            table, ids = [], {}
+            for f in files:
+                if "link" in f:
+                    continue
+                refs = []
+                for digest in f["chunks"]:
+                    if digest not in ids:
+                        ids[digest] = len(table)
+                        table.append(chunks[digest] + [digest.hex()])
+                    refs.append(ids[digest])
+                f["chunks"] = refs
+            index = dict(pack_metadata(project, build_dir), format=PACK_FORMAT, codec=codec,
+                         created=int(time.time()), bytes=total, chunks=table, files=files)
+            blob = zlib.compress(json.dumps(index, separators=(",", ":")).encode("utf-8"), 6)
+            offset = out.tell()
+            out.write(blob)
+            out.write(_PACK_FOOTER.pack(offset, len(blob), PACK_MAGIC))
+            out.flush()
+            os.fsync(out.fileno())
+    except BaseException:
+        if tmp.exists():
+            tmp.unlink()
+        raise
+    os.replace(tmp, dest)
+    return {"path": dest, "files": len(files), "bytes": total, "chunks": count, "unique": len(table),
+            "packed": dest.stat().st_size, "elapsed": time.monotonic() - start}
+
+class BuildPack:
+    """
+    Read access to a .dmpack file: its metadata, its file list and single files.
+    """
+    def __init__(self, path):
+        self.path = Path(path)
+        self._f = open(self.path, "rb")
+        self._lock = threading.Lock()
+        try:
+            header = self._f.read(len(PACK_MAGIC) + 1)
+            if len(header) < 5 or header[:4] != PACK_MAGIC:
+                raise ValueError(f"{self.path.name} is not a build pack")
+            if header[4] > PACK_FORMAT:
+                raise ValueError(f"{self.path.name} needs a newer download manager (pack format {header[4]})")
+            self._f.seek(-_PACK_FOOTER.size, os.SEEK_END)
+            offset, length, magic = _PACK_FOOTER.unpack(self._f.read(_PACK_FOOTER.size))
+            if magic != PACK_MAGIC:
+                raise ValueError(f"{self.path.name} is incomplete (no index)")
+            self._f.seek(offset)
+            self.index = json.loads(zlib.decompress(self._f.read(length)))
+        except Exception:
+            self._f.close()
+            raise
+        if self.index["codec"] == "zstd" and zstandard is None:
+            self._f.close()
+            raise RuntimeError("this pack needs the zstandard package (pip install zstandard)")
+        self.files = {f["path"]: f for f in self.index["files"]}
+
+    def close(self):
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def read_chunk(self, i):
+        offset, csize, size, digest = self.index["chunks"][i]
+        with self._lock:
+            self._f.seek(offset)
+            data = self._f.read(csize)
+        try:
+            data = _pack_decompress(data, self.index["codec"], size)
+        except (zlib.error, getattr(zstandard, "ZstdError", zlib.error)):
+            data = None
+        if data is None or len(data) != size or hashlib.sha256(data).hexdigest() != digest:
+            raise ValueError(f"chunk {i} of {self.path.name} is damaged")
+        return data
+
+    def check(self, workers=PACK_WORKERS):
+        """
+        Read back every chunk and compare it with its hash. Raises ValueError on damage.
+        """
+        def check_chunk(i):
+            self.read_chunk(i)
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            list(pool.map(check_chunk, range(len(self.index["chunks"]))))
+
+    def extract(self, rel, dest):
+        """
+        Write one file of the pack to dest, restoring its modification time.
+        """
+        f = self.files[rel]
+        dest = Path(dest)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        if "link" in f:
+            if dest.is_symlink() or dest.exists():
+                dest.unlink()
+            os.symlink(f["link"], dest)
+            return 0
+        tmp = dest.with_name(dest.name + ".unpack")
+        with open(tmp, "wb") as out:
+            for i in f["chunks"]:
+                out.write(self.read_chunk(i))
+        os.utime(tmp, ns=(f["mtime"], f["mtime"]))
+        # Never write through an existing file, it may be hardlinked into the dedup store
+        os.replace(tmp, dest)
+        return f["size"]
+
+def pack_stats(path):
+    """
+    (build size, file count) recorded in a pack, cached in the stats index by pack mtime.
+    """
+    global _STATS_DIRTY
+    path = Path(path)
+    mtime = path.stat().st_mtime_ns
+    packs = load_stats_index().setdefault("packs", {}).setdefault(path.parent.name, {})
+    rec = packs.get(path.name)
+    if rec is None or rec["mtime"] != mtime:
+        with BuildPack(path) as pack:
+            rec = {"mtime": mtime, "size": pack.index["bytes"], "files": len(pack.files), "packed": path.stat().st_size}
+        with _STATS_LOCK:
+            packs[path.name] = rec
+            _STATS_DIRTY = True
+    return rec
+
+def project_pack_stats(proj):
+    """
+    (build size, count, size on disk) of the packed builds of a project.
+    A build packed without removing it is already counted with the extracted builds,
+    so its pack only adds to the size on disk.
+    """
+    global _STATS_DIRTY
+    size = count = packed = 0
+    names = set()
+    for p in list_packs(proj):
+        try:
+            rec = pack_stats(p)
+        except (OSError, ValueError, RuntimeError) as ex:
+            print(f"[Warn] Could not read {p.name}: {ex}")
+            continue
+        names.add(p.name)
+        packed += rec["packed"]
+        if (p.parent / p.name[:-len(PACK_EXT)]).is_dir():
+            continue
+        size += rec["size"]
+        count += 1
+    known = load_stats_index().get("packs", {}).get(proj, {})
+    for name in set(known) - names:
+        with _STATS_LOCK:
+            known.pop(name, None)
+            _STATS_DIRTY = True
+    return size, count, packed
+
+def unpack_build(pack, dest, pattern=None, workers=PACK_WORKERS):
+    """
+    Extract the files of a pack whose path matches the regex `pattern` (all files if None) into dest.
+    Returns (files, bytes) extracted.
+    """
+    dest = Path(dest)
+    rx = re.compile(pattern, re.IGNORECASE) if pattern else None
+    selected = []
+    for rel in pack.files:
+        if rx and not rx.search(rel):
+            continue
+        parts = Path(rel).parts
+        if Path(rel).is_absolute() or ".." in parts:
+            print(f"[Warn] Skipping unsafe path in pack: {rel}")
+            continue
+        selected.append(rel)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        sizes = list(pool.map(lambda rel: pack.extract(rel, dest / rel), selected))
+    return len(selected), sum(sizes)
+
+# ---------- Catalog Index ----------
+@functools.lru_cache(maxsize=128)
+def compile_version_regex(regex):
+    return re.compile(regex)
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+@functools.lru_cache(maxsize=128)
+def regex_literals(regex):
+    """
+    Literal strings (lowercased) that every match of regex has to contain, as far as can be
+    told from its parse tree. Alternations, classes and repeats end a literal, so
+    the answer may be incomplete, but what it returns is always required.
+    """
+    try:
+        parsed = sre_parse.parse(regex)
+    except (re.error, TypeError):
+        return ()
+    runs, run = [], []
+
+    def flush():
+        if run:
+            runs.append("".join(run).lower())
+            run.clear()
+
+    def walk(items):
+        for op, av in items:
+            if op is sre_parse.LITERAL:
+                run.append(chr(av))
+            elif op is sre_parse.SUBPATTERN:
+                # A plain group is just part of the sequence
+                walk(av[-1])
+            elif op is sre_parse.AT:
+                # Anchors match no characters
+                flush()
+            else:
+                flush()
+    walk(parsed)
+    flush()
+    return tuple(runs)
+
+class TrigramIndex:
+    """
+    Inverted index from every 3-character substring of the version and manifest ID of an
+    entry (lowercased) to the manifest IDs containing it. A query literal can only
+    match where all of its trigrams occur, so only those entries need checking.
+    """
+    def __init__(self, entries):
+        self.postings = {}
+        self.texts = {}
+        for mid, e in entries.items():
+            self.add(mid, e)
+
+    @staticmethod
+    def text(mid, entry):
+        # The separator keeps trigrams from spanning the version and the ID
+        return f"{entry.get('version', '')}\0{mid}".lower()
+
+    def add(self, mid, entry):
+        text = self.texts[mid] = self.text(mid, entry)
+        for gram in trigrams(text):
+            self.postings.setdefault(gram, set()).add(mid)
+
+    def remove(self, mid, entry):
+        self.texts.pop(mid, None)
+        for gram in trigrams(self.text(mid, entry)):
+            ids = self.postings.get(gram)
+            if ids is not None:
+                ids.discard(mid)
+
+    def candidates(self, literals):
+        """
+        Manifest IDs that may contain every literal, or None when the literals are too
+        short to narrow anything down.
+        """
+        grams = set()
+        for lit in literals:
+            grams |= trigrams(lit.lower())
+        if not grams:
+            return None
+        postings = sorted((self.postings.get(g, set()) for g in grams), key=len)
+        result = set(postings[0])
+        for ids in postings[1:]:
+            if not result:
+                break
+            result &= ids
+        return result
+
+class CatalogIndex:
+    """
+    Per-project view of the catalog, built once: manifest IDs sorted newest first,
+    plus inverted indexes by platform and realm.
+    """
+    def __init__(self, entries):
+        self.entries = entries
+        self._trigrams = None
+        self._last_text = None
+        self.order = sorted(entries, key=lambda mid: entries[mid].get("timestamp", ""), reverse=True)
+        self.rank = {mid: i for i, mid in enumerate(self.order)}
+        self.by_platform = {}
+        self.by_realm = {}
+        for mid, e in entries.items():
+            self.by_platform.setdefault(e.get("platform", "unknown"), set()).add(mid)
+            for r in e.get("realms", []):
+                self.by_realm.setdefault(r, set()).add(mid)
+
+    def update(self, previous, added, removed):
+        """
+        Apply a catalog delta in place instead of rebuilding the index.
+        `previous` holds the old entries of every changed or removed manifest.
+        """
+        for mid, e in previous.items():
+            self.by_platform.get(e.get("platform", "unknown"), set()).discard(mid)
+            for r in e.get("realms", []):
+                self.by_realm.get(r, set()).discard(mid)
+            if self._trigrams is not None:
+                self._trigrams.remove(mid, e)
+        for mid, e in added.items():
+            self.by_platform.setdefault(e.get("platform", "unknown"), set()).add(mid)
+            for r in e.get("realms", []):
+                self.by_realm.setdefault(r, set()).add(mid)
+            if self._trigrams is not None:
+                self._trigrams.add(mid, e)
+        self._last_text = None
+        gone = set(removed)
+        if gone:
+            self.order = [mid for mid in self.order if mid not in gone]
+        self.order += [mid for mid in added if mid not in self.rank]
+        # The list is still almost sorted, so this is close to a linear pass
+        self.order.sort(key=lambda mid: self.entries[mid].get("timestamp", ""), reverse=True)
+        self.rank = {mid: i for i, mid in enumerate(self.order)}
+
+    def trigram_index(self):
+        # Built on the first search that can use it, not with the rest of the index
+        if self._trigrams is None:
+            with span("search.trigram_build"):
+                self._trigrams = TrigramIndex(self.entries)
+        return self._trigrams
+
+    def text_matches(self, text):
+        """
+        Manifest IDs whose version or ID contains text (case-insensitive).
+        Typing on from the previous search only rechecks that search's matches,
+        so narrowing a search as you type gets cheaper with every character.
+        """
+        text = text.lower()
+        trigram_index = self.trigram_index()
+        last = self._last_text
+        if last and last[0] in text:
+            pool = last[1]
+        else:
+            pool = trigram_index.candidates([text])
+            if pool is None:
+                pool = trigram_index.texts
+        texts = trigram_index.texts
+        matches = {mid for mid in pool if text in texts.get(mid, "")}
+        self._last_text = (text, matches)
+        return matches
+
+    @profiled("search.query")
+    def query(self, regex="", realm=None, plat=None, subset=None, text=""):
+        """
+        Filter the project, newest first. Realm, platform, subset (a set of manifest IDs)
+        and text (a substring of the version or ID) are set intersections. The version regex
+        only runs on what is left, after the trigram index has ruled out every entry
+        missing one of its literal parts.
+        """
+        literals = regex_literals(regex) if regex else ()
+        candidates = None
+        for ids in (
+            self.by_platform.get(plat, set()) if plat else None,
+            self.by_realm.get(realm, set()) if realm else None,
+            subset,
+            self.text_matches(text) if text else None,
+            self.trigram_index().candidates(literals) if literals else None,
+        ):
+            if ids is not None:
+                candidates = set(ids) if candidates is None else candidates & ids
+        if candidates is None:
+            mids = self.order
+        else:
+            mids = sorted((m for m in candidates if m in self.rank), key=self.rank.__getitem__)
+
+        entries = self.entries
+        if regex:
+            search = compile_version_regex(regex).search
+            return [(mid, entries[mid]) for mid in mids if search(entries[mid].get("version", ""))]
+        return [(mid, entries[mid]) for mid in mids]
+
+_CATALOG_INDEXES = {}
+
+def get_catalog_index(project):
+    index = _CATALOG_INDEXES.get(project)
+    if index is None:
+        with span("search.index_build"):
+            index = _CATALOG_INDEXES[project] = CatalogIndex(CATALOG[project])
+    return index
+
+# ---------- Catalog Update ----------
+# The catalog is refreshed with conditional requests: the ETag and Last-Modified of every
+# URL are kept in catalog/index.json, so an unchanged catalog costs one 304 response.
+# A changed catalog is diffed per project, and only projects with new, changed or removed
+# entries get their shard rewritten and their in-memory index patched.
+
+def conditional_get(url, validators):
+    """
+    GET url unless it still matches `validators` (etag/last_modified from the last fetch).
+    Returns (response, new validators), or (None, validators) on 304 Not Modified.
+    """
+    headers = {}
+    if validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+    with GOVERNOR.connection():
+        r = get_session().get(url, timeout=60, headers=headers)
+    if r.status_code == 304:
+        return None, validators
+    r.raise_for_status()
+    GOVERNOR.consume(len(r.content))
+    return r, {"etag": r.headers.get("ETag"), "last_modified": r.headers.get("Last-Modified")}
+
+def catalog_delta(old, new):
+    """
+    Returns (added or changed entries, removed manifest IDs) between two project catalogs.
+    """
+    added = {mid: e for mid, e in new.items() if old.get(mid) != e}
+    removed = [mid for mid in old if mid not in new]
+    return added, removed
+
+def apply_catalog_delta(project, added, removed, index=None):
+    """
+    Merge a delta into the loaded catalog, its shard on disk and its search index.
+    """
+    old = CATALOG[project] if project in CATALOG else {}
+    previous = {mid: old[mid] for mid in list(added) + list(removed) if mid in old}
+    entries = CATALOG.merge(project, added, removed)
+    save_catalog_project(project, entries, index)
+    catalog_index = _CATALOG_INDEXES.get(project)
+    if catalog_index is not None:
+        catalog_index.update(previous, added, removed)
+
+def fetch_catalog_changes(url, remote):
+    """
+    Download whatever changed at url. Returns ({project: entries}, {url: validators}).
+    """
+    seen = {}
+    if not url.endswith("/"):
+        r, seen[url] = conditional_get(url, remote.get(url, {}))
+        return (r.json() if r is not None else {}), seen
+
+    index_url = url + "index.json"
+    r, seen[index_url] = conditional_get(index_url, remote.get(index_url, {}))
+    if r is None:
+        return {}, seen
+    changed = {}
+    for project in r.json()["projects"]:
+        shard_url = url + f"{project}.json"
+        pr, seen[shard_url] = conditional_get(shard_url, remote.get(shard_url, {}))
+        if pr is not None:
+            changed[project] = pr.json()
+    return changed, seen
+
+@profiled("catalog.update")
+def update_catalog(url=None):
+    """
+    Bring the local catalog up to date with url (CATALOG_URL by default).
+    Returns {project: (added or changed, removed)} for every project that changed.
+    """
+    url = url or CATALOG_URL
+    index = read_catalog_index()
+    remote = index.get("remote", {})
+    changed, seen = fetch_catalog_changes(url, remote)
+    summary = {}
+    for project, entries in changed.items():
+        old = CATALOG[project] if project in CATALOG else {}
+        added, removed = catalog_delta(old, entries)
+        if added or removed:
+            apply_catalog_delta(project, added, removed, index)
+            summary[project] = (len(added), len(removed))
+    # Validators are only stored once every shard is written, so a failed update is retried in full
+    index = read_catalog_index()
+    index["remote"] = {**remote, **seen}
+    write_catalog_index(index)
+    return summary
+
+def run_catalog_update(url=None):
+    url = url or CATALOG_URL
+    if not url:
+        print("[Error] No catalog URL set. Set CATALOG_URL in the script or the DM_CATALOG_URL environment variable.")
+        return False
+    print(f"[Catalog] Checking {url} for updates...")
+    try:
+        summary = update_catalog(url)
+    except (requests.RequestException, OSError, ValueError, KeyError) as ex:
+        print(f"[Error] Catalog update failed: {ex}")
+        return False
+    if not summary:
+        print("[Catalog] Already up to date.")
+    for project, (added, removed) in summary.items():
+        print(f"[Catalog] {project}: {added} new or changed, {removed} removed")
+    return True
+
+# ---------- Unified Search (catalog or cache) ----------
+def draw_project_selection(projects):
+    clear_screen()
+    show_stats()
+    print("\n[Project Selection]   [Type 'h' for Help | 'k' for Project Help | 'c' for Credits]")
+    for i, p in enumerate(projects, 1):
+        print(f"  {i}) {p}")
+
+def search_data(source="catalog", page_size=20):
+    if source == "catalog":
+        projects = list(CATALOG.keys())
+    else:
+        projects = [p for p in CATALOG.keys() if (CACHE_DIR / p).exists()]
+    if not projects:
+        print("[Info] No projects available.")
+        input_with_help("Press Enter to return...")
+        return None, [], None, None
+
+    regex = ""
+    text = ""
+    realm = None
+    plat = None
+    page = 0
+    last_query = None
+    results = []
+
+    draw_project_selection(projects)
+    choice = ask_number("Select project: ", 1, len(projects), redraw=lambda: draw_project_selection(projects))
+    project = projects[choice - 1]
+
+    while True:
+        clear_screen()
+        if source == "catalog":
+            cached = None
+        else:
+            cached = cached_manifest_ids(project)
+
+        # Paging and redraws reuse the previous result list, only a filter change re-queries
+        query = (project, regex, realm, plat, cached, text)
+        if query != last_query:
+            results = get_catalog_index(project).query(regex, realm, plat, cached, text)
+            last_query = query
+
+        show_stats()
+        print(f"\n[Current Filter] project={project}, version_regex='{regex or 'ALL'}', platform={plat or 'ANY'}, realm={realm or 'ANY'}"
+              + (f", search='{text}'" if text else ""))
+        print(f"[Info] Results after filters: {len(results)}\n")
+
+        start = page * page_size
         end = start + page_size
         subset = results[start:end]
 
@@ -509,7 +3466,7 @@ def search_data(source="catalog", page_size=20):
         print("Results:")
         print("  [e] next page  [q] previous page  [0] download all")
         print("Filter:")
-        print("  [j] project  [v] version  [r] realm  [p] platform")
+        print("  [j] project  [v] version  [s] search text  [r] realm  [p] platform")
         print("  [x] back to menu\n")
 
         choice = input_with_help("Choose : ").strip().lower()
@@ -521,32 +3478,34 @@ def search_data(source="catalog", page_size=20):
         elif choice == "q" and page > 0:
             page -= 1
         elif choice == "0":
-            if len(results) > 100:
-                print(f"[Error] Too many entries selected ({len(results)}). Max allowed is 100.")
+            if not confirm_batch(results):
+                print("Cancelled.")
                 input_with_help("Press Enter to continue...")
                 continue
-            if len(results) > 10:
-                confirm = input_with_help(f"[Warning] You are about to download {len(results)} entries. Proceed? (y/N): ").strip().lower()
-                if confirm == "__REDRAW__":
-                    continue
-                if confirm != "y":
-                    print("Cancelled.")
-                    input_with_help("Press Enter to continue...")
-                    continue
             return project, results, realm, plat
         elif choice == "j":
             draw_project_selection(projects)
             idx = ask_number("Select project: ", 1, len(projects), redraw=lambda: draw_project_selection(projects))
             project = projects[idx - 1]
-            regex, realm, plat, page = "", None, None, 0
+            regex, text, realm, plat, page = "", "", None, None, 0
         elif choice == "v":
             while True:
                 regex_input = input_with_help("Enter version regex (blank for all): ").strip()
                 if regex_input == "__REDRAW__":
                     continue
+                try:
+                    compile_version_regex(regex_input)
+                except re.error:
+                    print("[Error] Invalid regex pattern.")
+                    continue
                 regex = regex_input
                 break
             page = 0
+        elif choice == "s":
+            text_input = input_with_help("Search version or manifest ID (blank to clear): ").strip()
+            if text_input != "__REDRAW__":
+                text = text_input
+                page = 0
         elif choice == "r":
             realms = sorted({r for _, e in results for r in e.get("realms", [])})
             if not realms:
@@ -583,12 +3542,185 @@ def search_data(source="catalog", page_size=20):
             print("Invalid input.")
             input_with_help("Press Enter to continue...")
             
+# ---------- Download Queue ----------
+# Every download is recorded in download-queue.db (SQLite) with its filters and state:
+#   queued -> manifest-cached -> extracting -> done | failed
+# Each change is committed right away, so after a crash, reboot or killed rman-dl the
+# queue still knows what finished. Unfinished entries can be resumed, and builds already
+# done with the same filters are skipped without walking their folders.
+
+QUEUE_STATES = ("queued", "manifest-cached", "extracting", "done", "failed")
+
+_QUEUE = None
+_QUEUE_LOCK = threading.Lock()
+
+def queue_db():
+    global _QUEUE
+    with _QUEUE_LOCK:
+        if _QUEUE is None:
+            db = sqlite3.connect(QUEUE_PATH, timeout=30, check_same_thread=False)
+            db.row_factory = sqlite3.Row
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS downloads (
+                    project TEXT NOT NULL,
+                    manifest_id TEXT NOT NULL,
+                    mode TEXT NOT NULL,
+                    batch TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    base_langs TEXT,
+                    langs TEXT,
+                    file_filter TEXT,
+                    dedup INTEGER,
+                    workers INTEGER,
+                    outdir TEXT,
+                    returncode INTEGER,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    updated TEXT,
+                    PRIMARY KEY (project, manifest_id, mode)
+                )""")
+            db.commit()
+            _QUEUE = db
+    return _QUEUE
+
+def queue_execute(sql, params=()):
+    db = queue_db()
+    with _QUEUE_LOCK, db:
+        return db.execute(sql, params).fetchall()
+
+def queue_add(batch, project, manifest_ids, mode, base_langs_list, file_filter, dedup, workers, keep_done=True):
+    """
+    Record a batch as queued. With keep_done, entries that are already done are left exactly
+    as they are: their filters describe the build on disk, which the skip check compares against.
+    """
+    now = time.strftime("%Y-%m-%dT%H:%M:%S")
+    base_langs = "|".join(base_langs_list) if base_langs_list else None
+    keep = "state = 'done'" if keep_done else "0"
+    db = queue_db()
+    with _QUEUE_LOCK, db:
+        db.executemany(f"""
+            INSERT INTO downloads (project, manifest_id, mode, batch, state, base_langs, file_filter, dedup, workers, updated)
+            VALUES (?, ?, ?, ?, 'queued', ?, ?, ?, ?, ?)
+            ON CONFLICT (project, manifest_id, mode) DO UPDATE SET
+                batch = CASE WHEN {keep} THEN batch ELSE excluded.batch END,
+                base_langs = CASE WHEN {keep} THEN base_langs ELSE excluded.base_langs END,
+                file_filter = CASE WHEN {keep} THEN file_filter ELSE excluded.file_filter END,
+                dedup = CASE WHEN {keep} THEN dedup ELSE excluded.dedup END,
+                workers = CASE WHEN {keep} THEN workers ELSE excluded.workers END,
+                updated = CASE WHEN {keep} THEN updated ELSE excluded.updated END,
+                state = CASE WHEN {keep} THEN state ELSE 'queued' END""",
+            [(project, mid, mode, batch, base_langs, file_filter, int(bool(dedup)), workers, now) for mid in manifest_ids])
+
+def queue_set_state(project, manifest_id, mode, state, keep_done=False, **fields):
+    """
+    Move one entry to a new state, along with any of outdir, langs, file_filter, returncode or error.
+    With keep_done, an entry that is already done stays done.
+    """
+    fields["state"] = state
+    fields["updated"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    if fields.get("outdir") is not None:
+        fields["outdir"] = str(fields["outdir"])
+    sets = ", ".join(f"{k} = ?" for k in fields)
+    extra = ", attempts = attempts + 1" if state == "extracting" else ""
+    where = "project = ? AND manifest_id = ? AND mode = ?" + (" AND state != 'done'" if keep_done else "")
+    queue_execute(f"UPDATE downloads SET {sets}{extra} WHERE {where}", list(fields.values()) + [project, manifest_id, mode])
+
+def queue_finished(project, mode):
+    """
+    {manifest_id: row} of the entries already done for this project and mode.
+    """
+    rows = queue_execute("SELECT * FROM downloads WHERE project = ? AND mode = ? AND state = 'done'", (project, mode))
+    return {r["manifest_id"]: r for r in rows}
+
+def queue_drop_unfinished(batch):
+    queue_execute("DELETE FROM downloads WHERE batch = ? AND state != 'done'", (batch,))
+
+def queue_pending():
+    """
+    Unfinished entries grouped the way they were queued:
+    [(batch, project, mode, base_langs, file_filter, dedup, workers, [manifest ids])].
+    """
+    rows = queue_execute("SELECT * FROM downloads WHERE state != 'done' ORDER BY batch, rowid")
+    groups = {}
+    for r in rows:
+        key = (r["batch"], r["project"], r["mode"], r["base_langs"], r["file_filter"], r["dedup"], r["workers"])
+        groups.setdefault(key, []).append(r["manifest_id"])
+    return [key + (mids,) for key, mids in groups.items()]
+
+def queue_counts():
+    rows = queue_execute("SELECT state, COUNT(*) AS n FROM downloads GROUP BY state")
+    return {r["state"]: r["n"] for r in rows}
+
+def resume_downloads():
+    """
+    Run every unfinished queued download again with its original options. Returns True if all succeeded.
+    """
+    ok = True
+    for batch, project, mode, base_langs, file_filter, dedup, workers, mids in queue_pending():
+        if mode not in DOWNLOAD_MODES:
+            # Earlier versions queued mistyped modes, nothing can ever build those
+            print(f"[Warn] Dropping {len(mids)} queued {project} entries with unknown mode '{mode}' from {batch}")
+            queue_drop_unfinished(batch)
+            continue
+        entries = CATALOG[project] if project in CATALOG else {}
+        results = [(mid, entries[mid]) for mid in mids if mid in entries]
+        if len(results) < len(mids):
+            print(f"[Warn] {len(mids) - len(results)} queued {project} entries are no longer in the catalog")
+        if not results:
+            continue
+        print(f"[Queue] Resuming {len(results)} {project} downloads from {batch}")
+        done = run_downloads(project, results, mode, base_langs.split("|") if base_langs else [], file_filter,
+                             workers or RMAN_WORKERS, dedup=bool(dedup), batch=batch)
+        ok = ok and done is not None and all(j["returncode"] == 0 for j in done)
+    # Entries whose manifest could not be fetched never became jobs, but are still unfinished
+    return ok and not queue_pending()
+
+def show_queue():
+    counts = queue_counts()
+    if not counts:
+        print("[Queue] The download queue is empty.")
+        return
+    print("[Queue] " + ", ".join(f"{counts.get(state, 0)} {state}" for state in QUEUE_STATES))
+    for batch, project, mode, _, _, _, _, mids in queue_pending():
+        print(f"  {batch}  {project} ({mode}): {len(mids)} unfinished")
+
 # ---------- Unified Download ----------
+# A selection is checked against its estimated size (catalog build sizes, before language
+# and file filters) instead of an entry count; the pre-flight plan gives the real numbers
+# once the manifests are fetched. Bigger selections, or ones over the free disk space, need a yes.
+BATCH_CONFIRM_GB = 200
+
+def estimate_batch(results):
+    """
+    (estimated build bytes, entries without a known size) of a selection.
+    """
+    size = unknown = 0
+    for _, entry in results:
+        try:
+            size += int(entry.get("size"))
+        except (TypeError, ValueError):
+            unknown += 1
+    return size, unknown
+
+def confirm_batch(results):
+    if len(results) <= 1:
+        return True
+    size, unknown = estimate_batch(results)
+    free = shutil.disk_usage(BUILDS_DIR if BUILDS_DIR.exists() else ROOT).free
+    print(f"[Plan] {len(results)} entries, about {format_mb(size)} of builds"
+          + (f" ({unknown} of unknown size)" if unknown else "") + f", {format_mb(free)} free")
+    if size <= min(free, BATCH_CONFIRM_GB * 1024 * MB):
+        return True
+    if size > free:
+        print("[Warn] That is more than the free disk space. Language and file filters usually make it much smaller,")
+        print("       and the pre-flight plan shows the real numbers before rman-dl starts.")
+    return input_with_help("Proceed? (y/N): ").strip().lower() == "y"
+
 def handle_downloads(project, results, mode="d"):
     if not results:
         return
 
-    if mode == "d":
+    if mode in ("d", "u"):
         langs_str = prompt_languages(project, results[0][0])
         if langs_str is None:
             base_langs_list = []
@@ -610,37 +3742,142 @@ def handle_downloads(project, results, mode="d"):
                     print("[Error] Invalid regex pattern. Skipping file filter.")
                     file_filter = None
             break
+        workers = RMAN_WORKERS
+        if len(results) > 1 and mode == "d":
+            workers = ask_number(
+                f"Parallel rman-dl jobs (1-{MAX_RMAN_WORKERS}) [Default is {RMAN_WORKERS}]: ",
+                1, MAX_RMAN_WORKERS, default=RMAN_WORKERS
+            )
     else:
         base_langs_list = []
         file_filter = None
+        workers = RMAN_WORKERS
 
-    for mid, entry in results:
-        mpath = download_manifest(project, mid)
-        if mode == "d":
-            langs_list = list(base_langs_list)
-
-            # --- Project-specific rules ---
-            if project == "lol" and langs_list:
-                p = entry.get("platform", "").lower()
-                if "windows" in p and "windows" not in langs_list:
-                    langs_list.append("windows")
-                elif "mac" in p and "macos" not in langs_list:
-                    langs_list.append("macos")
-
-            if project == "valorant" and "all_loc" in langs_list:
-                langs_list = ["none", "all_loc"]
-
-            lang_str = "|".join(langs_list) if langs_list else None
-            outdir = build_output_dir(project, mid, entry, lang_str)
-            if lang_str:
-                print(f"[Info] Final language filter: {lang_str}")
-            else:
-                print("[Info] No language filter applied (downloading all)")
-            run_rman_dl(project, mpath, outdir, lang_str, file_filter)
+    def confirm_plan(jobs, totals):
+        if totals is None:
+            return True
+        clear_screen()
+        print_plan(jobs, totals)
+        ans = input_with_help("Start these downloads? (Y/n): ").strip().lower()
+        return ans != "n"
 
-    check_cache_size(project)
+    done = run_downloads(project, results, mode, base_langs_list, file_filter, workers, confirm=confirm_plan)
+    if done is None:
+        print("Cancelled.")
+    elif any(j["returncode"] != 0 for j in done):
+        input_with_help("Press Enter to continue...")
+
+    enforce_cache_budget()
     clear_screen()
 
+# m = manifests only, d = manifests + rman-dl, u = upgrade from existing builds
+DOWNLOAD_MODES = ("m", "d", "u")
+
+def job_outdir(project, job):
+    if "combined_id" in job:
+        return build_output_path(project, job["combined_id"], job["entry"]) / job["subdir"]
+    return build_output_path(project, job["manifest_id"], job["entry"])
+
+def run_downloads(project, results, mode, base_langs_list, file_filter=None, workers=RMAN_WORKERS, confirm=None,
+                  dedup=DEDUP_INLINE, batch=None):
+    """
+    The non-interactive part of a download: fetch manifests, then run rman-dl for mode "d",
+    or upgrade from the closest existing build for mode "u".
+    Before rman-dl starts, the cached manifests are planned and confirm(jobs, totals) is asked
+    whether to go ahead (totals is None when no manifest could be read).
+    Every entry is tracked in the download queue under `batch` (a new one by default).
+    Returns the finished rman-dl jobs, or None if confirm said no.
+    """
+    if mode not in DOWNLOAD_MODES:
+        # A queued row with any other mode would never be built, and be offered for resuming forever
+        raise ValueError(f"unknown download mode: {mode}")
+    batch = batch or time.strftime("%Y-%m-%dT%H:%M:%S")
+    queue_add(batch, project, [mid for mid, _ in results], mode, base_langs_list, file_filter, dedup, workers)
+    manifests = prefetch_manifests(project, [mid for mid, _ in results])
+    for mid, _ in results:
+        if mid in manifests:
+            queue_set_state(project, mid, mode, "done" if mode == "m" else "manifest-cached", keep_done=True)
+        else:
+            queue_set_state(project, mid, mode, "failed", keep_done=True, error="manifest not available")
+
+    jobs = []
+    if mode == "d":
+        pairs, results = pair_two_part_entries(project, results, manifests)
+        for client, data in pairs:
+            jobs += two_part_jobs(project, client, data, manifests, base_langs_list, file_filter, dedup)
+        if pairs:
+            print(f"[Info] Combining {len(pairs)} Client + Data pair(s) into single builds")
+            # Both halves of a build download at the same time
+            workers = max(workers, 2)
+    for mid, entry in results:
+        mpath = manifests.get(mid)
+        if mpath is None:
+            print(f"[Warn] Skipping {mid}, manifest is not available.")
+            continue
+        if mode != "m":
+            lang_str = entry_langs(project, entry, base_langs_list)
+            jobs.append({
+                "label": build_output_path(project, mid, entry).name,
+                "manifest_id": mid,
+                "entry": entry,
+                "manifest_path": mpath,
+                "langs": lang_str,
+                "file_filter": file_filter,
+                "dedup": dedup,
+            })
+
+    for job in jobs:
+        job["mode"] = mode
+    # Builds finished earlier with the same filters are skipped; checking that their folder
+    # still exists is enough, nothing is walked
+    finished = queue_finished(project, mode)
+    remaining = []
+    for job in jobs:
+        row = finished.get(job["manifest_id"])
+        if not (row and row["langs"] == job["langs"] and row["file_filter"] == job["file_filter"]
+                and row["outdir"] == str(job_outdir(project, job)) and os.path.isdir(row["outdir"])):
+            remaining.append(job)
+    if len(remaining) < len(jobs):
+        print(f"[Queue] Skipping {len(jobs) - len(remaining)} builds that are already done")
+        jobs = remaining
+
+    if not jobs:
+        return []
+    if mode == "u":
+        # Oldest first, one at a time, so each patch can be upgraded from the one just built
+        jobs.sort(key=lambda j: j["entry"].get("timestamp", ""))
+        for job in jobs:
+            job["prepare"] = functools.partial(prepare_upgrade, project)
+        workers = 1
+    elif len(jobs) > 1:
+        for job in jobs:
+            read_job_chunks(job)
+        jobs = order_jobs(jobs)
+        print(f"[Info] Ordered {len(jobs)} builds into {len({j['chain'] for j in jobs})} chain(s) of builds that share chunks")
+    workers = assign_shards(jobs, workers)
+    totals = plan_jobs(project, jobs)
+    if confirm and not confirm(jobs, totals):
+        queue_drop_unfinished(batch)
+        return None
+
+    # Builds done earlier with other filters are made again, so their rows now belong to this batch
+    rebuilt = [job["manifest_id"] for job in jobs if job["manifest_id"] in finished]
+    if rebuilt:
+        queue_add(batch, project, rebuilt, mode, base_langs_list, file_filter, dedup, workers, keep_done=False)
+
+    for job in jobs:
+        if "combined_id" in job:
+            job["build_dir"] = build_output_dir(project, job["combined_id"], job["entry"], job["langs"])
+            job["outdir"] = job_outdir(project, job)
+            job["outdir"].mkdir(parents=True, exist_ok=True)
+        else:
+            job["outdir"] = build_output_dir(project, job["manifest_id"], job["entry"], job["langs"])
+        if job["langs"]:
+            print(f"[Info] {job['label']}: language filter {job['langs']}")
+        else:
+            print(f"[Info] {job['label']}: no language filter applied (downloading all)")
+    return run_rman_jobs(project, jobs, workers)
+
 # ---------- Main Menu ----------
 def draw_main_menu():
     clear_screen()
@@ -649,9 +3886,33 @@ def draw_main_menu():
     print("1) Search catalog")
     print("2) View cache")
     print("3) Exit")
+    print("4) Update catalog")
+
+def offer_resume():
+    pending = sum(len(group[-1]) for group in queue_pending())
+    if not pending:
+        return
+    answer = input_with_help(f"[Queue] {pending} downloads from an earlier session did not finish. Resume them now? (y/N): ")
+    if answer.strip().lower() == "y":
+        resume_downloads()
+        input_with_help("Press Enter to continue...")
+
+def ask_download_mode():
+    """
+    Ask for a download mode until it is one of DOWNLOAD_MODES. Returns None if help was shown.
+    """
+    while True:
+        mode = input_with_help("Download manifests only (m), manifests + run rman-dl (d), or upgrade from existing builds (u)? [Default is d]: ")
+        if mode == "__REDRAW__":
+            return None
+        mode = mode.strip().lower() or "d"
+        if mode in DOWNLOAD_MODES:
+            return mode
+        print("Please enter m, d or u.")
 
 def main_menu():
     set_console_size(180, 48)
+    offer_resume()
     while True:
         draw_main_menu()
         choice = input_with_help("Select: ")
@@ -663,19 +3924,8 @@ def main_menu():
             project, results, realm, plat = search_data(source="catalog")
             if not results:
                 continue
-            if len(results) > 100:
-                print(f"[Error] Too many entries selected ({len(results)}). Max allowed is 100.")
-                input_with_help("Press Enter to continue...")
-                continue
-            if len(results) > 10:
-                confirm = input_with_help(f"[Warning] You are about to download {len(results)} entries. Proceed? (y/N): ").strip().lower()
-                if confirm == "__REDRAW__":
-                    continue
-                if confirm != "y":
-                    print("Cancelled.")
-                    continue
-            mode = input_with_help("Download manifests only (m) or manifests + run rman-dl (d)? [Default is d]: ").strip().lower() or "d"
-            if mode == "__REDRAW__":
+            mode = ask_download_mode()
+            if mode is None:
                 continue
             handle_downloads(project, results, mode)
 
@@ -683,28 +3933,787 @@ def main_menu():
             project, results, realm, plat = search_data(source="cache")
             if not results:
                 continue
-            if len(results) > 100:
-                print(f"[Error] Too many entries selected ({len(results)}). Max allowed is 100.")
-                input_with_help("Press Enter to continue...")
-                continue
-            if len(results) > 10:
-                confirm = input_with_help(f"[Warning] You are about to download {len(results)} entries. Proceed? (y/N): ").strip().lower()
-                if confirm == "__REDRAW__":
-                    continue
-                if confirm != "y":
-                    print("Cancelled.")
-                    continue
-            mode = input_with_help("Download manifests only (m) or manifests + run rman-dl (d)? [Default is d]: ").strip().lower() or "d"
-            if mode == "__REDRAW__":
+            mode = ask_download_mode()
+            if mode is None:
                 continue
             handle_downloads(project, results, mode)
 
         elif choice == "3":
             print("Exiting.")
             break
+
+        elif choice == "4":
+            run_catalog_update()
+            input_with_help("Press Enter to continue...")
         else:
             print("Invalid choice, please try again.")
             input_with_help("Press Enter to continue...")
 
+# ---------- Batch Mode ----------
+BATCH_FIELDS = ("project", "source", "version", "realm", "platform", "langs", "file_filter", "mode", "jobs", "limit", "plan", "dedup")
+
+def load_job_specs(path):
+    r"""
+    A job spec file is a JSON object, or a list of them, using the same keys as the batch arguments:
+      {"project": "lol", "version": "^14\\.", "platform": "windows", "realm": "NA1",
+       "langs": "en_US|fr_FR", "file_filter": "\\.exe$", "mode": "d", "jobs": 4}
+    """
+    specs = json.loads(Path(path).read_text(encoding="utf-8"))
+    if isinstance(specs, dict):
+        specs = [specs]
+    if not isinstance(specs, list):
+        raise ValueError("a job spec file holds an object or a list of objects")
+    for n, spec in enumerate(specs, 1):
+        problem = job_spec_problem(spec)
+        if problem:
+            raise ValueError(f"job {n}: {problem}")
+    return specs
+
+def job_spec_problem(spec):
+    """
+    What is wrong with the keys and values of one job spec, or None. Regexes are checked when it runs.
+    """
+    if not isinstance(spec, dict):
+        return "a job spec must be an object"
+    unknown = set(spec) - set(BATCH_FIELDS)
+    if unknown:
+        return f"unknown job spec keys: {', '.join(sorted(unknown))}"
+    if not isinstance(spec.get("project"), str):
+        return "every job spec needs a project"
+    for key in ("source", "version", "realm", "platform", "file_filter", "mode"):
+        if spec.get(key) is not None and not isinstance(spec[key], str):
+            return f"{key} must be a string"
+    langs = spec.get("langs")
+    if langs is not None and not isinstance(langs, str) and not (
+            isinstance(langs, list) and all(isinstance(l, str) for l in langs)):
+        return "langs must be a string or a list of strings"
+    if spec.get("source", "catalog") not in ("catalog", "cache"):
+        return "source must be catalog or cache"
+    if spec.get("mode", "d") not in DOWNLOAD_MODES:
+        return "mode must be m, d or u"
+    for key in ("jobs", "limit"):
+        value = spec.get(key)
+        # bool is an int too, and "jobs": true is not a number
+        if value is not None and (not isinstance(value, int) or isinstance(value, bool) or value < 1):
+            return f"{key} must be a whole number of at least 1"
+    for key in ("plan", "dedup"):
+        if spec.get(key) is not None and not isinstance(spec[key], bool):
+            return f"{key} must be true or false"
+    return None
+
+def select_entries(project, source="catalog", regex="", realm=None, plat=None):
+    """
+    Same filtering as the interactive search, without any drawing.
+    """
+    cached = None
+    if source == "cache":
+        cached = cached_manifest_ids(project)
+    return get_catalog_index(project).query(regex or "", realm, plat, cached)
+
+def run_batch_job(spec):
+    """
+    Run one job spec end to end. Returns True if every download succeeded.
+    """
+    problem = job_spec_problem(spec)
+    if problem:
+        print(f"[Error] Invalid job spec for {spec.get('project')}: {problem}")
+        return False
+    project = spec["project"]
+    if project not in CATALOG:
+        print(f"[Error] Unknown project: {project}")
+        return False
+    regex = spec.get("version") or ""
+    file_filter = spec.get("file_filter") or None
+    try:
+        compile_version_regex(regex)
+        if file_filter:
+            re.compile(file_filter)
+    except re.error as ex:
+        print(f"[Error] Invalid regex in job spec for {project}: {ex}")
+        return False
+
+    results = select_entries(project, spec.get("source", "catalog"), regex, spec.get("realm"), spec.get("platform"))
+    if spec.get("limit"):
+        results = results[:spec["limit"]]
+    print(f"[Batch] project={project}, version_regex='{regex or 'ALL'}', platform={spec.get('platform') or 'ANY'}, "
+          f"realm={spec.get('realm') or 'ANY'}: {len(results)} entries")
+    if not results:
+        return True
+
+    langs = normalize_langs(spec.get("langs"))
+    base_langs_list = langs.split("|") if langs else []
+    mode = spec.get("mode", "d")
+
+    def confirm_plan(jobs, totals):
+        if totals is None:
+            return not spec.get("plan")
+        enough_space = print_plan(jobs, totals)
+        return enough_space and not spec.get("plan")
+
+    done = run_downloads(project, results, mode, base_langs_list, file_filter, spec.get("jobs") or RMAN_WORKERS,
+                         confirm=confirm_plan, dedup=spec.get("dedup", DEDUP_INLINE))
+    if done is None:
+        # A plan-only run is a success, a batch stopped for lack of disk space is not
+        return bool(spec.get("plan"))
+    enforce_cache_budget()
+    return all(j["returncode"] == 0 for j in done)
+
+def batch_main(args):
+    if args.spec:
+        try:
+            specs = load_job_specs(args.spec)
+        except (OSError, ValueError) as ex:
+            print(f"[Error] Could not read job spec {args.spec}: {ex}")
+            return 2
+    else:
+        if not args.project:
+            print("[Error] batch needs --project or --spec")
+            return 2
+        specs = [{k: v for k, v in vars(args).items() if k in BATCH_FIELDS and v is not None}]
+
+    ok = True
+    for spec in specs:
+        ok = run_batch_job(spec) and ok
+    save_stats_index()
+    return 0 if ok else 1
+
+# ---------- Query Service ----------
+# `serve` loads the catalog and its indexes once and answers JSON queries on localhost,
+# so tools can search thousands of times a minute without paying the startup cost:
+#   GET  /projects
+#   GET  /entries?project=lol&version=^14\.&realm=NA1&platform=windows&since=2024-01&until=2024-06
+#                &cached=1&built=0&text=14.1&page=1&per_page=50
+#   GET  /downloads[?batch=<batch>]
+#   POST /downloads       {"project": "lol", "manifest_ids": [...]} or the batch filter keys, plus
+#                         "mode", "langs", "file_filter", "jobs", "dedup"
+#   POST /update-catalog  {"url": "..."} (optional)
+# Downloads go through the download queue and run one batch at a time on a background thread.
+
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8765
+SERVICE_PAGE_SIZE = 50
+SERVICE_MAX_PAGE_SIZE = 1000
+
+# Queries and catalog updates take turns; the indexes are not safe to read while a delta is applied
+_SERVICE_LOCK = threading.Lock()
+_BUILT_IDS = {}
+
+class ServiceError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+def built_manifest_ids(project):
+    """
+    frozenset of the manifest IDs with an extracted or packed build. Costs one stat while nothing changed.
+    """
+    proj_dir = BUILDS_DIR / project
+    try:
+        mtime = proj_dir.stat().st_mtime_ns
+    except OSError:
+        return frozenset()
+    known = _BUILT_IDS.get(project)
+    if known and known[0] == mtime:
+        return known[1]
+    ids = set()
+    with os.scandir(proj_dir) as it:
+        for e in it:
+            if e.name.startswith("."):
+                continue
+            if e.name.endswith(PACK_EXT):
+                name = e.name[:-len(PACK_EXT)]
+            elif e.is_dir():
+                name = e.name
+            else:
+                continue
+            # A two-part build counts for both of its manifests
+            ids.update(build_manifest_id(name).split("+"))
+    ids = frozenset(ids)
+    _BUILT_IDS[project] = (mtime, ids)
+    return ids
+
+def _flag(params, name):
+    value = params.get(name)
+    if value in (None, ""):
+        return None
+    if value.lower() in ("1", "true", "yes"):
+        return True
+    if value.lower() in ("0", "false", "no"):
+        return False
+    raise ServiceError(f"{name} must be 1 or 0")
+
+def _int_param(params, name, default, low, high):
+    try:
+        value = int(params.get(name) or default)
+    except ValueError:
+        raise ServiceError(f"{name} must be a number")
+    return max(low, min(high, value))
+
+def service_query(params):
+    """
+    One page of catalog entries matching the query parameters (see the section comment).
+    """
+    project = params.get("project")
+    if project not in CATALOG:
+        raise ServiceError(f"unknown project: {project}", 404)
+    regex = params.get("version") or ""
+    try:
+        compile_version_regex(regex)
+    except re.error as ex:
+        raise ServiceError(f"invalid version regex: {ex}")
+    cached_flag, built_flag = _flag(params, "cached"), _flag(params, "built")
+    since, until = params.get("since"), params.get("until")
+    page = _int_param(params, "page", 1, 1, 10 ** 9)
+    per_page = _int_param(params, "per_page", SERVICE_PAGE_SIZE, 1, SERVICE_MAX_PAGE_SIZE)
+
+    with _SERVICE_LOCK:
+        cached = cached_manifest_ids(project)
+        built = built_manifest_ids(project)
+        subset = None
+        if cached_flag:
+            subset = cached
+        if built_flag:
+            subset = built if subset is None else subset & built
+        results = get_catalog_index(project).query(regex, params.get("realm") or None, params.get("platform") or None,
+                                                   subset, params.get("text") or "")
+    if cached_flag is False or built_flag is False or since or until:
+        def keep(mid, entry):
+            ts = entry.get("timestamp", "")
+            return ((cached_flag is not False or mid not in cached)
+                    and (built_flag is not False or mid not in built)
+                    and (not since or ts >= since)
+                    # A date prefix like 2024-06 includes the whole month
+                    and (not until or ts[:len(until)] <= until))
+        results = [(mid, e) for mid, e in results if keep(mid, e)]
+
+    start = (page - 1) * per_page
+    return {
+        "project": project,
+        "total": len(results),
+        "page": page,
+        "per_page": per_page,
+        "pages": (len(results) - 1) // per_page + 1 if results else 0,
+        "entries": [dict(e, manifest_id=mid, cached=mid in cached, built=mid in built)
+                    for mid, e in results[start:start + per_page]],
+    }
+
+def service_projects():
+    with _SERVICE_LOCK:
+        return {"projects": [{"project": p, "entries": len(CATALOG[p]), "cached": len(cached_manifest_ids(p)),
+                              "built": len(built_manifest_ids(p))} for p in CATALOG]}
+
+class DownloadService:
+    """
+    Runs the downloads posted to the service, one batch after another on a background thread.
+    """
+    def __init__(self):
+        self.batches = {}
+        self._pending = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="downloads", daemon=True)
+        self._thread.start()
+
+    def submit(self, body):
+        project = body.get("project")
+        if project not in CATALOG:
+            raise ServiceError(f"unknown project: {project}", 404)
+        unknown = set(body) - set(BATCH_FIELDS) - {"manifest_ids"}
+        if unknown:
+            raise ServiceError(f"unknown keys: {', '.join(sorted(unknown))}")
+        mode = body.get("mode", "d")
+        if mode not in DOWNLOAD_MODES:
+            raise ServiceError("mode must be m, d or u")
+        file_filter = body.get("file_filter") or None
+        try:
+            if file_filter:
+                re.compile(file_filter)
+            with _SERVICE_LOCK:
+                if body.get("manifest_ids"):
+                    entries = CATALOG[project]
+                    missing = [mid for mid in body["manifest_ids"] if mid not in entries]
+                    if missing:
+                        raise ServiceError(f"not in the {project} catalog: {', '.join(missing[:10])}", 404)
+                    results = [(mid, entries[mid]) for mid in body["manifest_ids"]]
+                else:
+                    results = select_entries(project, body.get("source", "catalog"), body.get("version") or "",
+                                             body.get("realm"), body.get("platform"))
+        except re.error as ex:
+            raise ServiceError(f"invalid regex: {ex}")
+        try:
+            limit = int(body.get("limit") or 0)
+            workers = int(body.get("jobs") or RMAN_WORKERS)
+        except (TypeError, ValueError):
+            raise ServiceError("limit and jobs must be numbers")
+        if limit:
+            results = results[:limit]
+        if not results:
+            raise ServiceError("no entries match")
+
+        langs = normalize_langs(body.get("langs"))
+        base_langs_list = langs.split("|") if langs else []
+        dedup = bool(body.get("dedup", DEDUP_INLINE))
+        batch = f"service-{time.strftime('%Y-%m-%dT%H:%M:%S')}-{random.randrange(16 ** 4):04x}"
+        queue_add(batch, project, [mid for mid, _ in results], mode, base_langs_list, file_filter, dedup, workers)
+        self.batches[batch] = {"batch": batch, "project": project, "mode": mode, "entries": len(results), "state": "queued"}
+        self._pending.put((batch, project, results, mode, base_langs_list, file_filter, workers, dedup))
+        return self.batches[batch]
+
+    def _run(self):
+        while True:
+            batch, project, results, mode, base_langs_list, file_filter, workers, dedup = self._pending.get()
+            record = self.batches[batch]
+            record["state"] = "running"
+
+            def confirm_plan(jobs, totals):
+                # Nobody is there to say yes, so only a batch that fits on the disk goes ahead
+                return totals is None or print_plan(jobs, totals)
+
+            try:
+                done = run_downloads(project, results, mode, base_langs_list, file_filter, workers,
+                                     confirm=confirm_plan, dedup=dedup, batch=batch)
+                enforce_cache_budget()
+                save_stats_index()
+            except Exception as ex:
+                print(f"[Error] Service batch {batch} failed: {ex}")
+                record.update(state="failed", error=str(ex))
+                continue
+            if done is None:
+                record.update(state="refused", error="not enough free disk space")
+            else:
+                failed = sum(1 for j in done if j["returncode"] != 0)
+                record.update(state="failed" if failed else "done", failed=failed)
+
+    def status(self, batch=None):
+        if batch:
+            if batch not in self.batches and not queue_execute("SELECT 1 FROM downloads WHERE batch = ? LIMIT 1", (batch,)):
+                raise ServiceError(f"unknown batch: {batch}", 404)
+            rows = queue_execute("SELECT * FROM downloads WHERE batch = ? ORDER BY rowid", (batch,))
+            return dict(self.batches.get(batch, {"batch": batch}), downloads=[dict(r) for r in rows])
+        return {"counts": queue_counts(), "batches": list(self.batches.values())}
+
+class QueryHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "DownloadManager"
+    # Headers and body go out in one write; with Nagle on, keep-alive clients wait ~40 ms per reply
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        # One line per request would drown the download output at thousands of queries a minute
+        pass
+
+    def send_json(self, status, obj):
+        body = json.dumps(obj).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        try:
+            body = json.loads(self.rfile.read(length))
+        except ValueError as ex:
+            raise ServiceError(f"invalid JSON: {ex}")
+        if not isinstance(body, dict):
+            raise ServiceError("the request body must be a JSON object")
+        return body
+
+    def handle_request(self, method):
+        url = urllib.parse.urlsplit(self.path)
+        params = {k: v[-1] for k, v in urllib.parse.parse_qs(url.query).items()}
+        routes = {
+            ("GET", "/projects"): lambda: service_projects(),
+            ("GET", "/entries"): lambda: service_query(params),
+            ("GET", "/downloads"): lambda: self.server.downloads.status(params.get("batch")),
+            ("POST", "/downloads"): lambda: self.server.downloads.submit(self.read_json()),
+            ("POST", "/update-catalog"): lambda: self.server.update_catalog(self.read_json().get("url")),
+        }
+        handler = routes.get((method, url.path.rstrip("/") or "/"))
+        try:
+            if handler is None:
+                raise ServiceError(f"no such endpoint: {method} {url.path}", 404)
+            self.send_json(200, handler())
+        except ServiceError as ex:
+            self.send_json(ex.status, {"error": str(ex)})
+        except Exception as ex:
+            print(f"[Error] {method} {self.path}: {ex}")
+            self.send_json(500, {"error": str(ex)})
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+class QueryServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address):
+        super().__init__(address, QueryHandler)
+        self.downloads = DownloadService()
+
+    def update_catalog(self, url=None):
+        url = url or CATALOG_URL
+        if not url:
+            raise ServiceError("no catalog URL set")
+        try:
+            with _SERVICE_LOCK:
+                summary = update_catalog(url)
+        except (requests.RequestException, OSError, ValueError, KeyError) as ex:
+            raise ServiceError(f"catalog update failed: {ex}", 502)
+        return {"updated": {p: {"added": a, "removed": r} for p, (a, r) in summary.items()}}
+
+def serve(host=SERVICE_HOST, port=SERVICE_PORT):
+    # Build every index up front, so the first query of each project is as fast as the rest
+    for project in CATALOG:
+        get_catalog_index(project)
+        cached_manifest_ids(project)
+    server = QueryServer((host, port))
+    print(f"[Service] Answering catalog queries on http://{host}:{server.server_address[1]}/ (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("[Service] Stopped.")
+    finally:
+        server.server_close()
+        save_stats_index()
+    return 0
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Riot Archive Project download manager. Run without arguments for the interactive menu.")
+    parser.add_argument("--limit-mb", dest="limit_mb", type=float, help="cap CDN traffic at this many MB/s (0 = unlimited)")
+    parser.add_argument("--connections", type=int, help="cap the number of CDN connections open at once (0 = unlimited)")
+    parser.add_argument("--profile", choices=["spans", "cprofile", "sample"],
+                        help="time the slow stages and write a report to Logs/ at exit (same as DM_PROFILE)")
+    sub = parser.add_subparsers(dest="command")
+
+    batch = sub.add_parser("batch", help="download without the interactive menu")
+    batch.add_argument("--spec", help="JSON job spec file (one job or a list of jobs)")
+    batch.add_argument("--project", help="project to download from, e.g. lol")
+    batch.add_argument("--source", choices=["catalog", "cache"], help="search the full catalog (default) or only cached manifests")
+    batch.add_argument("--version", help="version regex")
+    batch.add_argument("--realm", help="only entries deployed to this realm")
+    batch.add_argument("--platform", help="only entries for this platform")
+    batch.add_argument("--langs", help="language/tag filter, e.g. en_US|fr_FR")
+    batch.add_argument("--file-filter", dest="file_filter", help="regex of files to download")
+    batch.add_argument("--mode", choices=DOWNLOAD_MODES, help="m = manifests only, d = manifests + rman-dl (default), u = upgrade from existing builds")
+    batch.add_argument("--jobs", type=int, help="parallel rman-dl jobs")
+    batch.add_argument("--limit", type=int, help="only the newest N matching entries")
+    batch.add_argument("--plan", action="store_true", default=None, help="fetch manifests and print the pre-flight plan, download nothing")
+    batch.add_argument("--dedup", action="store_true", default=None, help="hardlink identical files into the shared store after each build")
+
+    upgrade = sub.add_parser("upgrade", help="build a newer manifest from an existing build, fetching only what changed")
+    upgrade.add_argument("build", help="existing build directory")
+    upgrade.add_argument("manifest", help="target manifest ID")
+    upgrade.add_argument("--project", help="project of the build (default: its parent folder name)")
+    upgrade.add_argument("--langs", help="language/tag filter, e.g. en_US|fr_FR")
+    upgrade.add_argument("--file-filter", dest="file_filter", help="regex of files to download")
+
+    queue_cmd = sub.add_parser("queue", help="show the download queue, or resume what did not finish")
+    queue_cmd.add_argument("--resume", action="store_true", help="run every unfinished download again")
+    queue_cmd.add_argument("--clear", action="store_true", help="forget every unfinished download")
+
+    update = sub.add_parser("update-catalog", help="fetch catalog changes from CATALOG_URL")
+    update.add_argument("--url", help="catalog.json URL, or a catalog folder URL ending in /")
+
+    dedup = sub.add_parser("dedup", help="store identical build files once and hardlink them into each build")
+    dedup.add_argument("project")
+    dedup.add_argument("builds", nargs="*", help="build directories (default: every build of the project)")
+    dedup.add_argument("--gc", action="store_true", help="also remove store entries no build uses anymore")
+
+    verify = sub.add_parser("verify", help="check builds against their manifests and list damaged files")
+    verify.add_argument("builds", nargs="+", help="build directories")
+    verify.add_argument("--project", help="project of the builds (default: their parent folder name)")
+    verify.add_argument("--langs", help="language/tag filter the builds were made with (default: from <build>_filter.txt)")
+    verify.add_argument("--file-filter", dest="file_filter", help="file regex the builds were made with")
+    verify.add_argument("--workers", type=int, default=VERIFY_WORKERS, help="hashing processes")
+    verify.add_argument("--repair", action="store_true", help="re-download the damaged files with rman-dl")
+
+    pack = sub.add_parser("pack", help="pack builds into compressed .dmpack files for cold storage")
+    pack.add_argument("builds", nargs="+", help="build directories")
+    pack.add_argument("--project", help="project of the builds (default: their parent folder name)")
+    pack.add_argument("--remove", action="store_true", help="delete each build once its pack has been written and checked")
+    pack.add_argument("--workers", type=int, default=PACK_WORKERS, help="compression threads")
+    pack.add_argument("--level", type=int, default=PACK_LEVEL, help="compression level")
+
+    unpack = sub.add_parser("unpack", help="extract a packed build, or only some of its files")
+    unpack.add_argument("pack", help=".dmpack file")
+    unpack.add_argument("--files", help="regex of the files to extract (default: all of them)")
+    unpack.add_argument("--dest", help="folder to extract to (default: the build folder, or the current folder with --files)")
+    unpack.add_argument("--list", action="store_true", help="show the pack metadata and files, extract nothing")
+    unpack.add_argument("--remove", action="store_true", help="delete the pack once the whole build is extracted")
+    unpack.add_argument("--workers", type=int, default=PACK_WORKERS, help="extraction threads")
+
+    files = sub.add_parser("files", help="find which cached manifests contain a file, and when it changed")
+    files.add_argument("project")
+    files.add_argument("pattern", help="regex of file paths, e.g. Ahri.*\\.wad")
+    files.add_argument("--history", action="store_true", help="list every version where the file changed")
+    files.add_argument("--limit", type=int, default=50, help="show at most this many matching paths")
+
+    serve_cmd = sub.add_parser("serve", help="answer catalog queries and take downloads over a local JSON API")
+    serve_cmd.add_argument("--host", default=SERVICE_HOST, help=f"address to listen on (default {SERVICE_HOST})")
+    serve_cmd.add_argument("--port", type=int, default=SERVICE_PORT, help=f"port to listen on (default {SERVICE_PORT})")
+
+    manifest = sub.add_parser("manifest", help="show what a cached manifest contains and what downloading it would cost")
+    manifest.add_argument("project")
+    manifest.add_argument("manifest", help="manifest ID or path to a .manifest file")
+    manifest.add_argument("--langs", help="language/tag filter, e.g. en_US|fr_FR")
+    manifest.add_argument("--file-filter", dest="file_filter", help="regex of files to download")
+    manifest.add_argument("--files", action="store_true", help="list the selected files")
+    return parser
+
+def upgrade_main(args):
+    base_dir = Path(args.build)
+    project = args.project or base_dir.resolve().parent.name
+    if project not in CATALOG or not base_dir.is_dir():
+        print(f"[Error] {base_dir} is not a build of a known project")
+        return 2
+    entry = CATALOG[project].get(args.manifest)
+    if entry is None:
+        print(f"[Error] Manifest {args.manifest} is not in the {project} catalog")
+        return 2
+    manifests = prefetch_manifests(project, [build_manifest_id(base_dir), args.manifest])
+    if len(manifests) < 2:
+        return 1
+    langs = normalize_langs(args.langs)
+    lang_str = entry_langs(project, entry, langs.split("|") if langs else [])
+    outdir = build_output_dir(project, args.manifest, entry, lang_str)
+    job = {
+        "label": outdir.name,
+        "manifest_id": args.manifest,
+        "entry": entry,
+        "manifest_path": manifests[args.manifest],
+        "outdir": outdir,
+        "langs": lang_str,
+        "file_filter": args.file_filter,
+        "base": (base_dir, manifests[build_manifest_id(base_dir)]),
+        "prepare": functools.partial(prepare_upgrade, project),
+    }
+    done = run_rman_jobs(project, [job], 1)
+    return 0 if done[0]["returncode"] == 0 else 1
+
+def queue_main(args):
+    if args.clear:
+        queue_execute("DELETE FROM downloads WHERE state != 'done'")
+        print("[Queue] Cleared unfinished downloads.")
+    if args.resume:
+        ok = resume_downloads()
+        save_stats_index()
+        return 0 if ok else 1
+    show_queue()
+    return 0
+
+def dedup_main(args):
+    builds = [Path(b) for b in args.builds] or list_builds(args.project)
+    total_linked = total_saved = 0
+    for b in builds:
+        if not b.is_dir():
+            print(f"[Warn] Not a build directory: {b}")
+            continue
+        linked, saved = dedup_build(b)
+        total_linked += linked
+        total_saved += saved
+        print(f"[Dedup] {b.name}: {linked} files linked, {format_mb(saved)} saved")
+    print(f"[Dedup] Total: {total_linked} files linked, {format_mb(total_saved)} saved")
+    if args.gc:
+        print(f"[Dedup] Removed unused store entries, {format_mb(gc_store(args.project))} freed")
+    save_stats_index()
+    return 0
+
+def verify_main(args):
+    ok = True
+    for b in args.builds:
+        build_dir = Path(b)
+        project = args.project or build_dir.resolve().parent.name
+        if project not in CATALOG or not build_dir.is_dir():
+            print(f"[Error] {build_dir} is not a build of a known project")
+            ok = False
+            continue
+        langs, file_filter = build_filters(build_dir)
+        langs = normalize_langs(args.langs) or langs
+        file_filter = args.file_filter or file_filter
+        try:
+            result = verify_build(project, build_dir, langs, file_filter, args.workers)
+        except Exception as ex:
+            print(f"[Error] Could not verify {build_dir.name}: {ex}")
+            ok = False
+            continue
+        damaged = sum(len(files) for files in result["damaged"].values())
+        rate = result["bytes"] / max(result["elapsed"], 1e-6)
+        print(f"[Verify] {build_dir.name}: {result['files']} files, {format_mb(result['bytes'])} checked "
+              f"in {result['elapsed']:.1f}s ({format_mb(rate)}/s), {damaged} damaged")
+        if not damaged:
+            continue
+        for folder, files in result["damaged"].items():
+            for rel, problem in sorted(files.items()):
+                print(f"  [Damaged] {(folder / rel).relative_to(build_dir)}: {problem}")
+        print(f"[Verify] rman-dl -p filters for the damaged files: {write_repair_list(build_dir, result['damaged'])}")
+        # A repaired build counts as good, a damaged one that was only reported does not
+        ok = (args.repair and repair_build(project, build_dir, result, langs)) and ok
+    save_stats_index()
+    return 0 if ok else 1
+
+def pack_main(args):
+    ok = True
+    for b in args.builds:
+        build_dir = Path(b)
+        project = args.project or build_dir.resolve().parent.name
+        if not build_dir.is_dir():
+            print(f"[Error] Not a build directory: {build_dir}")
+            ok = False
+            continue
+        try:
+            result = pack_build(project, build_dir, workers=args.workers, level=args.level)
+            if args.remove:
+                with BuildPack(result["path"]) as pack:
+                    pack.check(args.workers)
+        except (OSError, ValueError, RuntimeError) as ex:
+            print(f"[Error] Could not pack {build_dir.name}: {ex}")
+            ok = False
+            continue
+        rate = result["bytes"] / max(result["elapsed"], 1e-6)
+        print(f"[Pack] {build_dir.name}: {result['files']} files, {format_mb(result['bytes'])} -> {format_mb(result['packed'])}, "
+              f"{result['unique']} of {result['chunks']} chunks unique, in {result['elapsed']:.1f}s ({format_mb(rate)}/s)")
+        if args.remove:
+            shutil.rmtree(build_dir)
+            filter_path = build_dir.parent / f"{build_dir.name}_filter.txt"
+            if filter_path.exists():
+                filter_path.unlink()
+            forget_build_stats(build_dir)
+            print(f"[Pack] Removed {build_dir.name}, its pack was read back and checked first")
+    save_stats_index()
+    return 0 if ok else 1
+
+def unpack_main(args):
+    try:
+        pack = BuildPack(args.pack)
+    except (OSError, ValueError, RuntimeError) as ex:
+        print(f"[Error] Could not open {args.pack}: {ex}")
+        return 1
+    with pack:
+        meta = pack.index
+        if args.list:
+            print(f"[Pack] {meta['build']}: {meta['project']} {meta['version']} {meta['platform']}, "
+                  f"realms {', '.join(meta['realms']) or 'none'}, langs {meta['langs'] or 'all'}, "
+                  f"{len(pack.files)} files, {format_mb(meta['bytes'])}")
+            for rel, f in pack.files.items():
+                if not args.files or re.search(args.files, rel, re.IGNORECASE):
+                    print(f"{f.get('size', 0):>12}  {rel}")
+            return 0
+        whole = not args.files and not args.dest
+        if args.dest:
+            dest = Path(args.dest)
+        else:
+            dest = Path(args.pack).parent / meta["build"] if whole else Path.cwd()
+        try:
+            count, size = unpack_build(pack, dest, args.files, args.workers)
+        except (OSError, ValueError, re.error) as ex:
+            print(f"[Error] Could not unpack {Path(args.pack).name}: {ex}")
+            return 1
+    print(f"[Unpack] {count} files, {format_mb(size)} written to {dest}")
+    if whole:
+        if meta["langs"]:
+            (dest.parent / f"{dest.name}_filter.txt").write_text(meta["langs"], encoding="utf-8")
+        refresh_build_stats(dest)
+        if args.remove:
+            Path(args.pack).unlink()
+            print(f"[Unpack] Removed {Path(args.pack).name}")
+    elif args.remove:
+        print("[Warn] The pack was kept, --remove only applies when the whole build is extracted to its own folder")
+    save_stats_index()
+    return 0
+
+def files_main(args):
+    if args.project not in CATALOG:
+        print(f"[Error] Unknown project: {args.project}")
+        return 2
+    sync_file_index(args.project)
+    try:
+        found, total = find_indexed_files(args.project, args.pattern, args.limit)
+    except re.error as ex:
+        print(f"[Error] Invalid regex: {ex}")
+        return 2
+    cached = cached_manifest_ids(args.project)
+
+    def label(row):
+        # Manifests that are not in the catalog only have their ID
+        return f"{row[1]} ({row[2]})" if row[1] else row[0]
+
+    for path, rows in found.items():
+        print(f"[Files] {path}")
+        for platform, h in file_history(rows).items():
+            first, last = h["first"], h["last"]
+            print(f"  {platform}: in {h['count']} manifests, first {label(first)}, last {label(last)}, "
+                  f"{len(h['changes'])} different versions")
+            if args.history:
+                for mid, version, timestamp, _, size, _, langs in h["changes"]:
+                    note = "" if mid in cached else "  (manifest no longer cached)"
+                    print(f"    {version or '?':<24} {timestamp or '?':<20} {mid}  {size:>12} bytes  {langs or 'none'}{note}")
+    if total > len(found):
+        print(f"[Files] {total} paths match, showing the first {len(found)} (use --limit)")
+    elif not found:
+        print("[Files] No indexed file matches.")
+    return 0
+
+def manifest_main(args):
+    path = Path(args.manifest)
+    if not path.exists():
+        try:
+            path = download_manifest(args.project, args.manifest)
+        except Exception as ex:
+            print(f"[Error] Could not get manifest {args.manifest}: {ex}")
+            return 1
+    try:
+        manifest = load_manifest(path)
+    except (OSError, ValueError, RuntimeError, struct.error) as ex:
+        print(f"[Error] Could not read {path}: {ex}")
+        return 1
+    langs = normalize_langs(args.langs)
+    plan = plan_manifest(manifest, langs, args.file_filter, shard_cached_chunk_ids(args.project))
+    if args.files:
+        for f in select_files(manifest, langs, args.file_filter):
+            print(f"{f.size:>12}  {'|'.join(f.langs) or 'none':<16}  {f.path}")
+    print(f"[Manifest] {manifest.manifest_id:016X}: {len(manifest.files)} files, {len(manifest.chunks)} chunks in {len(manifest.bundles)} bundles")
+    print(f"[Manifest] Language tags: {', '.join(manifest.language_tags()) or 'none'}")
+    print(f"[Plan] Selected {plan['files']} files, {format_mb(plan['disk_bytes'])} on disk, "
+          f"fetch {format_mb(plan['download_bytes'])} ({format_mb(plan['cached_bytes'])} from cache)")
+    return 0
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    if args.limit_mb is not None:
+        GOVERNOR.rate_mb = args.limit_mb
+    if args.connections is not None:
+        GOVERNOR.connections = args.connections
+    if args.profile:
+        start_profiling(args.profile)
+    if args.command == "batch":
+        return batch_main(args)
+    if args.command == "manifest":
+        return manifest_main(args)
+    if args.command == "dedup":
+        return dedup_main(args)
+    if args.command == "verify":
+        return verify_main(args)
+    if args.command == "pack":
+        return pack_main(args)
+    if args.command == "unpack":
+        return unpack_main(args)
+    if args.command == "upgrade":
+        return upgrade_main(args)
+    if args.command == "queue":
+        return queue_main(args)
+    if args.command == "files":
+        return files_main(args)
+    if args.command == "serve":
+        return serve(args.host, args.port)
+    if args.command == "update-catalog":
+        return 0 if run_catalog_update(args.url) else 1
+    main_menu()
+    return 0
+
 if __name__ == "__main__":
-    main_menu()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,30 @@
+import importlib.util, json, os, tempfile, unittest
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent.parent
+
+
+def load_dm(root):
+    os.environ["DM_ROOT"] = str(root)
+    spec = importlib.util.spec_from_file_location("download_manager", HERE / "download-manager.py")
+    dm = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(dm)
+    return dm
+
+
+class DMTestCase(unittest.TestCase):
+    """
+    The script loaded against an empty root in a temporary directory, with `catalog` as its catalog.json.
+    """
+    catalog = {"lol": {}}
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        (self.root / "catalog.json").write_text(json.dumps(self.catalog), encoding="utf-8")
+        self.dm = load_dm(self.root)
+
+    def tearDown(self):
+        if self.dm._QUEUE is not None:
+            self.dm._QUEUE.close()
+        self.tmp.cleanup()
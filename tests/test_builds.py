@@ -0,0 +1,113 @@
+import unittest
+
+from dmtest import DMTestCase
+
+
+class UpgradeTest(DMTestCase):
+    def setUp(self):
+        super().setUp()
+        self.proj = self.dm.BUILDS_DIR / "lol"
+
+    def manifest(self, mid, files):
+        """
+        A manifest with one file per (path, chunk id, size).
+        """
+        return self.dm.Manifest(mid, [self.dm.ManifestFile(path, size, [], (cid,), "", 0) for path, cid, size in files],
+                                {}, {}, {})
+
+    def build(self, name, files):
+        for path, data in files.items():
+            f = self.proj / name / path
+            f.parent.mkdir(parents=True, exist_ok=True)
+            f.write_bytes(data)
+        return self.proj / name
+
+    def upgrade(self, old, new, base, name, fetched):
+        outdir = self.proj / name
+        linked, _, fetch = self.dm.link_unchanged_files(old, new, base, outdir)
+        # What rman-dl would write for the rest
+        self.build(name, {f.path: fetched[f.path] for f in fetch})
+        return outdir, linked
+
+    def test_upgrade_counts_shared_files_once(self):
+        old = self.manifest("1", [("a.bin", 1, 1000), ("b.bin", 2, 500)])
+        new = self.manifest("2", [("a.bin", 1, 1000), ("b.bin", 3, 600)])
+        base = self.build("lol-1", {"a.bin": b"a" * 1000, "b.bin": b"b" * 500})
+        _, linked = self.upgrade(old, new, base, "lol-2", {"b.bin": b"c" * 600})
+        self.assertEqual(linked, 1)
+        self.dm.refresh_store_stats("lol")
+        self.assertEqual(self.dm.project_build_stats("lol"), (1500 + 1600, 2, 1000 + 500 + 600))
+
+    def test_second_upgrade_links_from_the_store(self):
+        v1 = self.manifest("1", [("a.bin", 1, 1000), ("b.bin", 2, 500)])
+        v2 = self.manifest("2", [("a.bin", 1, 1000), ("b.bin", 3, 600)])
+        v3 = self.manifest("3", [("a.bin", 1, 1000), ("b.bin", 3, 600), ("c.bin", 4, 700)])
+        base = self.build("lol-1", {"a.bin": b"a" * 1000, "b.bin": b"b" * 500})
+        second, _ = self.upgrade(v1, v2, base, "lol-2", {"b.bin": b"c" * 600})
+        self.upgrade(v2, v3, second, "lol-3", {"c.bin": b"d" * 700})
+        self.dm.refresh_store_stats("lol")
+        size, count, physical = self.dm.project_build_stats("lol")
+        self.assertEqual((size, count), (1500 + 1600 + 2300, 3))
+        self.assertEqual(physical, 1000 + 500 + 600 + 700)
+
+    def test_only_unchanged_intact_files_are_linked(self):
+        old = self.manifest("1", [("same.bin", 1, 10), ("edited.bin", 2, 10), ("changed.bin", 3, 10), ("gone.bin", 4, 10)])
+        new = self.manifest("2", [("same.bin", 1, 10), ("edited.bin", 2, 10), ("changed.bin", 5, 10),
+                                  ("gone.bin", 4, 10), ("added.bin", 6, 10)])
+        base = self.build("lol-1", {"same.bin": b"s" * 10, "edited.bin": b"e" * 12, "changed.bin": b"c" * 10})
+        linked, linked_bytes, fetch = self.dm.link_unchanged_files(old, new, base, self.proj / "lol-2")
+        self.assertEqual((linked, linked_bytes), (1, 10))
+        self.assertEqual(sorted(f.path for f in fetch), ["added.bin", "changed.bin", "edited.bin", "gone.bin"])
+        self.assertEqual((self.proj / "lol-2" / "same.bin").read_bytes(), b"s" * 10)
+
+
+class DedupTest(DMTestCase):
+    def build(self, name, data):
+        f = self.dm.BUILDS_DIR / "lol" / name / "a.bin"
+        f.parent.mkdir(parents=True, exist_ok=True)
+        f.write_bytes(data)
+        return f.parent
+
+    def test_identical_files_are_stored_once(self):
+        first = self.build("lol-1", b"a" * 1000)
+        second = self.build("lol-2", b"a" * 1000)
+        self.assertEqual(self.dm.dedup_build(first), (0, 0))
+        self.assertEqual(self.dm.dedup_build(second), (1, 1000))
+        self.assertEqual(self.dm.project_build_stats("lol"), (2000, 2, 1000))
+
+    def test_entry_stored_by_another_build_meanwhile(self):
+        # Another dedup stores the same content after this one hashed its files
+        build = self.build("lol-1", b"a" * 1000)
+        other = self.build("lol-2", b"a" * 1000) / "a.bin"
+        hash_file = self.dm.hash_file
+
+        def hash_then_race(path):
+            digest = hash_file(path)
+            self.dm.add_to_store(other, self.dm.BUILDS_DIR / "lol" / ".store" / digest[:2] / digest)
+            return digest
+        self.dm.hash_file = hash_then_race
+        self.assertEqual(self.dm.dedup_build(build), (1, 1000))
+        self.assertEqual((build / "a.bin").stat().st_nlink, 3)
+
+
+class PackStatsTest(DMTestCase):
+    def setUp(self):
+        super().setUp()
+        self.build = self.dm.BUILDS_DIR / "lol" / "lol-14.1-windows-0000000000002222"
+        self.build.mkdir(parents=True)
+        (self.build / "a.bin").write_bytes(b"a" * 1000)
+        self.dm.pack_build("lol", self.build)
+
+    def test_pack_next_to_its_build_is_not_counted_again(self):
+        size, count, disk = self.dm.project_pack_stats("lol")
+        self.assertEqual((size, count), (0, 0))
+        self.assertGreater(disk, 0)
+        self.assertEqual(self.dm.project_build_stats("lol")[:2], (1000, 1))
+
+    def test_pack_of_a_removed_build_is_counted(self):
+        self.dm.shutil.rmtree(self.build)
+        self.assertEqual(self.dm.project_pack_stats("lol")[:2], (1000, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
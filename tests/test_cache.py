@@ -0,0 +1,31 @@
+import json, unittest
+
+from dmtest import DMTestCase
+
+
+class CacheBudgetTest(DMTestCase):
+    def bundle(self, name, size):
+        path = self.dm.CACHE_DIR / "lol" / "bundles" / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"b" * size)
+        return path
+
+    def saved_usage(self):
+        return json.loads(self.dm.CACHE_USAGE_PATH.read_text(encoding="utf-8"))
+
+    def test_usage_is_saved_under_budget(self):
+        self.dm.touch_cache(self.bundle("lol-cache.bundle", 100))
+        self.assertEqual(self.dm.enforce_cache_budget(budget_mb=1), 0)
+        self.assertIn("lol/bundles/lol-cache.bundle", self.saved_usage())
+
+    def test_least_recently_used_goes_first(self):
+        old, new = self.bundle("lol-cache.bundle", 600 * 1024), self.bundle("lol-cache-1.bundle", 600 * 1024)
+        self.dm.load_cache_usage().update({"lol/bundles/lol-cache.bundle": 1, "lol/bundles/lol-cache-1.bundle": 2})
+        self.assertEqual(self.dm.enforce_cache_budget(budget_mb=1, low_water_mb=1), 600 * 1024)
+        self.assertFalse(old.exists())
+        self.assertTrue(new.exists())
+        self.assertEqual(list(self.saved_usage()), ["lol/bundles/lol-cache-1.bundle"])
+
+
+if __name__ == "__main__":
+    unittest.main()
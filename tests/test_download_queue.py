@@ -0,0 +1,94 @@
+import json, unittest
+from pathlib import Path
+
+from dmtest import DMTestCase
+
+
+class QueueTestCase(DMTestCase):
+    """
+    A one-entry lol catalog with the manifest fetch and rman-dl replaced by stand-ins.
+    """
+    MID = "00000000000000AA"
+    entry = {"version": "14.1", "timestamp": "2024-01-01T00:00:00", "platform": "windows", "realms": ["NA1"]}
+    catalog = {"lol": {MID: entry}}
+
+    def setUp(self):
+        super().setUp()
+        manifest = self.dm.CACHE_DIR / "lol" / "releases" / f"{self.MID}.manifest"
+        self.dm.prefetch_manifests = lambda project, ids: {mid: manifest for mid in ids}
+        self.dm.plan_jobs = lambda project, jobs: None
+        self.runs = []
+
+        def fake_rman_jobs(project, jobs, workers):
+            # What run_job records for a successful extraction
+            for job in jobs:
+                self.dm.queue_set_state(project, job["manifest_id"], job["mode"], "extracting", outdir=job["outdir"],
+                                        langs=job.get("langs"), file_filter=job.get("file_filter"))
+                self.dm.queue_set_state(project, job["manifest_id"], job["mode"], "done", returncode=0)
+                job["returncode"] = 0
+                self.runs.append(job.get("file_filter"))
+            return jobs
+        self.dm.run_rman_jobs = fake_rman_jobs
+
+    def download(self, file_filter):
+        return self.dm.run_downloads("lol", [(self.MID, self.entry)], "d", [], file_filter)
+
+
+class DoneBuildSkipTest(QueueTestCase):
+    def filter_on_record(self):
+        rows = self.dm.queue_execute("SELECT file_filter FROM downloads WHERE manifest_id = ?", (self.MID,))
+        return rows[0]["file_filter"]
+
+    def test_same_filter_is_skipped(self):
+        self.download(r"\.exe$")
+        self.assertEqual(self.download(r"\.exe$"), [])
+        self.assertEqual(self.runs, [r"\.exe$"])
+
+    def test_different_filter_is_not_skipped(self):
+        self.download(r"\.exe$")
+        done = self.download(None)
+        self.assertEqual(len(done), 1)
+        self.assertEqual(self.runs, [r"\.exe$", None])
+        self.assertIsNone(self.filter_on_record())
+
+    def test_requeue_keeps_filter_of_done_build(self):
+        self.download(r"\.exe$")
+        self.dm.queue_add("later", "lol", [self.MID], "d", [], None, False, 1)
+        self.assertEqual(self.filter_on_record(), r"\.exe$")
+
+
+class DownloadModeTest(QueueTestCase):
+    def queued_modes(self):
+        return [r["mode"] for r in self.dm.queue_execute("SELECT mode FROM downloads")]
+
+    def test_unknown_mode_is_not_queued(self):
+        with self.assertRaises(ValueError):
+            self.dm.run_downloads("lol", [(self.MID, self.entry)], "x", [])
+        self.assertEqual(self.queued_modes(), [])
+
+    def test_resume_builds_unfinished_entries(self):
+        self.dm.queue_add("old", "lol", [self.MID], "d", [], r"\.exe$", False, 1)
+        self.assertTrue(self.dm.resume_downloads())
+        self.assertEqual(self.runs, [r"\.exe$"])
+        self.assertEqual(self.dm.queue_pending(), [])
+
+    def test_resume_drops_unknown_mode(self):
+        self.dm.queue_add("old", "lol", [self.MID], "x", [], None, False, 1)
+        self.assertTrue(self.dm.resume_downloads())
+        self.assertEqual(self.dm.queue_pending(), [])
+        self.assertEqual(self.runs, [])
+
+    def test_menu_asks_again_for_unknown_mode(self):
+        answers = iter(["x", "U"])
+        self.dm.input_with_help = lambda prompt: next(answers)
+        self.assertEqual(self.dm.ask_download_mode(), "u")
+
+    def test_job_spec_with_unknown_mode_is_rejected(self):
+        spec = self.root / "spec.json"
+        spec.write_text(json.dumps({"project": "lol", "mode": "x"}), encoding="utf-8")
+        with self.assertRaises(ValueError):
+            self.dm.load_job_specs(spec)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,36 @@
+import json, unittest
+
+from dmtest import DMTestCase
+
+
+class JobSpecTest(DMTestCase):
+    def load(self, specs):
+        path = self.root / "spec.json"
+        path.write_text(json.dumps(specs), encoding="utf-8")
+        return self.dm.load_job_specs(path)
+
+    def test_valid_specs_load(self):
+        specs = [{"project": "lol", "mode": "u", "source": "cache", "jobs": 4, "limit": 2, "langs": ["en_US"], "plan": True},
+                 {"project": "lol"}]
+        self.assertEqual(self.load(specs), specs)
+        self.assertEqual(self.load({"project": "lol"}), [{"project": "lol"}])
+
+    def test_bad_values_are_rejected(self):
+        for bad in ({"jobs": "four"}, {"jobs": [4]}, {"jobs": 0}, {"jobs": True}, {"limit": -1},
+                    {"source": "web"}, {"source": None}, {"mode": "x"}, {"version": 14}, {"langs": [1]},
+                    {"plan": "yes"}, {"colour": "red"}):
+            with self.subTest(bad=bad), self.assertRaises(ValueError):
+                self.load([{"project": "lol"}, dict({"project": "lol"}, **bad)])
+
+    def test_bad_files_are_rejected(self):
+        for bad in ("lol", [{"mode": "d"}], ["lol"]):
+            with self.subTest(bad=bad), self.assertRaises(ValueError):
+                self.load(bad)
+
+    def test_bad_spec_fails_only_itself(self):
+        self.dm.run_downloads = lambda *args, **kwargs: self.fail("an invalid spec was run")
+        self.assertFalse(self.dm.run_batch_job({"project": "lol", "jobs": "four"}))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import unittest
+
+from dmtest import DMTestCase
+
+
+class PlanTestCase(DMTestCase):
+    """
+    Manifests and cache bundles served from memory instead of files.
+    """
+    def setUp(self):
+        super().setUp()
+        self.manifests = {}
+        self.bundles = {}
+        self.dm.load_manifest = lambda path: self.manifests[path]
+        self.dm.read_bundle_chunk_ids = lambda path: self.bundles.get(path.name)
+
+    def job(self, name, chunks, chain=None):
+        """
+        A job whose manifest has one file made of `chunks`, each 100 bytes compressed.
+        """
+        dm = self.dm
+        self.manifests[name] = dm.Manifest(name, [dm.ManifestFile("a.bin", 1000, [], tuple(chunks), "", 0)],
+                                           {c: dm.ManifestChunk(c, 1, 0, 100, 1000) for c in chunks}, {}, {})
+        job = {"label": name, "manifest_path": name, "entry": {"platform": "windows", "timestamp": name}}
+        if chain is not None:
+            job["chain"] = chain
+        return job
+
+
+class PlanJobsTest(PlanTestCase):
+    def test_only_the_own_shard_counts_as_cached(self):
+        self.bundles["lol-cache-1.bundle"] = {1, 2}
+        job = self.job("a", [1, 2, 3])
+        job["shard"] = 0
+        totals = self.dm.plan_jobs("lol", [job])
+        self.assertEqual(job["plan"]["cached_bytes"], 0)
+        self.assertEqual(totals["download_bytes"], 300)
+
+    def test_earlier_jobs_count_on_their_shard_only(self):
+        jobs = [self.job("a", [1, 2], chain=0), self.job("b", [3, 4], chain=1),
+                self.job("c", [1, 2, 5], chain=0), self.job("d", [1, 3], chain=1)]
+        self.assertEqual(self.dm.assign_shards(jobs, 2), 2)
+        self.assertEqual([j["shard"] for j in jobs], [0, 1, 0, 1])
+        totals = self.dm.plan_jobs("lol", jobs)
+        self.assertEqual([j["plan"]["cached_bytes"] for j in jobs], [0, 0, 200, 100])
+        self.assertEqual(totals["download_bytes"], 200 + 200 + 100 + 100)
+
+    def test_unreadable_manifest_has_no_plan(self):
+        job = {"label": "gone", "manifest_path": "gone", "entry": {}}
+
+        def load_manifest(path):
+            raise OSError("missing")
+        self.dm.load_manifest = load_manifest
+        self.assertIsNone(self.dm.plan_jobs("lol", [job]))
+        self.assertIsNone(job["plan"])
+
+
+class OrderJobsTest(PlanTestCase):
+    def test_similar_builds_share_a_chain(self):
+        jobs = [self.job("1", range(1, 11)), self.job("2", range(100, 111)), self.job("3", range(1, 12))]
+        for job in jobs:
+            self.dm.read_job_chunks(job)
+        ordered = self.dm.order_jobs(jobs)
+        self.assertEqual([(j["label"], j["chain"]) for j in ordered], [("1", 0), ("3", 0), ("2", 1)])
+
+    def test_manifests_are_read_once(self):
+        reads = []
+        load_manifest = self.dm.load_manifest
+        self.dm.load_manifest = lambda path: reads.append(path) or load_manifest(path)
+        jobs = [self.job(str(n), range(n, n + 5)) for n in range(12)]
+        for job in jobs:
+            self.dm.read_job_chunks(job)
+        jobs = self.dm.order_jobs(jobs)
+        self.dm.assign_shards(jobs, 4)
+        self.dm.plan_jobs("lol", jobs)
+        self.assertEqual(sorted(reads), sorted(str(n) for n in range(12)))
+        self.assertTrue(all(j["plan"] for j in jobs))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+
+from dmtest import DMTestCase
+
+
+class RunJobsTest(DMTestCase):
+    FETCH = 200
+
+    def setUp(self):
+        super().setUp()
+
+        def fake_rman_dl(project, manifest_path, outdir, langs=None, file_filter=None, use_cache=True,
+                         cache_path=None, log_path=None, append_log=False):
+            # rman-dl appends what it fetches to the cache bundle
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(cache_path, "ab") as f:
+                f.write(b"c" * self.FETCH)
+            return 0, 0.0
+        self.dm.run_rman_dl = fake_rman_dl
+
+    def job(self, mid, **extra):
+        manifest = self.dm.CACHE_DIR / "lol" / "releases" / f"{mid}.manifest"
+        return dict(label=f"lol-{mid}", manifest_id=mid, mode="d", manifest_path=str(manifest),
+                    outdir=str(self.dm.BUILDS_DIR / "lol" / f"lol-{mid}"), **extra)
+
+    def states(self):
+        return {r["manifest_id"]: (r["state"], r["error"]) for r in self.dm.queue_execute("SELECT * FROM downloads")}
+
+    def test_failing_job_does_not_stop_the_batch(self):
+        def broken_prepare(job, say):
+            raise KeyError("base")
+        self.dm.queue_add("b", "lol", ["1", "2"], "d", [], None, False, 2)
+        done = self.dm.run_rman_jobs("lol", [self.job("1", prepare=broken_prepare), self.job("2")], workers=2)
+        self.assertEqual(sorted((j["manifest_id"], j["returncode"]) for j in done), [("1", -1), ("2", 0)])
+        self.assertEqual(self.states(), {"1": ("failed", "'base'"), "2": ("done", None)})
+
+    def test_linked_files_are_not_cache_hits(self):
+        def upgrade(job, say):
+            job["upgrade"] = {"linked_bytes": 5000, "chunk_bytes": 300}
+        job = self.job("1", prepare=upgrade, plan={"total_bytes": 1000})
+        metrics = self.dm.run_rman_jobs("lol", [job], workers=1)[0]["metrics"]
+        self.assertEqual((metrics["bytes_downloaded"], metrics["bytes_from_cache"], metrics["bytes_linked"]),
+                         (self.FETCH, 100, 5000))
+        self.assertEqual(metrics["cache_hit_ratio"], round(100 / 300, 4))
+
+
+if __name__ == "__main__":
+    unittest.main()
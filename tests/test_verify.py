@@ -0,0 +1,28 @@
+import unittest
+
+from dmtest import DMTestCase
+
+
+class VerifyTasksTest(DMTestCase):
+    def setUp(self):
+        super().setUp()
+        dm = self.dm
+        self.build = self.root / "build"
+        self.build.mkdir()
+        for name in ("whole.bin", "partial.bin"):
+            (self.build / name).write_bytes(b"x" * 300)
+        files = [dm.ManifestFile("whole.bin", 300, [], (1, 2, 3), "", dm.HASH_SHA256),
+                 dm.ManifestFile("partial.bin", 300, [], (1, 4, 3), "", dm.HASH_SHA256)]
+        self.manifest = dm.Manifest("1", files, {c: dm.ManifestChunk(c, 1, 0, 50, 100) for c in (1, 2, 3)}, {}, {})
+
+    def test_file_with_unknown_chunk_is_damaged(self):
+        damaged = {}
+        tasks, total = self.dm.verify_tasks(self.manifest, self.manifest.files, self.build, damaged)
+        self.assertEqual(damaged, {"partial.bin": "chunk table incomplete"})
+        self.assertEqual([t[0] for t in tasks], ["whole.bin"])
+        self.assertEqual(tasks[0][3], [(1, 100), (2, 100), (3, 100)])
+        self.assertEqual(total, 300)
+
+
+if __name__ == "__main__":
+    unittest.main()